@@ -0,0 +1,78 @@
+"""
+Benchmark of the batched EasyOCR reads, against reading the captures one by one
+
+Run from the repository root with `python -m benchmarks.easyocr_batch`.
+
+Synthetic captures (numbers drawn with OpenCV) are pre-processed and read
+either one by one (text detection and recognition for each image), or with
+`EasyOcrEngine.ocr_batch` (a single recognition call on a montage of the
+images, without detection). On CPU, EasyOCR recognises the boxes of the montage
+one by one, so the gain only comes from the skipped detection. On GPU, they are
+also recognised as one batch.
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.ocr import EasyOcrEngine
+import cv2
+import numpy as np
+from time import perf_counter
+
+
+def get_captures(count: int) -> list[np.ndarray]:
+    """
+    Returns synthetic captures: random numbers in white on a dark background
+    """
+    rng = np.random.default_rng(0)
+    captures = []
+
+    for _ in range(count):
+        img = np.full((40, 160, 3), 30, np.uint8)
+        text = f"{rng.uniform(-999, 999):.2f}"
+        cv2.putText(img, text, (5, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (230, 230, 230), 2)
+        captures.append(img)
+
+    return captures
+
+
+def measure(function, repeats: int = 5) -> float:
+    """
+    Returns the average running time of a function
+    """
+    function()  # warm up
+    t0 = perf_counter()
+
+    for _ in range(repeats):
+        function()
+
+    return (perf_counter() - t0) / repeats
+
+
+def main():
+    engine = EasyOcrEngine()
+    print(f"EasyOCR device: {engine._reader.device}")
+
+    for count in [1, 4, 8, 16]:
+        imgs = [engine.preprocess(img).copy() for img in get_captures(count)]
+
+        def __one_by_one():
+            return [engine.ocr_with_confidence(img) for img in imgs]
+
+        def __batched():
+            return engine.ocr_batch(imgs)
+
+        dt_one = measure(__one_by_one)
+        dt_batch = measure(__batched)
+        same = sum(a[0] == b[0] for a, b in zip(__one_by_one(), __batched()))
+
+        print(
+            f"{count:>2} captures: {dt_one * 1000:8.1f} ms one by one, "
+            f"{dt_batch * 1000:8.1f} ms batched ({dt_one / dt_batch:4.1f}x), "
+            f"{same}/{count} identical outputs"
+        )
+
+
+if __name__ == "__main__":
+    main()
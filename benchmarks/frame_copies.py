@@ -0,0 +1,73 @@
+"""
+Benchmark of the bytes copied per frame, from the screenshot buffer to the
+first pre-processing step of each capture
+
+Run from the repository root with `python -m benchmarks.frame_copies`.
+
+A synthetic BGRA buffer plays the role of the raw `mss` screenshot. Copies are
+measured with `tracemalloc`, which sees the allocations of NumPy and OpenCV
+arrays (including the implicit copies of OpenCV when given non contiguous
+images). The grey outputs themselves aren't counted as copies.
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.ocr import to_gray
+import cv2
+import numpy as np
+import tracemalloc
+from time import perf_counter
+
+
+def measure(function, output_bytes: int, repeats: int = 20):
+    """
+    Returns the bytes allocated by a function (minus its output) and its
+    average running time
+    """
+    function()  # warm up
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    t0 = perf_counter()
+
+    for _ in range(repeats):
+        function()
+
+    return max(0, peak - output_bytes), (perf_counter() - t0) / repeats
+
+
+def main():
+    height, width = 2160, 3840  # 4K monitor
+    roi_count, roi_height, roi_width = 8, 40, 200
+    raw = bytearray(np.random.randint(0, 256, height * width * 4, np.uint8).tobytes())
+    rois = [(100 * k, 150 * k) for k in range(roi_count)]
+    output_bytes = roi_count * roi_height * roi_width
+
+    def __before():
+        # Previous pipeline: the screenshot is copied to BGR, then OpenCV copies
+        # the strided slices to convert them
+        frame = np.array(np.frombuffer(raw, np.uint8).reshape(height, width, 4))[:, :, :3]
+        return [
+            cv2.cvtColor(frame[x : x + roi_height, y : y + roi_width], cv2.COLOR_BGR2GRAY)
+            for x, y in rois
+        ]
+
+    def __after():
+        # Zero-copy views of the screenshot, converted directly from BGRA
+        frame = np.frombuffer(raw, np.uint8).reshape(height, width, 4)[:, :, :3]
+        return [to_gray(frame[x : x + roi_height, y : y + roi_width]) for x, y in rois]
+
+    for name, function in [("before", __before), ("after", __after)]:
+        copied, dt = measure(function, output_bytes)
+        print(f"{name:>6}: {copied / 1e6:8.3f} MB copied per frame, {dt * 1000:6.2f} ms")
+
+    assert all(np.array_equal(a, b) for a, b in zip(__before(), __after()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Command line entry point, running saved settings on video files or on the live
+screen without any GUI
+
+Progress is reported on the standard output as JSON lines (one object per
+line, with an "event" field), all other logs go to the standard error. The
+exit code is not zero if any input failed.
+
+Examples:
+    python cli.py settings.json video_1.mp4 video_2.mp4 --output-dir results
+    python cli.py settings.json --live 60 --output-dir results
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.ocr import OCR_METHOD_NAMES
+from src.data_recorder import DataRecorder
+from src.video_processor import VideoProcessor
+from src.duplicate_frames import DuplicateFrames
+from src.capture import Captures
+from src.glyphs import get_glyph_set, get_glyph_classifier
+from contextlib import redirect_stdout
+from time import time, sleep
+import argparse
+import json
+import os
+import sys
+
+
+class ProgressReporter:
+    """
+    Writes machine-readable progress events (JSON lines)
+    """
+
+    def __init__(self, stream, interval: float):
+        """
+        Args:
+            - stream:   Where to write the events
+            - interval: Minimum time between two progress events (s)
+        """
+        self._stream = stream
+        self._interval = interval
+        self._last_t = None  # time of the last progress event
+
+    def event(self, event: str, **fields):
+        """
+        Writes an event with the given fields
+        """
+        self._stream.write(json.dumps({"event": event, "time": time(), **fields}) + "\n")
+        self._stream.flush()
+
+    def progress(self, force: bool = False, **fields):
+        """
+        Writes a progress event, unless one was written less than the interval ago
+        """
+        t = time()
+
+        if force or self._last_t is None or t - self._last_t >= self._interval:
+            self._last_t = t
+            self.event("progress", **fields)
+
+
+def load_settings(path: str) -> tuple[Captures, dict]:
+    """
+    Loads the settings saved by the GUI, and returns the configured captures
+    along with the raw settings
+
+    Raises ValueError if the settings can't be used.
+    """
+    with open(path) as file:
+        try:
+            config = json.load(file)
+        except (UnicodeDecodeError, json.decoder.JSONDecodeError) as e:
+            raise ValueError(f"couldn't parse JSON settings: {e}")
+
+    try:
+        captures = Captures()
+        captures.load_config(config["captures"])
+        method = OCR_METHOD_NAMES[config["ocr_method"]]
+    except KeyError as e:
+        raise ValueError(f"missing or invalid setting: {e}")
+
+    if "glyph_set" in config:
+        get_glyph_set().load(os.path.join(os.path.dirname(path), config["glyph_set"]))
+
+    if "glyph_classifier" in config:
+        get_glyph_classifier().load(
+            os.path.join(os.path.dirname(path), config["glyph_classifier"])
+        )
+
+    captures.set_ocr_method(method)
+
+    try:
+        max_threads = int(config.get("max_threads", 1))
+    except ValueError:
+        max_threads = 1
+
+    captures.set_max_threads(max_threads if max_threads > 0 else None)
+    captures.set_use_processes(config.get("backend") == "Processes")
+
+    return captures, config
+
+
+def process_videos(
+    captures: Captures,
+    fps: float,
+    video_paths: list[str],
+    output_dir: str,
+    reporter: ProgressReporter,
+    num_processes: int | None = 1,
+    resume: bool = False,
+    time_range: tuple[float, float | None] = (0.0, None),
+    change_resolution: float | None = None,
+    duplicate_frames: DuplicateFrames = DuplicateFrames.PROCESS,
+) -> int:
+    """
+    Processes video files one after the other, and returns the number of
+    failures
+    """
+    data_recorder = DataRecorder()
+    video_processor = VideoProcessor(data_recorder)
+    video_processor.set_captures(captures)
+    video_processor.set_fps(fps)
+    video_processor.set_num_processes(num_processes)
+    video_processor.set_time_range(*time_range)
+    video_processor.set_change_resolution(change_resolution)
+    video_processor.set_duplicate_frames(duplicate_frames)
+    failures = 0
+
+    for video_path in video_paths:
+        reporter.event("start", input=video_path)
+        t0 = time()
+        sample_count = 0
+
+        def __frame_cb(_, progress):
+            nonlocal sample_count
+            sample_count += 1
+            elapsed = time() - t0
+            reporter.progress(
+                input=video_path,
+                frame=progress[0],
+                frame_count=progress[1],
+                progress=progress[0] / progress[1] if progress[1] > 0 else None,
+                samples=sample_count,
+                samples_per_s=sample_count / elapsed if elapsed > 0 else None,
+            )
+
+        video_processor.set_video_path(video_path)
+
+        if video_processor.get_video_path() is None:
+            reporter.event("error", input=video_path, message="couldn't read video")
+            failures += 1
+            continue
+
+        stem = os.path.splitext(os.path.basename(video_path))[0]
+        data_recorder.reset_fields(captures.get_names())
+        data_recorder.set_output(output_dir, f"{stem}.csv")
+
+        try:
+            csv_path = video_processor.process_video(__frame_cb, resume=resume)
+        except Exception as e:
+            reporter.event("error", input=video_path, message=str(e))
+            failures += 1
+            continue
+
+        if csv_path == "":
+            reporter.event("error", input=video_path, message="couldn't resume")
+            failures += 1
+            continue
+
+        elapsed = time() - t0
+        reporter.event(
+            "done",
+            input=video_path,
+            output=csv_path,
+            samples=sample_count,
+            duration=elapsed,
+            samples_per_s=sample_count / elapsed if elapsed > 0 else None,
+        )
+
+    return failures
+
+
+def process_live(
+    captures: Captures,
+    fps: float,
+    duration: float,
+    output_dir: str,
+    reporter: ProgressReporter,
+) -> int:
+    """
+    Processes the screen for a given duration, and returns the number of
+    failures
+    """
+    from src.capture_pipeline import CapturePipeline
+    from src.screen_grabber import ScreenGrabber
+
+    screen_grabber = ScreenGrabber()
+    data_recorder = DataRecorder()
+    data_recorder.reset_fields(captures.get_names())
+    data_recorder.set_output(output_dir)
+
+    pipeline = CapturePipeline(
+        lambda: screen_grabber.grab_areas(captures.get_grab_areas()),
+        lambda frame, t: captures.update(
+            frame, display=False, t=t, budget=1.0 / pipeline.get_fps()
+        ),
+        start_fn=captures.reset_schedule,
+    )
+    pipeline.set_fps(captures.get_max_sample_rate(fps))
+
+    reporter.event("start", input="screen")
+    t0 = time()
+    sample_count = 0
+    data_recorder.toggle_recording(True)
+    pipeline.start()
+
+    try:
+        while time() - t0 < duration:
+            sleep(0.05)
+
+            for grab_t, _, output in pipeline.poll():
+                data_recorder.record(output, grab_t, time() - grab_t)
+                sample_count += 1
+
+            elapsed = time() - t0
+            reporter.progress(
+                input="screen",
+                progress=min(1.0, elapsed / duration),
+                samples=sample_count,
+                samples_per_s=sample_count / elapsed if elapsed > 0 else None,
+                latency=data_recorder.get_average_latency(),
+                dropped=pipeline.get_drop_rate(),
+            )
+    finally:
+        pipeline.stop()
+        csv_path = data_recorder.toggle_recording(False)
+
+    elapsed = time() - t0
+    reporter.event(
+        "done",
+        input="screen",
+        output=csv_path,
+        samples=sample_count,
+        duration=elapsed,
+        samples_per_s=sample_count / elapsed if elapsed > 0 else None,
+    )
+
+    return 0 if sample_count > 0 else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Runs saved DemOCRatos settings on video files or on the screen"
+    )
+    parser.add_argument("settings", help="JSON settings saved from the GUI")
+    parser.add_argument("videos", nargs="*", help="video files to process")
+    parser.add_argument(
+        "--live",
+        type=float,
+        metavar="SECONDS",
+        help="process the screen for the given duration instead of videos",
+    )
+    parser.add_argument(
+        "--output-dir", default=".", help="directory of the CSV files (default: .)"
+    )
+    parser.add_argument(
+        "--fps", type=float, help="sampling rate, overrides the one of the settings"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        metavar="N",
+        help="split videos in segments processed by N processes (0 for one per "
+        "CPU core, default: 1)",
+    )
+    parser.add_argument(
+        "--start",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="time from which videos are processed (default: 0)",
+    )
+    parser.add_argument(
+        "--end",
+        type=float,
+        metavar="SECONDS",
+        help="time until which videos are processed (default: their end)",
+    )
+    parser.add_argument(
+        "--change-resolution",
+        type=float,
+        metavar="SECONDS",
+        help="sample videos at the FPS, and locate the changes of values in "
+        "between within this resolution (for rarely changing values)",
+    )
+    parser.add_argument(
+        "--duplicate-frames",
+        choices=[policy.name.lower() for policy in DuplicateFrames],
+        default="process",
+        help="for runs of sampled frames whose capture areas are identical, run "
+        "OCR once and record the outputs at each frame (copy) or only at the "
+        "first and last frames of the run (boundaries), default: process all "
+        "frames",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="resume the videos from their checkpoints in the output directory, "
+        "if any",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=1.0,
+        help="minimum time between two progress events (default: 1 s)",
+    )
+    args = parser.parse_args()
+
+    if len(args.videos) == 0 and args.live is None:
+        parser.error("give video files or --live")
+
+    reporter = ProgressReporter(sys.stdout, args.progress_interval)
+
+    # Anything printed by the processing goes to the standard error
+    with redirect_stdout(sys.stderr):
+        try:
+            captures, config = load_settings(args.settings)
+        except (OSError, ValueError) as e:
+            reporter.event("error", input=args.settings, message=str(e))
+            return 1
+
+        fps = args.fps if args.fps is not None else float(config.get("fps", 1.0))
+        os.makedirs(args.output_dir, exist_ok=True)
+
+        try:
+            if args.live is not None:
+                failures = process_live(
+                    captures, fps, args.live, args.output_dir, reporter
+                )
+            else:
+                failures = process_videos(
+                    captures,
+                    fps,
+                    args.videos,
+                    args.output_dir,
+                    reporter,
+                    args.processes if args.processes > 0 else None,
+                    args.resume,
+                    (args.start, args.end),
+                    args.change_resolution,
+                    DuplicateFrames[args.duplicate_frames.upper()],
+                )
+        finally:
+            captures.shutdown()
+
+    return 1 if failures > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,18 +7,25 @@ Year:    2024
 License: Apache 2.0
 """
 
-from src.ocr import BaseOcrEngine, OcrMethod
+from src.ocr import BaseOcrEngine, OCR_METHOD_NAMES
 from src.data_recorder import DataRecorder
 from src.video_processor import VideoProcessor
 from src.capture import Captures
-from src.gui_elements import Entry, RectangleSelectionWindow
+from src.gui_elements import CapturePreview, Entry, RectangleSelectionWindow
+from src.glyphs import get_glyph_set, get_glyph_classifier
+from src.capture_pipeline import CapturePipeline, QueuePolicy
+from src.grab_planner import GrabMode
+from src.screen_grabber import ScreenGrabber
 import customtkinter as ctk
 import tkinter as tk
-import mss
-from PIL import ImageGrab, ImageTk
+from PIL import ImageTk
 import numpy as np
 import json
+import os
+import queue
+import threading
 from enum import Enum
+from contextlib import contextmanager
 from copy import deepcopy
 from time import time
 from typing import Callable, Type
@@ -73,12 +80,12 @@ class App(ctk.CTk):
         self._output_frame.grid(padx=(self._pad, self._pad), pady=(0, self._pad))
 
         # Create captures
-        self._captures = Captures(self._output_frame)
+        self._captures = Captures(self._create_capture_preview)
         self._selected_capture = self._captures.get_first()  # its config is displayed
 
-        self._captures.update_layout()
+        self._update_output_layout()
         self._selected_capture.set_area(0, 0, 30, 100)
-        self._sct = mss.mss()  # used to capture the screen
+        self._screen_grabber = ScreenGrabber()  # used to capture the screen
 
         self._data_recorder = DataRecorder()
         self._data_recorder.add_field(self._selected_capture.name)
@@ -100,16 +107,31 @@ class App(ctk.CTk):
         self._fps_settings_menu.set("10")
         self._ocr_settings_menu.set("Tesseract")
         self._max_threads_entry.set_value(1)
+        self._backend_menu.set("Threads")
+        self._queue_policy_menu.set("Drop oldest")
+        self._grab_mode_menu.set("Clustered areas")
 
         self._update_capture_options()
-        self._captures.update_layout()
+        self._update_output_layout()
 
         self._input_mode = InputMode.SCREEN
         self._processing_video = False  # whether currently processing a video
+        self._video_events = queue.Queue()  # progress and end of the video processing
+        self._last_video_event_t = 0.0  # time of the last progress event
 
         # Configure callbacks
         self._fps = 10.0
-        self.after(int(1000.0 / self._fps), self._main_loop)
+        self._gui_period = 0.05  # time between two refreshes of the displayed outputs (s)
+        self._pipeline = CapturePipeline(
+            self._grab_frame,
+            lambda frame, t: self._captures.update(
+                frame, display=False, t=t, budget=1.0 / self._pipeline.get_fps()
+            ),
+            start_fn=lambda: self._captures.reset_schedule(),
+        )
+        self._pipeline.set_fps(self._fps)
+        self._pipeline.start()
+        self.after(int(1000.0 * self._gui_period), self._main_loop)
 
     def _on_closing_cb(self):
         """
@@ -118,6 +140,7 @@ class App(ctk.CTk):
         if tk.messagebox.askokcancel("Quit", "Do you want to quit?"):
             self._data_recorder.toggle_recording(False)
             self._video_processor.stop_processing()
+            self._pipeline.stop()
             sys.exit()
 
     def _create_header_frame(self):
@@ -184,38 +207,53 @@ class App(ctk.CTk):
             self._video_processor.set_video_path(path)
 
         def __processed_frame_cb(output, progress):
-            output_str = f"[{int(progress[0] / progress[1] * 100)} %][{progress[0]}/{progress[1]}] {output}"
+            # Called from the processing thread: the progress is handed over to
+            # the GUI thread, at most once per GUI period
+            t = time()
 
-            self._output_tbox.configure(state="normal")
-            self._output_tbox.insert("0.0", output_str + "\n")
-            self._output_tbox.configure(state="disabled")
-            self.update()
+            if t - self._last_video_event_t >= self._gui_period:
+                self._last_video_event_t = t
+                self._video_events.put(("progress", output, progress))
+
+        def __process_video(resume: bool):
+            file_path = ""
 
-        def __process_video_cb():
+            try:
+                file_path = self._video_processor.process_video(
+                    __processed_frame_cb, display=False, resume=resume
+                )
+            except Exception as e:
+                print(f"[GUI] ERROR: video processing failed: {e}")
+            finally:
+                self._video_events.put(("done", file_path, None))
+
+        def __process_video_cb(resume: bool = False):
             if self._processing_video:
                 return
 
             self._processing_video = True
+            self._pipeline.pause()
+            self._toggle_settings(False)
             self._options_frame.set("Output")
             self._process_video_btn.configure(state="disabled")
+            self._resume_video_btn.configure(state="disabled")
             self._stop_processing_video_btn.configure(state="normal")
             self._video_processor.set_captures(self._captures)
             self._video_processor.set_fps(self._fps)
 
-            file_path = self._video_processor.process_video(__processed_frame_cb)
-
-            self._processing_video = False
-            self._process_video_btn.configure(state="normal")
-            self._stop_processing_video_btn.configure(state="disabled")
+            if self._captures.get_use_processes():
+                self._video_processor.set_num_processes(self._captures.get_max_threads())
+            else:
+                self._video_processor.set_num_processes(1)
 
-            self._output_tbox.configure(state="normal")
-            output_str = f"[Recorder] Saved data at {file_path}"
-            self._output_tbox.insert("0.0", output_str + "\n")
-            self._output_tbox.configure(state="disabled")
+            threading.Thread(
+                target=__process_video,
+                args=(resume,),
+                name="video_processing",
+                daemon=True,
+            ).start()
 
         def __stop_processing_video_cb():
-            self._processing_video = False
-            self._process_video_btn.configure(state="normal")
             self._stop_processing_video_btn.configure(state="disabled")
             self._video_processor.stop_processing()
 
@@ -231,6 +269,12 @@ class App(ctk.CTk):
             text="Process video",
             command=__process_video_cb,
         )
+        self._resume_video_btn = ctk.CTkButton(
+            master=self._header_video_view,
+            height=40,
+            text="Resume",
+            command=lambda: __process_video_cb(resume=True),
+        )
         self._stop_processing_video_btn = ctk.CTkButton(
             master=self._header_video_view,
             height=40,
@@ -241,10 +285,12 @@ class App(ctk.CTk):
 
         self._open_file_btn.grid(row=0, column=0)
         self._process_video_btn.grid(row=0, column=1)
-        self._stop_processing_video_btn.grid(row=0, column=2)
+        self._resume_video_btn.grid(row=0, column=2)
+        self._stop_processing_video_btn.grid(row=0, column=3)
 
         self._open_file_btn.grid(padx=(self._pad, 0), pady=(self._pad, self._pad))
         self._process_video_btn.grid(padx=(self._pad, 0), pady=(self._pad, self._pad))
+        self._resume_video_btn.grid(padx=(self._pad, 0), pady=(self._pad, self._pad))
         self._stop_processing_video_btn.grid(padx=(self._pad, 0), pady=(self._pad, self._pad))
 
     def _create_load_settings_frame(self):
@@ -272,21 +318,53 @@ class App(ctk.CTk):
                     return
 
             try:
-                new_captures = Captures(self._output_frame)
+                new_captures = Captures(self._create_capture_preview)
                 new_captures.load_config(config["captures"])
                 self._fps_settings_menu.set(config["fps"])
                 self._ocr_settings_menu.set(config["ocr_method"])
                 self._max_threads_entry.set_value(config["max_threads"])
+
+                if "backend" in config:
+                    self._backend_menu.set(config["backend"])
+                    new_captures.set_use_processes(config["backend"] == "Processes")
+
+                if "grab_mode" in config:
+                    self._grab_mode_menu.set(config["grab_mode"])
+                    self._screen_grabber.mode = (
+                        GrabMode.UNION
+                        if config["grab_mode"] == "Areas union"
+                        else GrabMode.CLUSTERS
+                    )
+
+                if "queue_policy" in config:
+                    self._queue_policy_menu.set(config["queue_policy"])
+                    self._pipeline.set_policy(
+                        QueuePolicy.BLOCK
+                        if config["queue_policy"] == "Block"
+                        else QueuePolicy.DROP_OLDEST
+                    )
             except KeyError as e:
                 print("ERROR: couldn't parse JSON config")
                 print(e)
                 return
 
-            self._captures = new_captures
+            if "glyph_set" in config:
+                glyph_path = os.path.join(os.path.dirname(path), config["glyph_set"])
+                get_glyph_set().load(glyph_path)
+
+            if "glyph_classifier" in config:
+                classifier_path = os.path.join(
+                    os.path.dirname(path), config["glyph_classifier"]
+                )
+                get_glyph_classifier().load(classifier_path)
+
+            with self._paused_pipeline():
+                self._captures.shutdown()
+                self._captures = new_captures
             self._data_recorder.reset_fields(self._captures.get_names())
             self._selected_capture = self._captures.get_first()
             self._update_capture_options()
-            self._captures.update_layout()
+            self._update_output_layout()
 
         def __save_settings_cb():
             tk.Tk().withdraw()  # keep the root window from appearing
@@ -304,6 +382,20 @@ class App(ctk.CTk):
                 config["fps"] = self._fps_settings_menu.get()
                 config["ocr_method"] = self._ocr_settings_menu.get()
                 config["max_threads"] = self._max_threads_entry.get_value()
+                config["backend"] = self._backend_menu.get()
+                config["queue_policy"] = self._queue_policy_menu.get()
+                config["grab_mode"] = self._grab_mode_menu.get()
+
+                if not get_glyph_set().is_empty():
+                    glyph_path = os.path.splitext(path)[0] + "_glyphs.npz"
+                    get_glyph_set().save(glyph_path)
+                    config["glyph_set"] = os.path.basename(glyph_path)
+
+                if not get_glyph_classifier().is_empty():
+                    classifier_path = os.path.splitext(path)[0] + "_classifier.npz"
+                    get_glyph_classifier().save(classifier_path)
+                    config["glyph_classifier"] = os.path.basename(classifier_path)
+
                 json.dump(config, file)
 
             print(config)
@@ -351,17 +443,24 @@ class App(ctk.CTk):
 
         # Menu and add/delete buttons row
         def __add_capture():
-            self._selected_capture = self._captures.add_capture()
+            with self._paused_pipeline():
+                self._selected_capture = self._captures.add_capture()
+
             self._data_recorder.add_field(self._selected_capture.name)
             self._update_capture_options()
-            self._captures.update_layout()
+            self._update_output_layout()
 
         def __rename_capture():
             old_name = self._selected_capture.name
             dialog = ctk.CTkInputDialog(text="New capture name:", title="Renaming")
             name = dialog.get_input()
 
-            if name is not None and self._captures.rename(self._selected_capture, name):
+            with self._paused_pipeline():
+                is_renamed = name is not None and self._captures.rename(
+                    self._selected_capture, name
+                )
+
+            if is_renamed:
                 self._data_recorder.rename_field(old_name, name)
                 self._update_capture_options()
             else:
@@ -369,13 +468,16 @@ class App(ctk.CTk):
 
         def __remove_capture():
             self._data_recorder.delete_field(self._selected_capture.name)
-            self._captures.remove_capture(self._selected_capture.name)
+
+            with self._paused_pipeline():
+                self._captures.remove_capture(self._selected_capture.name)
+
             self._selected_capture = self._captures.get_first()
             self._data_recorder.add_field(
                 self._selected_capture.name
             )  # in case a new one was created
             self._update_capture_options()
-            self._captures.update_layout()
+            self._update_output_layout()
 
         self._captures_menu = ctk.CTkOptionMenu(
             self._captures_view,
@@ -398,8 +500,11 @@ class App(ctk.CTk):
 
         # Rectangle settings row
         def __update_rect_area(*_):
+            if not self._can_edit_settings():
+                return
+
             try:
-                self._selected_capture.set_area(
+                area = (
                     int(self._rect_xmin_entry.get_value()),
                     int(self._rect_ymin_entry.get_value()),
                     int(self._rect_xmax_entry.get_value()),
@@ -408,8 +513,16 @@ class App(ctk.CTk):
             except ValueError:
                 return
 
+            with self._paused_pipeline():
+                self._selected_capture.set_area(*area)
+
         def __select_react_area_cb(xmin: int, ymin: int, xmax: int, ymax: int):
-            self._selected_capture.set_area(xmin, ymin, xmax, ymax)
+            if not self._can_edit_settings():
+                return
+
+            with self._paused_pipeline():
+                self._selected_capture.set_area(xmin, ymin, xmax, ymax)
+
             self._update_capture_options()
 
         def __select_rect_area():
@@ -418,7 +531,14 @@ class App(ctk.CTk):
                 or not self._rect_selec_window.winfo_exists()
             ):
                 if self._input_mode == InputMode.SCREEN:
-                    screen_img = ImageGrab.grab()
+                    screen_grabber = ScreenGrabber()
+                    screen_img = screen_grabber.grab(self._selected_capture.monitor)
+                    screen_grabber.close()
+
+                    if screen_img is None:
+                        return
+
+                    screen_img = screen_img[:, :, ::-1]  # BGR to RGB
                 else:
                     screen_img = self._video_processor.get_preview_frame()
 
@@ -433,11 +553,24 @@ class App(ctk.CTk):
             else:
                 self._rect_selec_window.focus()  # if window exists focus it
 
+        def __set_monitor_cb(*_):
+            if not self._can_edit_settings():
+                return
+
+            try:
+                self._selected_capture.monitor = int(self._monitor_entry.get_value())
+            except ValueError:
+                return
+
         self._rect_txt = ctk.CTkLabel(self._captures_view, text="Area")
         self._rect_select_frame = ctk.CTkFrame(self._captures_view)
         self._rect_select_btn = ctk.CTkButton(
             self._captures_view, text="Select", width=80, command=__select_rect_area
         )
+        self._monitor_txt = ctk.CTkLabel(self._captures_view, text="Monitor")
+        self._monitor_entry = Entry(
+            self._captures_view, width=50, command=__set_monitor_cb
+        )
 
         self._rect_xmin_entry = Entry(
             master=self._rect_select_frame, width=50, command=__update_rect_area
@@ -459,6 +592,8 @@ class App(ctk.CTk):
         self._rect_txt.grid(row=1, column=0)
         self._rect_select_frame.grid(row=1, column=1)
         self._rect_select_btn.grid(row=1, column=2)
+        self._monitor_txt.grid(row=1, column=3)
+        self._monitor_entry.grid(row=1, column=4, sticky="w")
 
         self._rect_xmin_entry.grid(row=1, column=0)
         self._rect_ymin_entry.grid(row=1, column=1)
@@ -472,6 +607,8 @@ class App(ctk.CTk):
         self._rect_txt.grid(padx=(self._pad, 0), pady=(self._pad, 0))
         self._rect_select_frame.grid(padx=(self._pad, 0), pady=(self._pad, 0))
         self._rect_select_btn.grid(padx=(self._pad, 0), pady=(self._pad, 0))
+        self._monitor_txt.grid(padx=(self._pad, 0), pady=(self._pad, 0))
+        self._monitor_entry.grid(padx=(self._pad, 0), pady=(self._pad, 0))
 
         self._rect_xmin_entry.grid(padx=(self._pad, 0), pady=(0, 0))
         self._rect_ymin_entry.grid(padx=(self._pad, 0), pady=(0, 0))
@@ -480,6 +617,9 @@ class App(ctk.CTk):
 
         # Min/max row
         def __set_min_max_values_cb(*_):
+            if not self._can_edit_settings():
+                return
+
             min_value = self._min_entry.get_value()
             max_value = self._max_entry.get_value()
 
@@ -499,7 +639,19 @@ class App(ctk.CTk):
                 except ValueError:
                     return
 
-            self._selected_capture.set_min_max_values(min_value, max_value)
+            with self._paused_pipeline():
+                self._selected_capture.set_min_max_values(min_value, max_value)
+
+        def __set_change_threshold_cb(*_):
+            if not self._can_edit_settings():
+                return
+
+            try:
+                value = float(self._change_threshold_entry.get_value())
+            except ValueError:
+                return
+
+            self._selected_capture.change_threshold = value
 
         self._min_max_frame = ctk.CTkFrame(self._captures_view)
         self._min_label = ctk.CTkLabel(self._min_max_frame, text="Min")
@@ -510,41 +662,129 @@ class App(ctk.CTk):
         self._max_entry = Entry(
             self._min_max_frame, width=100, command=__set_min_max_values_cb
         )
+        self._change_threshold_label = ctk.CTkLabel(
+            self._min_max_frame, text="Change threshold"
+        )
+        self._change_threshold_entry = Entry(
+            self._min_max_frame, width=50, command=__set_change_threshold_cb
+        )
 
         self._min_max_frame.grid(row=2, column=0, columnspan=2, sticky="w")
         self._min_label.grid(row=0, column=0)
         self._min_entry.grid(row=0, column=1)
         self._max_label.grid(row=0, column=2)
         self._max_entry.grid(row=0, column=3)
+        self._change_threshold_label.grid(row=0, column=4)
+        self._change_threshold_entry.grid(row=0, column=5)
 
         self._min_max_frame.grid(padx=(0, 0), pady=(self._pad, 0))
+
+        # Sampling row
+        def __set_sample_rate_cb(*_):
+            if not self._can_edit_settings():
+                return
+
+            value = self._sample_rate_entry.get_value()
+
+            if value == "":
+                self._selected_capture.sample_rate = None
+                return
+
+            try:
+                value = float(value)
+            except ValueError:
+                return
+
+            self._selected_capture.sample_rate = value if value > 0 else None
+
+        def __set_priority_cb(*_):
+            if not self._can_edit_settings():
+                return
+
+            try:
+                self._selected_capture.priority = int(self._priority_entry.get_value())
+            except ValueError:
+                return
+
+        self._sampling_frame = ctk.CTkFrame(self._captures_view)
+        self._sample_rate_label = ctk.CTkLabel(
+            self._sampling_frame, text="Sample rate (empty for every frame)"
+        )
+        self._sample_rate_entry = Entry(
+            self._sampling_frame, width=50, command=__set_sample_rate_cb
+        )
+        self._priority_label = ctk.CTkLabel(self._sampling_frame, text="Priority")
+        self._priority_entry = Entry(
+            self._sampling_frame, width=50, command=__set_priority_cb
+        )
+
+        self._sampling_frame.grid(row=3, column=0, columnspan=4, sticky="w")
+        self._sample_rate_label.grid(row=0, column=0)
+        self._sample_rate_entry.grid(row=0, column=1)
+        self._priority_label.grid(row=0, column=2)
+        self._priority_entry.grid(row=0, column=3)
+
+        self._sampling_frame.grid(padx=(0, 0), pady=(self._pad, 0))
+        self._sample_rate_label.grid(padx=(self._pad, 0), pady=(0, 0))
+        self._sample_rate_entry.grid(padx=(self._pad, 0), pady=(0, 0))
+        self._priority_label.grid(padx=(2 * self._pad, 0), pady=(0, 0))
+        self._priority_entry.grid(padx=(self._pad, 0), pady=(0, 0))
         self._min_label.grid(padx=(self._pad, 0), pady=(0, 0))
         self._min_entry.grid(padx=(self._pad, 0), pady=(0, 0))
         self._max_label.grid(padx=(2 * self._pad, 0), pady=(0, 0))
         self._max_entry.grid(padx=(self._pad, 0), pady=(0, 0))
+        self._change_threshold_label.grid(padx=(2 * self._pad, 0), pady=(0, 0))
+        self._change_threshold_entry.grid(padx=(self._pad, 0), pady=(0, 0))
 
         # Pre processing configuration
         self._pre_process_config_frame = PreProcessingConfigFrame(
             self._pad, self._captures_view
         )
-        self._pre_process_config_frame.grid(row=3, column=0, columnspan=4, sticky="we")
+        self._pre_process_config_frame.grid(row=4, column=0, columnspan=4, sticky="we")
         self._pre_process_config_frame.grid(padx=(0, 0), pady=(self._pad, 0))
 
         def __pre_process_config_cb(config: BaseOcrEngine.PreProcessConfig):
-            self._selected_capture.set_pre_process_config(config)
+            if not self._can_edit_settings():
+                return
+
+            with self._paused_pipeline():
+                self._selected_capture.set_pre_process_config(config)
 
         self._pre_process_config_frame.attach_update_cb(__pre_process_config_cb)
 
         # Show options row
         def __enable_capture_cb():
+            if not self._can_edit_settings():
+                return
+
             enabled = bool(self._enable_output_cbox.get())
             self._selected_capture.is_enabled = enabled
-            self._captures.update_layout()
+            self._update_output_layout()
 
         def __enable_preview_cb():
             enabled = bool(self._show_preview_cbox.get())
             self._selected_capture.show_preview = enabled
-            self._captures.update_layout()
+            self._update_output_layout()
+
+        def __learn_glyphs_cb():
+            processed_img = self._selected_capture.get_last_processed_img()
+
+            if processed_img is None:
+                print("No processed image available for this capture")
+                return
+
+            dialog = ctk.CTkInputDialog(
+                text="Text currently displayed in the capture:", title="Learning glyphs"
+            )
+            text = dialog.get_input()
+
+            if text is None:
+                return
+
+            if get_glyph_set().add_sample(processed_img, text):
+                print(f"[GlyphSet] Learnt glyphs of '{text}'")
+
+            get_glyph_classifier().add_sample(processed_img, text)
 
         self._show_capture_frame = ctk.CTkFrame(self._captures_view)
         self._enable_output_cbox = ctk.CTkCheckBox(
@@ -553,14 +793,19 @@ class App(ctk.CTk):
         self._show_preview_cbox = ctk.CTkCheckBox(
             self._show_capture_frame, text="Show preview", command=__enable_preview_cb
         )
+        self._learn_glyphs_btn = ctk.CTkButton(
+            self._show_capture_frame, text="Learn glyphs", width=80, command=__learn_glyphs_cb
+        )
 
-        self._show_capture_frame.grid(row=4, column=0, columnspan=4)
+        self._show_capture_frame.grid(row=5, column=0, columnspan=4)
         self._enable_output_cbox.grid(row=0, column=0)
         self._show_preview_cbox.grid(row=0, column=1)
+        self._learn_glyphs_btn.grid(row=0, column=2)
 
         self._show_capture_frame.grid(padx=(0, 0), pady=(2 * self._pad, 0))
         self._enable_output_cbox.grid(padx=(self._pad, self._pad), pady=(0, 0))
         self._show_preview_cbox.grid(padx=(self._pad, self._pad), pady=(0, 0))
+        self._learn_glyphs_btn.grid(padx=(self._pad, self._pad), pady=(0, 0))
 
     def _create_output_view(self):
         """
@@ -577,14 +822,32 @@ class App(ctk.CTk):
 
         def __update_fps(fps: str):
             self._fps = float(fps)
+            self._pipeline.set_fps(self._fps)
 
         def __update_ocr(ocr: str):
-            if ocr == "Tesseract":
-                self._captures.set_ocr_method(OcrMethod.TESSERACT)
-            elif ocr == "EasyOcr":
-                self._captures.set_ocr_method(OcrMethod.EASY_OCR)
+            with self._paused_pipeline():
+                self._captures.set_ocr_method(OCR_METHOD_NAMES[ocr])
+
+        def __update_backend(backend: str):
+            with self._paused_pipeline():
+                self._captures.set_use_processes(backend == "Processes")
+
+        def __update_grab_mode(mode: str):
+            if mode == "Areas union":
+                self._screen_grabber.mode = GrabMode.UNION
+            else:
+                self._screen_grabber.mode = GrabMode.CLUSTERS
+
+        def __update_queue_policy(policy: str):
+            if policy == "Block":
+                self._pipeline.set_policy(QueuePolicy.BLOCK)
+            else:
+                self._pipeline.set_policy(QueuePolicy.DROP_OLDEST)
 
         def __set_max_threads(*_):
+            if not self._can_edit_settings():
+                return
+
             value = self._max_threads_entry.get_value()
 
             try:
@@ -593,7 +856,9 @@ class App(ctk.CTk):
                 return
 
             value = value if value > 0 else None
-            self._captures.set_max_threads(value)
+
+            with self._paused_pipeline():
+                self._captures.set_max_threads(value)
 
         self._fps_settings_txt = ctk.CTkLabel(self._settings_view, text="FPS")
         self._fps_settings_menu = ctk.CTkOptionMenu(
@@ -603,12 +868,32 @@ class App(ctk.CTk):
         )
         self._ocr_settings_txt = ctk.CTkLabel(self._settings_view, text="OCR method")
         self._ocr_settings_menu = ctk.CTkOptionMenu(
-            self._settings_view, values=["Tesseract", "EasyOcr"], command=__update_ocr
+            self._settings_view,
+            values=list(OCR_METHOD_NAMES),
+            command=__update_ocr,
         )
         self._max_threads_txt = ctk.CTkLabel(
             self._settings_view, text="Max threads (0 for no limit)"
         )
         self._max_threads_entry = Entry(self._settings_view, command=__set_max_threads)
+        self._backend_txt = ctk.CTkLabel(self._settings_view, text="OCR backend")
+        self._backend_menu = ctk.CTkOptionMenu(
+            self._settings_view, values=["Threads", "Processes"], command=__update_backend
+        )
+        self._grab_mode_txt = ctk.CTkLabel(self._settings_view, text="Screen grab")
+        self._grab_mode_menu = ctk.CTkOptionMenu(
+            self._settings_view,
+            values=["Clustered areas", "Areas union"],
+            command=__update_grab_mode,
+        )
+        self._queue_policy_txt = ctk.CTkLabel(
+            self._settings_view, text="When OCR is late"
+        )
+        self._queue_policy_menu = ctk.CTkOptionMenu(
+            self._settings_view,
+            values=["Drop oldest", "Block"],
+            command=__update_queue_policy,
+        )
         self._appearance_txt = ctk.CTkLabel(self._settings_view, text="Appearance")
         self._appearance_menu = ctk.CTkOptionMenu(
             self._settings_view,
@@ -622,8 +907,14 @@ class App(ctk.CTk):
         self._ocr_settings_menu.grid(row=1, column=1)
         self._max_threads_txt.grid(row=2, column=0)
         self._max_threads_entry.grid(row=2, column=1)
-        self._appearance_txt.grid(row=3, column=0)
-        self._appearance_menu.grid(row=3, column=1)
+        self._backend_txt.grid(row=3, column=0)
+        self._backend_menu.grid(row=3, column=1)
+        self._queue_policy_txt.grid(row=4, column=0)
+        self._queue_policy_menu.grid(row=4, column=1)
+        self._grab_mode_txt.grid(row=5, column=0)
+        self._grab_mode_menu.grid(row=5, column=1)
+        self._appearance_txt.grid(row=6, column=0)
+        self._appearance_menu.grid(row=6, column=1)
 
         self._fps_settings_txt.grid(padx=(self._pad, 0), pady=(self._pad, 0))
         self._fps_settings_menu.grid(padx=(self._pad, 0), pady=(self._pad, 0))
@@ -631,6 +922,12 @@ class App(ctk.CTk):
         self._ocr_settings_menu.grid(padx=(self._pad, 0), pady=(self._pad, 0))
         self._max_threads_txt.grid(padx=(self._pad, 0), pady=(self._pad, 0))
         self._max_threads_entry.grid(padx=(self._pad, 0), pady=(self._pad, 0))
+        self._backend_txt.grid(padx=(self._pad, 0), pady=(self._pad, 0))
+        self._backend_menu.grid(padx=(self._pad, 0), pady=(self._pad, 0))
+        self._queue_policy_txt.grid(padx=(self._pad, 0), pady=(self._pad, 0))
+        self._queue_policy_menu.grid(padx=(self._pad, 0), pady=(self._pad, 0))
+        self._grab_mode_txt.grid(padx=(self._pad, 0), pady=(self._pad, 0))
+        self._grab_mode_menu.grid(padx=(self._pad, 0), pady=(self._pad, 0))
         self._appearance_txt.grid(padx=(self._pad, 0), pady=(self._pad, 0))
         self._appearance_menu.grid(padx=(self._pad, 0), pady=(self._pad, 0))
 
@@ -642,70 +939,161 @@ class App(ctk.CTk):
         self._logs_tbox.grid(row=0, column=0, sticky="nesw")
         self._logs_view.grid_columnconfigure(0, weight=1)
 
-    def _main_loop(self):
+    def _can_edit_settings(self) -> bool:
+        """
+        Returns whether the captures and settings can be changed, which isn't
+        the case while a video is processed (the processing thread uses them)
+        """
+        if self._processing_video:
+            print("[GUI] The settings can't be changed while a video is processed")
+            return False
+
+        return True
+
+    def _toggle_settings(self, enabled: bool):
+        """
+        Enables or disables the controls changing the video, the captures and
+        the OCR settings, and shows the actual settings when enabled again
+        """
+        state = "normal" if enabled else "disabled"
+
+        for widget in [
+            self._open_file_btn,
+            self._load_settings_btn,
+            self._capture_add_btn,
+            self._capture_rename_btn,
+            self._capture_remove_btn,
+            self._rect_select_btn,
+            self._ocr_settings_menu,
+            self._backend_menu,
+        ]:
+            widget.configure(state=state)
+
+        if enabled:
+            self._update_capture_options()
+
+    @contextmanager
+    def _paused_pipeline(self):
         """
-        Periodically runs OCR and updates graphs and display
+        Pauses the capture pipeline while the captures are edited, so that the
+        OCR thread doesn't use them in the meantime
         """
-        t0 = time()
+        self._pipeline.pause()
 
-        def __schedule_next_loop():
-            next_wait_time = int(1000.0 / self._fps - (time() - t0) * 1000)
-            next_wait_time = max(10, next_wait_time)  # minimum interface refresh time
-            self.after(next_wait_time, self._main_loop)
+        try:
+            yield
+        finally:
+            self._pipeline.resume()
 
+    def _grab_frame(self) -> np.ndarray | None:
+        """
+        Returns the frame to process (called from the grabber thread), or None
+        if there is nothing to process
+        """
         if self._processing_video:
-            __schedule_next_loop()
-            return
+            return None
 
-        # Capture the screen
         if self._input_mode == InputMode.SCREEN:
-            monitor = self._sct.monitors[1]
-            try:
-                screen_img = self._sct.grab(
-                    (
-                        monitor["left"],
-                        monitor["top"],
-                        monitor["left"] + monitor["width"],
-                        monitor["top"] + monitor["height"],
-                    )
-                )
-            except mss.exception.ScreenShotError:
-                __schedule_next_loop()
-                return
-
-            screen_img = np.array(screen_img)[:, :, :3]
+            return self._screen_grabber.grab_areas(self._captures.get_grab_areas())
         else:
-            screen_img = self._video_processor.get_preview_frame()
+            return self._video_processor.get_preview_frame()
 
-            if screen_img is None:
-                __schedule_next_loop()
-                return
+    def _main_loop(self):
+        """
+        Periodically records and displays the outputs of the capture pipeline,
+        and updates graphs and display
+        """
+        self.after(int(1000.0 * self._gui_period), self._main_loop)
+
+        if self._processing_video:
+            self._poll_video_events()
+            return
 
-        # Run OCR on all active captures and update displayed output
-        output = self._captures.update(screen_img)
-        self._data_recorder.record(output)
+        # Grab as often as the fastest capture needs
+        self._pipeline.set_fps(self._captures.get_max_sample_rate(self._fps))
 
-        if (
-            self._input_mode == InputMode.SCREEN
-            and self._data_recorder.get_is_recording()
-        ):
-            self._output_tbox.configure(state="normal")
-            self._output_tbox.insert("0.0", str(output) + "\n")
-            self._output_tbox.configure(state="disabled")
+        results = self._pipeline.poll()
+
+        if len(results) == 0:
+            return
+
+        # Record all the new samples, with their capture time and latency
+        for grab_t, _, output in results:
+            self._data_recorder.record(output, grab_t, time() - grab_t)
+
+            if (
+                self._input_mode == InputMode.SCREEN
+                and self._data_recorder.get_is_recording()
+            ):
+                self._output_tbox.configure(state="normal")
+                self._output_tbox.insert("0.0", str(output) + "\n")
+                self._output_tbox.configure(state="disabled")
+
+        # Display the latest output of each capture
+        latest_outputs = {}
+
+        for _, _, output in results:
+            latest_outputs.update(output)
+
+        self._captures.display(latest_outputs)
 
         # Update status text
         fps = self._data_recorder.get_average_fps()
+        latency = self._data_recorder.get_average_latency() or 0.0
+        rate_str = f"{fps:.1f} fps, {int(latency * 1000)} ms"
 
         if self._data_recorder.get_is_recording():
             record_t = self._data_recorder.get_recording_time()
             self._status_txt.configure(
-                text=f"{int(record_t // 60):02d}:{int(record_t % 60):02d} ({fps:.1f} fps)"
+                text=f"{int(record_t // 60):02d}:{int(record_t % 60):02d} ({rate_str})"
             )
         else:
-            self._status_txt.configure(text=f"--:-- ({fps:.1f} fps)")
+            self._status_txt.configure(text=f"--:-- ({rate_str})")
+
+    def _poll_video_events(self):
+        """
+        Displays the progress of the video processing, handed over by the
+        processing thread, and restores the GUI once it is done
+        """
+        progress_event = None
+        done_event = None
+
+        while done_event is None:
+            try:
+                event = self._video_events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event[0] == "progress":
+                progress_event = event
+            else:
+                done_event = event
+
+        if progress_event is not None:
+            _, output, progress = progress_event
+            output_str = f"[{int(progress[0] / progress[1] * 100)} %][{progress[0]}/{progress[1]}] {output}"
+
+            self._output_tbox.configure(state="normal")
+            self._output_tbox.insert("0.0", output_str + "\n")
+            self._output_tbox.configure(state="disabled")
+            self._captures.display(output)
+
+        if done_event is not None:
+            self._processing_video = False
+            self._pipeline.resume()
+            self._toggle_settings(True)
+            self._process_video_btn.configure(state="normal")
+            self._resume_video_btn.configure(state="normal")
+            self._stop_processing_video_btn.configure(state="disabled")
 
-        # Schedule the next loop iteration
-        __schedule_next_loop()
+            if done_event[1] != "":
+                message = f"[Recorder] Saved data at {done_event[1]}"
+            else:
+                message = "[Recorder] ERROR: no data saved, see the console for details"
+
+            self._output_tbox.configure(state="normal")
+            self._output_tbox.insert("0.0", message + "\n")
+            self._output_tbox.configure(state="disabled")
 
     def _create_output_frame(self):
         """
@@ -713,6 +1101,22 @@ class App(ctk.CTk):
         """
         self._output_frame = ctk.CTkFrame(self, corner_radius=10)
 
+    def _create_capture_preview(self, _) -> CapturePreview:
+        """
+        Creates the widgets displaying the outputs of a new capture
+        """
+        return CapturePreview(self._output_frame)
+
+    def _update_output_layout(self):
+        """
+        Updates the tk layout to display all enabled outputs
+        """
+        for slave in self._output_frame.grid_slaves():
+            slave.grid_forget()
+
+        for k, capture in enumerate(self._captures.get_displayed()):
+            capture.get_preview().display(k)
+
     def _set_padding(self, frame: ctk.CTkBaseClass, padding: int):
         """
         Sets the padding for all children elements of the given frame
@@ -747,6 +1151,12 @@ class App(ctk.CTk):
         __update_entry_text(self._rect_ymax_entry, self._selected_capture.y_max)
         __update_entry_text(self._min_entry, self._selected_capture.min_value)
         __update_entry_text(self._max_entry, self._selected_capture.max_value)
+        __update_entry_text(
+            self._change_threshold_entry, self._selected_capture.change_threshold
+        )
+        __update_entry_text(self._monitor_entry, self._selected_capture.monitor)
+        __update_entry_text(self._sample_rate_entry, self._selected_capture.sample_rate)
+        __update_entry_text(self._priority_entry, self._selected_capture.priority)
         self._selected_capture.toggle_edit(True)
 
         self._pre_process_config_frame.update_elements(
@@ -806,6 +1216,9 @@ class PreProcessingConfigFrame(ctk.CTkFrame):
         self._invert_img_entry = ctk.CTkCheckBox(
             self._pre_process_frame, text="Invert image", command=self._input_cb
         )
+        self._fast_mode_entry = ctk.CTkCheckBox(
+            self._pre_process_frame, text="Fast mode", command=self._input_cb
+        )
 
         # Placing elements in the frame
         self._pre_process_frame.grid(row=0, column=0, columnspan=4, sticky="we")
@@ -819,6 +1232,7 @@ class PreProcessingConfigFrame(ctk.CTkFrame):
         self._unsharp_amount_label.grid(row=1, column=4)
         self._unsharp_amount_entry.grid(row=1, column=5)
         self._invert_img_entry.grid(row=2, column=0)
+        self._fast_mode_entry.grid(row=2, column=1)
 
         # Settings margin and padding
         self._pre_process_frame.grid(padx=(0, 0), pady=(self._pad, 0))
@@ -833,6 +1247,9 @@ class PreProcessingConfigFrame(ctk.CTkFrame):
         self._invert_img_entry.grid(
             padx=(2 * self._pad, self._pad), pady=(0, self._pad)
         )
+        self._fast_mode_entry.grid(
+            padx=(self._pad, self._pad), pady=(0, self._pad)
+        )
 
         # Map between widgets and config parameters, and their type
         self._fields: list[tuple[Type, Entry | ctk.CTkCheckBox, str]] = [
@@ -841,6 +1258,7 @@ class PreProcessingConfigFrame(ctk.CTkFrame):
             (float, self._unsharp_sigma_entry, "unsharp_sigma"),
             (float, self._unsharp_amount_entry, "unsharp_amount"),
             (bool, self._invert_img_entry, "invert_img"),
+            (bool, self._fast_mode_entry, "fast_mode"),
         ]
 
     def attach_update_cb(
@@ -1,41 +1,62 @@
 """
 Class storing configuration data about a capture
 
+This is the headless core of the application: it doesn't depend on any GUI
+toolkit. A GUI can display the outputs by attaching preview sinks to the
+captures (see `Captures.__init__`).
+
 Author:  CorentinChauvin
 Year:    2024
 License: Apache 2.0
 """
 
-from src.gui_elements import TkImage2
-from src.ocr import BaseOcrEngine, TesseractOcrEngine, EasyOcrEngine, OcrMethod
-import customtkinter as ctk
+from src.ocr import BaseOcrEngine, OcrMethod, OcrResult, create_ocr_engine, parse_number
+from src.ocr import to_gray
+from src.ocr import pre_process_config_to_dict, pre_process_config_from_dict
+from src.ocr import get_tesseract_api_pool
+from src.ocr_workers import OcrWorkerPool
+from src.ocr_processes import OcrProcessPool
+from src.grab_planner import GrabArea, RegionFrame
+from src.scheduler import CaptureScheduler
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor
-from typing import Tuple
+import cv2
+import os
+from time import perf_counter
+from typing import Callable, Tuple
 
 
 class Capture:
     """
     Manages a capture's configuration and data
     """
-    def __init__(self, name: str, img_root: ctk.CTkBaseClass, ocr_method: OcrMethod):
+    _CHANGE_DOWNSAMPLING = 4  # downsampling factor used to detect changes in the area
+
+    def __init__(self, name: str, ocr_method: OcrMethod):
         """
         Sets initial name and default values
 
         Args:
-            - name:     Name of the capture
-            - img_root: Root of the displayed image
+            - name:       Name of the capture
+            - ocr_method: Method used to perform OCR
         """
         self.name = name
         self._can_edit = True  # whether the capture's config can be changed
+        self._last_thumbnail = None  # downsampled area of the last OCR run
+        self._last_output = (None, None)  # raw output and processed image of the last OCR run
+        self._last_confidence = None  # confidence of the last OCR output (0-100, None if unknown)
+        self._ocr_count = 0  # number of OCR runs
+        self._skip_count = 0  # number of OCR runs skipped since the area didn't change
         self.set_area(0, 0, 0, 0)  # default values
+        self.monitor = 1  # index of the monitor showing the area (1 for the main one)
 
         self.is_enabled = True  # whether to compute its output and display it
         self.show_preview = True  # whether to draw a preview of the captured area
-        self._output_img = TkImage2(img_root)  # displayed output image
-        self._output_txt = ctk.CTkLabel(img_root, text="-")
+        self._preview = None  # sink displaying the outputs (e.g. GUI widget), if any
         self.min_value = None  # minimum acceptable value for post-processing (not used if None)
         self.max_value = None  # maximum acceptable value for post-processing (not used if None)
+        self.change_threshold = 0.0  # grey level difference under which OCR is skipped (not used if 0)
+        self.sample_rate = None  # how many times per second to sample it (None for every tick)
+        self.priority = 0  # captures with a higher priority are degraded last when overloaded
 
         self.set_ocr_method(ocr_method)
 
@@ -48,6 +69,7 @@ class Capture:
             self.y_min = y_min
             self.x_max = x_max
             self.y_max = y_max
+            self._last_thumbnail = None
 
     def set_min_max_values(self, min_value: float | None, max_value: float | None):
         """
@@ -59,12 +81,17 @@ class Capture:
             self.min_value = min_value
             self.max_value = max_value
 
-    def display(self, column_idx: int):
+    def set_preview(self, preview):
         """
-        Adds the output image and text to the root widget
+        Attaches a sink displaying the outputs (None to detach it)
+
+        The sink needs an `update(text: str, img: np.ndarray | None)` method,
+        which is given the output text and the processed image.
         """
-        self._output_img.get_tk_canvas().grid(row=0, column=column_idx, sticky="nsew")
-        self._output_txt.grid(row=1, column=column_idx, sticky="nsew")
+        self._preview = preview
+
+    def get_preview(self):
+        return self._preview
 
     def ocr(self, screen_img: np.ndarray) -> Tuple[str, np.ndarray] | Tuple[None, None]:
         """
@@ -86,24 +113,175 @@ class Capture:
         if shape[0] == 0 or shape[1] == 0:
             return None, None
 
-        output, processed_img = self._ocr_engine.process(img)
+        if not self._has_changed(img):
+            self._skip_count += 1
+            return self._last_output
+
+        output, confidence, processed_img = self._ocr_engine.process_with_confidence(img)
+        self.set_last_output(output, processed_img, confidence)
+
+        return self._last_output
+
+    def get_unchanged_output(
+        self, screen_img: np.ndarray
+    ) -> Tuple[str, np.ndarray] | None:
+        """
+        Returns the outputs of the last OCR run if the capture area didn't change
+        since then (None otherwise, or if the capture is disabled)
+
+        If it returns None, OCR is expected to run on the capture, and its outputs
+        to be given to `set_last_output`.
+        """
+        if not self.is_enabled:
+            return None
+
+        img = self.slice_area(screen_img)
+        shape = np.shape(img)
+
+        if shape[0] == 0 or shape[1] == 0 or self._has_changed(img):
+            return None
+
+        self._skip_count += 1
+
+        return self._last_output
+
+    def set_last_output(
+        self, output: str, processed_img: np.ndarray, confidence: float | None = None
+    ):
+        """
+        Stores the outputs of an OCR run, to reuse them while the area doesn't change
+
+        The processed image is copied, since it can be a scratch buffer of the
+        engine (see `BaseOcrEngine._preprocess_img_fast`), overwritten at the
+        next run while the previews still read it.
+        """
+        if processed_img is not None:
+            processed_img = np.copy(processed_img)
+
+        self._last_output = (output, processed_img)
+        self._last_confidence = confidence
+        self._ocr_count += 1
+
+    def count_ocr_runs(self, count: int):
+        """
+        Counts OCR runs whose outputs weren't stored with `set_last_output`
+        (e.g. all but the last image of a batch), for the skip rate
+        """
+        self._ocr_count += count
+
+    def get_last_confidence(self) -> float | None:
+        """
+        Returns the confidence of the last OCR output (between 0 and 100, None if
+        the engine can't provide it)
+        """
+        return self._last_confidence
+
+    def get_last_processed_img(self) -> np.ndarray | None:
+        """
+        Returns the pre-processed image of the last OCR run (None if not available)
+        """
+        processed_img = self._last_output[1]
+
+        return None if processed_img is None else np.copy(processed_img)
+
+    def get_skip_rate(self) -> float:
+        """
+        Returns the ratio of OCR runs skipped because the area didn't change
+        """
+        count = self._ocr_count + self._skip_count
+        return self._skip_count / count if count > 0 else 0.0
+
+    def reset_skip_rate(self):
+        """
+        Resets the counters used to compute the skip rate
+        """
+        self._ocr_count = 0
+        self._skip_count = 0
+
+    def _has_changed(self, img: np.ndarray) -> bool:
+        """
+        Compares the raw capture area with the one of the last OCR run
+
+        Both are downsampled (averaging neighbouring pixels to filter noise out),
+        and the area is considered unchanged if no grey level differs by more
+        than `change_threshold`. If it changed, the new area is remembered.
+        """
+        if self.change_threshold <= 0:
+            return True
+
+        gray = to_gray(img)
+        size = (
+            max(1, gray.shape[1] // self._CHANGE_DOWNSAMPLING),
+            max(1, gray.shape[0] // self._CHANGE_DOWNSAMPLING),
+        )
+        thumbnail = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+        if (
+            self._last_thumbnail is not None
+            and self._last_thumbnail.shape == thumbnail.shape
+            and cv2.absdiff(thumbnail, self._last_thumbnail).max()
+            <= self.change_threshold
+        ):
+            return False
+
+        self._last_thumbnail = thumbnail
+
+        return True
+
+    def preprocess(self, screen_img: np.ndarray) -> np.ndarray | None:
+        """
+        Only prepares the capture area of the full screen image for OCR, so that
+        OCR can be run separately (for example batched with other captures)
+
+        Returns None if the capture is disabled or its area empty
+        """
+        if not self.is_enabled:
+            return None
+
+        img = self.slice_area(screen_img)
+        shape = np.shape(img)
+
+        if shape[0] == 0 or shape[1] == 0:
+            return None
+
+        return self._ocr_engine.preprocess(img)
 
-        return output, processed_img
+    def get_area(self) -> Tuple[int, int, int, int]:
+        """
+        Returns the capture area [x_min, y_min, x_max, y_max]
+        """
+        return self.x_min, self.y_min, self.x_max, self.y_max
 
+    def get_grab_area(self) -> GrabArea:
+        """
+        Returns the area to grab on the screen [monitor, x_min, y_min, x_max, y_max]
+        """
+        return (self.monitor,) + self.get_area()
+
+    def get_ocr_engine(self) -> BaseOcrEngine:
+        """
+        Returns the engine used to perform OCR
+        """
+        return self._ocr_engine
 
     def update(self, output: str, processed_img: np.ndarray):
         """
-        Updates the image and text previews on the GUI
+        Updates the image and text previews, if a preview sink is attached
         """
-        if self.show_preview:
-            self._output_img.update(processed_img)
-            self._output_txt.configure(text=f"{self.name}: {output}")
+        if self.show_preview and self._preview is not None:
+            self._preview.update(f"{self.name}: {output}", processed_img)
 
-    def slice_area(self, array: np.ndarray) -> np.ndarray:
+    def slice_area(self, array: np.ndarray | RegionFrame) -> np.ndarray:
         """
         Slices a Numpy array according to the capture area coordinates, along
         the first two dimensions (the third dimension onwards is untouched)
+
+        If given the screen regions grabbed for the captures, the coordinates
+        are translated to the region containing the area.
         """
+        if isinstance(array, RegionFrame):
+            return array.slice(self.get_grab_area())
+
         slices = (
             slice(self.x_min, self.x_max + 1, 1),
             slice(self.y_min, self.y_max + 1, 1),
@@ -123,6 +301,7 @@ class Capture:
         Updates the configuration for the image pre-processing
         """
         self._ocr_engine.set_pre_process_config(config)
+        self._last_thumbnail = None
 
     def get_pre_process_config(self) -> BaseOcrEngine.PreProcessConfig:
         """
@@ -139,33 +318,18 @@ class Capture:
         else:
             pre_config = None
 
-        if method == OcrMethod.TESSERACT:
-            self._ocr_engine = TesseractOcrEngine()
-        elif method == OcrMethod.EASY_OCR:
-            self._ocr_engine = EasyOcrEngine()
+        self._ocr_engine = create_ocr_engine(method)
 
         if pre_config is not None:
             self._ocr_engine.set_pre_process_config(pre_config)
 
+        self._last_thumbnail = None
+
     def post_process(self, output_str: str | None):
         """
         Turns the OCR output into a float. Returns None if it failed.
         """
-        if output_str is None:
-            return None
-
-        try:
-            value = float(output_str)
-        except ValueError:
-            return None
-
-        if self.min_value is not None and value < self.min_value:
-            return None
-
-        if self.max_value is not None and value > self.max_value:
-            return None
-
-        return value
+        return parse_number(output_str, self.min_value, self.max_value)
 
 
 class Captures:
@@ -173,21 +337,34 @@ class Captures:
     Manages all captures
     """
 
-    def __init__(self, root: ctk.CTkBaseClass):
+    def __init__(self, preview_factory: Callable[[Capture], object] | None = None):
+        """
+        Args:
+            - preview_factory: Creates the preview sink of a new capture (see
+                               `Capture.set_preview`), no preview if None
+        """
         self._ocr_method = OcrMethod.TESSERACT
         self._captures: list[Capture] = []
-        self._root = root
+        self._preview_factory = preview_factory
         self._max_threads = 1
+        self._workers = OcrWorkerPool(1)  # runs OCR tasks, lives as long as the captures
+        self._use_processes = False  # whether to run OCR in processes instead of threads
+        self._processes = OcrProcessPool(1)  # only started if processes are used
+        self._scheduler = CaptureScheduler()  # decides which captures are due
         self.add_capture()
 
     def add_capture(self) -> Capture:
         """
         Creates a new capture with default name, and returns it
         """
-        self._captures.append(
-            Capture(f"New capture {len(self._captures)}", self._root, self._ocr_method)
-        )
-        return self._captures[-1]
+        capture = Capture(f"New capture {len(self._captures)}", self._ocr_method)
+
+        if self._preview_factory is not None:
+            capture.set_preview(self._preview_factory(capture))
+
+        self._captures.append(capture)
+
+        return capture
 
     def remove_capture(self, key: str):
         """
@@ -215,15 +392,15 @@ class Captures:
 
             config[name] = {}
             config[name]["area"] = [capture.x_min, capture.y_min, capture.x_max, capture.y_max]
+            config[name]["monitor"] = capture.monitor
             config[name]["min_value"] = capture.min_value
             config[name]["max_value"] = capture.max_value
             config[name]["is_enabled"] = capture.is_enabled
             config[name]["show_preview"] = capture.show_preview
-            config[name]["ocr"] = {}
-
-            for key in dir(ocr_conf):
-                if key[0:2] != "__":
-                    config[name]["ocr"][key] = getattr(ocr_conf, key)
+            config[name]["change_threshold"] = capture.change_threshold
+            config[name]["sample_rate"] = capture.sample_rate
+            config[name]["priority"] = capture.priority
+            config[name]["ocr"] = pre_process_config_to_dict(ocr_conf)
 
         return config
 
@@ -237,24 +414,83 @@ class Captures:
             capture = self.add_capture()
             capture.name = name
             capture.set_area(*config[name]["area"])
+            capture.monitor = config[name].get("monitor", 1)
             capture.min_value = config[name]["min_value"]
             capture.max_value = config[name]["max_value"]
             capture.show_preview = config[name]["show_preview"]
-            ocr = BaseOcrEngine.PreProcessConfig()
-
-            for key in config[name]["ocr"]:
-                setattr(ocr, key, config[name]["ocr"][key])
-
-            capture.set_pre_process_config(ocr)
+            capture.is_enabled = config[name].get("is_enabled", True)
+            capture.change_threshold = config[name].get("change_threshold", 0.0)
+            capture.sample_rate = config[name].get("sample_rate", None)
+            capture.priority = config[name].get("priority", 0)
+            capture.set_pre_process_config(
+                pre_process_config_from_dict(config[name]["ocr"])
+            )
 
         if len(self._captures) == 0:
             self.add_capture()
 
     def set_max_threads(self, max_threads: int | None):
         """
-        Sets the maximum number of threads used for OCR (None sets no limit)
+        Sets the maximum number of threads used for OCR (None sets no limit,
+        which means one per CPU core)
+
+        The OCR workers are resized accordingly, and the size of the shared
+        Tesseract API pool follows this number.
         """
         self._max_threads = max_threads
+        pool_size = max_threads if max_threads is not None else os.cpu_count()
+        self._workers.set_num_workers(pool_size or 1)
+        self._processes.set_num_workers(pool_size or 1)
+        get_tesseract_api_pool().set_max_size(pool_size or 1)
+
+    def get_max_threads(self) -> int | None:
+        return self._max_threads
+
+    def set_use_processes(self, use_processes: bool):
+        """
+        Sets whether OCR runs in worker processes (sharing frames through shared
+        memory) instead of worker threads
+
+        Processes aren't limited by the Python global interpreter lock, but the
+        change detection and the batched OCR methods are only used with threads.
+        """
+        self._use_processes = use_processes
+
+    def get_use_processes(self) -> bool:
+        return self._use_processes
+
+    def get_max_sample_rate(self, default_rate: float) -> float:
+        """
+        Returns the highest sampling rate of the enabled captures, the ones
+        sampled at every tick counting as `default_rate`
+        """
+        return max(
+            [
+                capture.sample_rate or default_rate
+                for capture in self._captures
+                if capture.is_enabled
+            ],
+            default=default_rate,
+        )
+
+    def get_grab_areas(self) -> list[GrabArea]:
+        """
+        Returns the screen areas of all enabled captures, to be grabbed
+        """
+        return [capture.get_grab_area() for capture in self._captures if capture.is_enabled]
+
+    def get_worker_stats(self, reset: bool = False) -> dict:
+        """
+        Returns statistics about the OCR workers (see `OcrWorkerPool.get_stats`)
+        """
+        return self._workers.get_stats(reset)
+
+    def shutdown(self):
+        """
+        Stops the OCR workers, the captures can't be updated anymore
+        """
+        self._workers.shutdown()
+        self._processes.shutdown()
 
     def __getitem__(self, key: str) -> None | Capture:
         """
@@ -291,47 +527,515 @@ class Captures:
 
         return False
 
-    def update_layout(self):
+    def get_displayed(self) -> list[Capture]:
         """
-        Updates the tk layout to display all enabled outputs
+        Returns the captures whose outputs are displayed, in order
         """
-        for slave in self._root.grid_slaves():
-            slave.grid_forget()
+        return [
+            capture
+            for capture in self._captures
+            if capture.is_enabled and capture.show_preview
+        ]
+
+    def update(
+        self,
+        screen_img: np.ndarray | RegionFrame,
+        display: bool = True,
+        t: float | None = None,
+        budget: float | None = None,
+        names: list[str] | None = None,
+    ):
+        """
+        Processes the full screen image and displays all enabled outputs
 
-        k = 0
+        Args:
+            - screen_img: Full screen image, or regions of the screen covering
+                          the enabled captures (see `get_grab_areas`)
+            - display:    Whether to display the outputs (has to be False if not
+                          called from the GUI thread, see `display`)
+            - t:          Time of the image (s). If given, only the captures due
+                          according to their sampling rate are processed.
+            - budget:     Time that can be spent processing the image (s). If
+                          given, the captures with the lowest priority are
+                          delayed when it isn't enough.
+            - names:      Names of the captures to process, instead of the
+                          ones due at t (see `get_due`)
+        Returns
+            Dictionary of captured data (key: data name), only for the processed
+            captures
+        """
+        if names is None:
+            captures = self._get_due_captures(t, budget)
+        else:
+            captures = [
+                capture
+                for capture in self._captures
+                if capture.is_enabled and capture.name in names
+            ]
+
+        t0 = perf_counter()
+
+        if self._use_processes:
+            outputs = self._update_processes(captures, screen_img, display)
+        elif self.get_first().get_ocr_engine().supports_full_frame():
+            outputs = self._update_full_frame(captures, screen_img, display)
+        elif self.get_first().get_ocr_engine().supports_batch():
+            outputs = self._update_batched(captures, screen_img, display)
+        else:
+            outputs = self._update_threads(captures, screen_img, display)
 
-        for capture in self._captures:
-            if capture.is_enabled and capture.show_preview:
-                capture.display(k)
-                k += 1
+        if t is not None:
+            self._scheduler.report(len(captures), perf_counter() - t0)
+
+        return outputs
 
-    def update(self, screen_img: np.ndarray):
+    def reset_schedule(self, origin: float | None = None):
         """
-        Processes the full screen image and displays all enabled outputs
+        Schedules the captures again from the next call with a time, to be
+        called when the time base changes (see `CaptureScheduler.reset`)
 
         Args:
-            - screen_img: Full screen image
-        Returns
-            Dictionary of captured data (key: data name)
+            - origin: Time from which the deadlines start, None for the next call
+        """
+        self._scheduler.reset(origin)
+
+    def get_due(self, t: float) -> list[str]:
+        """
+        Returns the names of the enabled captures due at time t according to
+        their sampling rate, which are then considered processed (e.g. when
+        their outputs are known without running them)
+        """
+        return [capture.name for capture in self._get_due_captures(t)]
+
+    def _get_due_captures(
+        self, t: float | None = None, budget: float | None = None
+    ) -> list[Capture]:
+        """
+        Returns the enabled captures to process at time t (all of them if None),
+        see `CaptureScheduler`
+        """
+        enabled = [capture for capture in self._captures if capture.is_enabled]
+
+        if t is None:
+            return enabled
+
+        due = self._scheduler.get_due(
+            [(capture.name, capture.sample_rate, capture.priority) for capture in enabled],
+            t,
+            budget,
+        )
+
+        return [capture for capture in enabled if capture.name in due]
+
+    def _update_threads(
+        self,
+        captures: list[Capture],
+        screen_img: np.ndarray | RegionFrame,
+        display: bool = True,
+    ):
+        """
+        Same as `update`, but only for the given captures, each processed by an
+        OCR worker
         """
         outputs = {}
         futures = {}
 
-        with ThreadPoolExecutor(max_workers=self._max_threads) as executor:
-            for capture in self._captures:
-                if not capture.is_enabled:
-                    continue
-
-                futures[capture.name] = executor.submit(capture.ocr, screen_img)
+        for capture in captures:
+            futures[capture.name] = self._workers.submit(capture.ocr, screen_img)
 
         for name in futures:
             output, processed_img = futures[name].result()
             output = self[name].post_process(output)
             outputs[name] = output
-            self[name].update(output, processed_img)
+
+            if display:
+                self[name].update(output, processed_img)
 
         return outputs
 
+    def display(self, outputs: dict):
+        """
+        Displays the given outputs, along with the last processed images
+
+        Args:
+            - outputs: Dictionary of captured data, as returned by `update`
+        """
+        for name in outputs:
+            capture = self[name]
+
+            if capture is not None:
+                capture.update(outputs[name], capture.get_last_processed_img())
+
+    def _update_batched(
+        self,
+        captures: list[Capture],
+        screen_img: np.ndarray | RegionFrame,
+        display: bool = True,
+    ):
+        """
+        Same as `update`, but runs OCR on the given captures with a single call to
+        the engine (pre-processing is still done in parallel)
+        """
+        outputs = {}
+        futures = {}
+        unchanged = {}  # outputs of the captures whose area didn't change
+
+        for capture in captures:
+            unchanged_output = capture.get_unchanged_output(screen_img)
+
+            if unchanged_output is not None:
+                unchanged[capture.name] = unchanged_output
+            else:
+                futures[capture.name] = self._workers.submit(
+                    capture.preprocess, screen_img
+                )
+
+        for name in unchanged:
+            output, processed_img = unchanged[name]
+            output = self[name].post_process(output)
+            outputs[name] = output
+
+            if display:
+                self[name].update(output, processed_img)
+
+        names = []
+        processed_imgs = []
+
+        for name in futures:
+            processed_img = futures[name].result()
+
+            if processed_img is None:
+                outputs[name] = None
+
+                if display:
+                    self[name].update(None, None)
+            else:
+                names.append(name)
+                processed_imgs.append(processed_img)
+
+        raw_outputs = self._workers.submit(
+            self._cached_ocr_batch,
+            self.get_first().get_ocr_engine(),
+            [self[name].get_ocr_engine() for name in names],
+            processed_imgs,
+        ).result()
+
+        for name, (output, confidence), processed_img in zip(
+            names, raw_outputs, processed_imgs
+        ):
+            self[name].set_last_output(output, processed_img, confidence)
+            output = self[name].post_process(output)
+            outputs[name] = output
+
+            if display:
+                self[name].update(output, self[name].get_last_processed_img())
+
+        return outputs
+
+    def _update_processes(
+        self,
+        captures: list[Capture],
+        screen_img: np.ndarray | RegionFrame,
+        display: bool = True,
+    ):
+        """
+        Same as `update`, but runs pre-processing, OCR and post-processing of the
+        given captures in worker processes
+        """
+        outputs = {capture.name: None for capture in captures}
+        results = []
+
+        for img, group, areas in self._split_frame(screen_img, captures):
+            specs = [
+                (
+                    capture.name,
+                    area,
+                    self._ocr_method.value,
+                    capture.min_value,
+                    capture.max_value,
+                    pre_process_config_to_dict(capture.get_pre_process_config()),
+                    capture.show_preview,
+                )
+                for capture, area in zip(group, areas)
+            ]
+            results += self._processes.process(img, specs)
+
+        for name, value, raw_output, confidence, processed_img in results:
+            capture = self[name]
+
+            if capture is None:
+                continue
+
+            if raw_output is not None:
+                capture.set_last_output(raw_output, processed_img, confidence)
+
+            outputs[name] = value
+
+            if display:
+                capture.update(value, processed_img)
+
+        return outputs
+
+    def _update_full_frame(
+        self,
+        captures: list[Capture],
+        screen_img: np.ndarray | RegionFrame,
+        display: bool = True,
+    ):
+        """
+        Same as `update`, but gives the full screen image at once to the OCR
+        engine, along with the areas of the given captures to read (no
+        pre-processing)
+        """
+        outputs = {}
+        to_read = []  # captures to read
+
+        for capture in captures:
+            unchanged_output = capture.get_unchanged_output(screen_img)
+
+            if unchanged_output is not None:
+                output, img = unchanged_output
+            elif capture.slice_area(screen_img).size == 0:
+                output, img = None, None
+            else:
+                to_read.append(capture)
+                continue
+
+            outputs[capture.name] = capture.post_process(output)
+
+            if display:
+                capture.update(outputs[capture.name], img)
+
+        engine = self.get_first().get_ocr_engine()
+        futures = [
+            (group, self._workers.submit(engine.ocr_full_frame, img, areas))
+            for img, group, areas in self._split_frame(screen_img, to_read)
+        ]
+        raw_outputs = [
+            (capture, raw_output)
+            for group, future in futures
+            for capture, raw_output in zip(group, future.result())
+        ]
+
+        for capture, (output, confidence) in raw_outputs:
+            img = capture.slice_area(screen_img)
+            capture.set_last_output(output, img, confidence)
+            outputs[capture.name] = capture.post_process(output)
+
+            if display:
+                capture.update(outputs[capture.name], img)
+
+        return outputs
+
+    def _split_frame(
+        self, screen_img: np.ndarray | RegionFrame, captures: list[Capture]
+    ) -> list[Tuple[np.ndarray, list[Capture], list[Tuple[int, int, int, int]]]]:
+        """
+        Groups captures by image to read them from: the full screen image, or
+        the grabbed regions containing them
+
+        Returns [image, captures, areas of the captures in the image] for each
+        image (captures outside any grabbed region are left out)
+        """
+        if not isinstance(screen_img, RegionFrame):
+            return [(screen_img, captures, [capture.get_area() for capture in captures])]
+
+        groups = {}  # [captures, areas] for each region index
+
+        for capture in captures:
+            location = screen_img.locate(capture.get_grab_area())
+
+            if location is not None:
+                k, area = location
+                groups.setdefault(k, ([], []))
+                groups[k][0].append(capture)
+                groups[k][1].append(area)
+
+        regions = screen_img.get_regions()
+
+        return [(regions[k][1], group[0], group[1]) for k, group in groups.items()]
+
+    def update_many(
+        self,
+        screen_imgs: list[np.ndarray],
+        ts: list[float] | None = None,
+        display: bool = True,
+    ) -> list[dict]:
+        """
+        Processes several full screen images (e.g. successive video frames),
+        running OCR on each capture with a single call for all the images
+
+        Only the last outputs of each capture are displayed.
+
+        Args:
+            - screen_imgs: Full screen images
+            - ts:          Time of each image (s). If given, each capture only
+                           processes the images where it is due (see `update`).
+            - display:     Whether to display the outputs (see `update`)
+        Returns
+            Dictionary of captured data for each image (key: data name)
+        """
+        if ts is None:
+            ts = [None] * len(screen_imgs)
+
+        if len(screen_imgs) <= 1 or not self.supports_batch():
+            return [
+                self.update(screen_img, display, t)
+                for screen_img, t in zip(screen_imgs, ts)
+            ]
+
+        outputs = [{} for _ in screen_imgs]
+        indices = {}  # indices of the images where each capture is due
+
+        for k, t in enumerate(ts):
+            for capture in self._get_due_captures(t):
+                indices.setdefault(capture.name, []).append(k)
+
+        futures = {
+            name: self._workers.submit(
+                self._ocr_capture_many, self[name], [screen_imgs[k] for k in indices[name]]
+            )
+            for name in indices
+        }
+
+        for name in futures:
+            results = futures[name].result()
+
+            for k, (output, _) in zip(indices[name], results):
+                outputs[k][name] = self[name].post_process(output)
+
+            if display:
+                self[name].update(outputs[indices[name][-1]][name], results[-1][1])
+
+        return outputs
+
+    def supports_batch(self) -> bool:
+        """
+        Whether the OCR engine can read several images in a single call
+        """
+        return self.get_first().get_ocr_engine().supports_batch()
+
+    def _ocr_capture_many(
+        self, capture: Capture, screen_imgs: list[np.ndarray]
+    ) -> list[Tuple[str | None, np.ndarray | None]]:
+        """
+        Runs OCR on the area of a capture in several images, with a single call
+
+        Returns the raw output and processed image for each image
+        """
+        results = [(None, None)] * len(screen_imgs)
+        confidences = [None] * len(screen_imgs)
+        sources = [None] * len(screen_imgs)  # image whose result is reused
+        read_indices = []  # indices of the images to read
+        processed_imgs = []
+        last_read = None  # index of the last image to read
+
+        for k, screen_img in enumerate(screen_imgs):
+            unchanged_output = capture.get_unchanged_output(screen_img)
+
+            if unchanged_output is not None:
+                if last_read is None:
+                    results[k] = unchanged_output
+                    confidences[k] = capture.get_last_confidence()
+                else:
+                    sources[k] = last_read
+
+                continue
+
+            processed_img = capture.preprocess(screen_img)
+
+            if processed_img is not None:
+                read_indices.append(k)
+                processed_imgs.append(np.copy(processed_img))  # engine buffers are reused
+                last_read = k
+
+        engine = capture.get_ocr_engine()
+        raw_outputs = self._cached_ocr_batch(
+            engine, [engine] * len(processed_imgs), processed_imgs
+        )
+
+        for k, (output, confidence), processed_img in zip(
+            read_indices, raw_outputs, processed_imgs
+        ):
+            results[k] = (output, processed_img)
+            confidences[k] = confidence
+
+        for k, source in enumerate(sources):
+            if source is not None:
+                results[k] = results[source]
+
+        if last_read is not None:
+            capture.count_ocr_runs(len(read_indices) - 1)
+            capture.set_last_output(*results[last_read], confidences[last_read])
+
+        return results
+
+    def _cached_ocr_batch(
+        self,
+        batch_engine: BaseOcrEngine,
+        engines: list[BaseOcrEngine],
+        processed_imgs: list[np.ndarray],
+    ) -> list[OcrResult]:
+        """
+        Reads pre-processed images with a single call to `batch_engine`, except
+        for the ones already in the OCR cache of their engine
+
+        Args:
+            - batch_engine:   Engine used to read the images
+            - engines:        Engine whose cache is used, for each image
+            - processed_imgs: Images to read
+        """
+        raw_outputs: list = [None] * len(processed_imgs)
+        keys = [b""] * len(processed_imgs)  # keys of the images in the OCR caches
+        missing = []  # indices of the images to read
+
+        for k, engine in enumerate(engines):
+            keys[k] = engine.cache_key(processed_imgs[k])
+            raw_outputs[k] = engine.get_cache().get(keys[k])
+
+            if raw_outputs[k] is None:
+                missing.append(k)
+
+        missing_outputs = batch_engine.ocr_batch([processed_imgs[k] for k in missing])
+
+        for k, output in zip(missing, missing_outputs):
+            engines[k].get_cache().put(keys[k], output)
+            raw_outputs[k] = output
+
+        return raw_outputs
+
+    def get_skip_rates(self) -> dict:
+        """
+        Returns the ratio of OCR runs skipped because the capture area didn't
+        change, for all captures (key: capture name)
+        """
+        return {capture.name: capture.get_skip_rate() for capture in self._captures}
+
+    def reset_skip_rates(self):
+        """
+        Resets the skip rate counters of all captures
+        """
+        for capture in self._captures:
+            capture.reset_skip_rate()
+
+    def get_confidences(self) -> dict:
+        """
+        Returns the confidence of the last OCR output of all captures (key:
+        capture name)
+        """
+        return {
+            capture.name: capture.get_last_confidence() for capture in self._captures
+        }
+
+    def get_cache_stats(self) -> dict:
+        """
+        Returns the OCR cache statistics of all captures (key: capture name)
+        """
+        return {
+            capture.name: capture.get_ocr_engine().get_cache().get_stats()
+            for capture in self._captures
+        }
+
     def set_ocr_method(self, method: OcrMethod):
         """
         Sets the method used to perform OCR
@@ -340,3 +1044,6 @@ class Captures:
 
         for capture in self._captures:
             capture.set_ocr_method(method)
+
+    def get_ocr_method(self) -> OcrMethod:
+        return self._ocr_method
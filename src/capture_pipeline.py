@@ -0,0 +1,254 @@
+"""
+Pipeline overlapping screen grabs, OCR and GUI refresh
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from enum import Enum
+from time import time, sleep
+from typing import Callable, Tuple
+import numpy as np
+import queue
+import threading
+
+
+class QueuePolicy(Enum):
+    """
+    What the grabber does when the OCR stage is late and the frame queue is full
+    """
+    DROP_OLDEST = 1  # replace the oldest waiting frame (lowest latency)
+    BLOCK = 2  # wait for the OCR stage (no frame is lost)
+
+
+# Processed sample: [grab time, processing end time, outputs]
+PipelineResult = Tuple[float, float, dict]
+
+
+class CapturePipeline:
+    """
+    Runs the screen grab and the OCR in two threads, connected by a bounded queue
+
+    The grabber thread stamps each frame with its grab time and pushes it in
+    the queue, at the requested frequency. The OCR thread consumes the frames
+    and stores the results, which the GUI polls without blocking. Throughput is
+    then limited by the slowest stage, instead of the sum of all stages.
+    """
+
+    def __init__(
+        self,
+        grab_fn: Callable[[], np.ndarray | None],
+        process_fn: Callable[[np.ndarray, float], dict],
+        queue_size: int = 2,
+        policy: QueuePolicy = QueuePolicy.DROP_OLDEST,
+        start_fn: Callable[[], None] | None = None,
+    ):
+        """
+        Args:
+            - grab_fn:    Returns a new frame, or None if none is available
+            - process_fn: Runs OCR on a frame, given its grab time, and returns
+                          the outputs
+            - queue_size: Maximum number of frames waiting for OCR
+            - policy:     What to do when the queue is full
+            - start_fn:   Called before processing frames again, at each start
+                          and resume (e.g. to reset the schedule of the captures)
+        """
+        self._grab_fn = grab_fn
+        self._process_fn = process_fn
+        self._start_fn = start_fn
+        self._frames = queue.Queue(max(1, queue_size))  # [grab time, frame], or None to stop
+        self._policy = policy
+        self._period = 0.1  # minimum time between two grabs (s)
+
+        self._results = []  # processed samples not polled yet
+        self._results_lock = threading.Lock()
+        self._processing_lock = threading.Lock()  # held while processing a frame
+        self._paused = threading.Event()  # set when the pipeline shouldn't grab frames
+        self._pause_count = 0  # number of pauses not resumed yet
+        self._running = False
+        self._threads = []
+
+        # Statistics
+        self._grab_count = 0  # number of grabbed frames
+        self._drop_count = 0  # number of frames dropped since the queue was full
+
+    def start(self):
+        """
+        Starts the grabber and OCR threads
+        """
+        if self._running:
+            return
+
+        if self._start_fn is not None:
+            self._start_fn()
+
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._grab_loop, name="grabber", daemon=True),
+            threading.Thread(target=self._process_loop, name="ocr_stage", daemon=True),
+        ]
+
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stops the threads once the current frame is processed
+        """
+        if not self._running:
+            return
+
+        self._running = False
+        grab_thread, process_thread = self._threads
+        grab_thread.join()  # before the stop signal, so that it can't be dropped
+        self._clear_frames()
+        self._frames.put(None)
+        process_thread.join()
+        self._threads = []
+
+    def pause(self):
+        """
+        Stops grabbing frames, drops the waiting ones, and waits for the frame
+        being processed (if any), so that the processing function isn't called
+        until `resume`
+
+        Pauses can be nested: the pipeline only resumes once `resume` was called
+        for each of them. It has to be called from a single thread.
+        """
+        self._pause_count += 1
+        self._paused.set()
+        self._clear_frames()
+
+        with self._processing_lock:
+            self._clear_frames()
+
+    def resume(self):
+        self._pause_count = max(0, self._pause_count - 1)
+
+        if self._pause_count == 0:
+            if self._start_fn is not None:
+                self._start_fn()
+
+            self._paused.clear()
+
+    def set_fps(self, fps: float):
+        """
+        Sets the maximum frequency of the screen grabs
+        """
+        self._period = 1.0 / fps
+
+    def get_fps(self) -> float:
+        return 1.0 / self._period
+
+    def set_policy(self, policy: QueuePolicy):
+        self._policy = policy
+
+    def get_policy(self) -> QueuePolicy:
+        return self._policy
+
+    def poll(self) -> list[PipelineResult]:
+        """
+        Returns the samples processed since the last call, without blocking
+        """
+        with self._results_lock:
+            results = self._results
+            self._results = []
+
+        return results
+
+    def get_drop_rate(self) -> float:
+        """
+        Returns the ratio of grabbed frames dropped before OCR
+        """
+        if self._grab_count == 0:
+            return 0.0
+        else:
+            return self._drop_count / self._grab_count
+
+    def _clear_frames(self):
+        """
+        Drops all the frames waiting in the queue
+        """
+        try:
+            while True:
+                self._frames.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _push_frame(self, item: Tuple[float, np.ndarray]):
+        """
+        Pushes a frame in the queue, following the queue policy
+        """
+        if self._policy == QueuePolicy.BLOCK:
+            while self._running and not self._paused.is_set():
+                try:
+                    self._frames.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+            return
+
+        while True:
+            try:
+                self._frames.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._frames.get_nowait()
+                    self._drop_count += 1
+                except queue.Empty:
+                    pass
+
+    def _grab_loop(self):
+        """
+        Grabs and stamps frames at the requested frequency
+        """
+        next_t = time()
+
+        while self._running:
+            sleep(max(0.0, next_t - time()))
+            next_t = max(next_t + self._period, time())
+
+            if self._paused.is_set():
+                continue
+
+            t = time()
+
+            try:
+                frame = self._grab_fn()
+            except Exception as e:
+                print(f"[CapturePipeline] ERROR: couldn't grab a frame: {e}")
+                continue
+
+            if frame is None:
+                continue
+
+            self._grab_count += 1
+            self._push_frame((t, frame))
+
+    def _process_loop(self):
+        """
+        Runs OCR on the frames from the queue
+        """
+        while True:
+            item = self._frames.get()
+
+            if item is None:
+                break
+
+            with self._processing_lock:
+                if self._paused.is_set():
+                    continue
+
+                grab_t, frame = item
+
+                try:
+                    outputs = self._process_fn(frame, grab_t)
+                except Exception as e:
+                    print(f"[CapturePipeline] ERROR: couldn't process a frame: {e}")
+                    continue
+
+            with self._results_lock:
+                self._results.append((grab_t, time(), outputs))
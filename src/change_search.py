@@ -0,0 +1,160 @@
+"""
+Finds when the outputs of the captures change in a video, by bisection
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.capture import Captures
+from src.frame_index import FrameIndex
+from src.video_sampler import VideoOutput, VideoSample
+import cv2
+from typing import Iterable, Iterator
+
+
+class ChangeSearch:
+    """
+    Adaptive sampling for signals that rarely change
+
+    The video is sampled coarsely, and wherever two neighbouring samples have
+    different outputs, the interval between them is bisected (reading frames
+    with seeks) until each change is located within the requested resolution.
+    Changes are then timestamped precisely with a number of OCR runs growing
+    with the number of changes, instead of the duration of the video.
+
+    If a capture changes several times between two coarse samples and comes
+    back to the same value, the changes are missed: the coarse sampling rate
+    has to be higher than the rate of such changes.
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        captures: Captures,
+        resolution: float,
+        frame_index: FrameIndex | None = None,
+        display: bool = True,
+    ):
+        """
+        Args:
+            - video_path:  Path of the video file (opened again to read the
+                           frames in between coarse samples)
+            - captures:    Captures to run
+            - resolution:  Maximum time between the last sample before a change
+                           and the first one after (s)
+            - frame_index: Index of the video, to stop at consecutive frames
+                           and read exact frames
+            - display:     Whether to display the outputs (see `Captures.update`)
+        """
+        self._video_path = video_path
+        self._captures = captures
+        self._resolution = resolution
+        self._frame_index = frame_index
+        self._display = display
+        self._cap = None  # video used to read frames between coarse samples
+
+        # Statistics
+        self.sample_count = 0  # number of coarse samples
+        self.probe_count = 0  # number of frames read by bisection
+
+    def process(self, samples: Iterable[VideoSample]) -> Iterator[list[VideoOutput]]:
+        """
+        Runs the captures on coarse samples and bisects the changes between them
+
+        Args:
+            - samples: Coarse samples, in time order (e.g. a `VideoSampler`)
+        Returns:
+            For each coarse sample, the outputs of the frames read before it
+            (since the previous coarse sample) and its own, in time order
+        """
+        self._cap = cv2.VideoCapture(self._video_path)
+        previous = None  # outputs of the previous coarse sample
+
+        try:
+            for frame, t, frame_idx in samples:
+                current = (self._captures.update(frame, self._display), t, frame_idx)
+                self.sample_count += 1
+                outputs = []
+
+                if previous is not None:
+                    names = [
+                        name
+                        for name in current[0]
+                        if current[0][name] != previous[0].get(name)
+                    ]
+                    outputs = self._bisect(previous, current, names)
+
+                previous = current
+                yield outputs + [current]
+        finally:
+            self._cap.release()
+            self._cap = None
+
+    def get_summary(self) -> str:
+        """
+        Returns a human readable summary of the OCR work
+        """
+        return f"{self.sample_count} coarse samples, {self.probe_count} frames read by bisection"
+
+    def _bisect(
+        self, start: VideoOutput, end: VideoOutput, names: list[str]
+    ) -> list[VideoOutput]:
+        """
+        Reads frames between two samples until the changes of the given captures
+        are located within the resolution
+
+        Returns the outputs of the read frames, in time order
+        """
+        if len(names) == 0 or end[1] - start[1] <= self._resolution:
+            return []
+
+        if self._frame_index is not None:
+            start_frame = self._frame_index.get_frame(start[1])
+            end_frame = self._frame_index.get_frame(end[1])
+
+            if end_frame - start_frame <= 1:
+                return []  # the change is at the end frame
+
+            t = self._frame_index.get_time((start_frame + end_frame) // 2)
+        else:
+            t = (start[1] + end[1]) / 2.0
+
+        sample = self._read_at(t)
+
+        if sample is None or not start[1] < sample[1] < end[1]:
+            return []  # the frames in between can't be reached
+
+        frame, t, frame_idx = sample
+        middle = (self._captures.update(frame, self._display), t, frame_idx)
+        self.probe_count += 1
+
+        # Each capture is searched in the halves where its output differs
+        start_names = [name for name in names if middle[0].get(name) != start[0].get(name)]
+        end_names = [name for name in names if middle[0].get(name) != end[0].get(name)]
+
+        return (
+            self._bisect(start, middle, start_names)
+            + [middle]
+            + self._bisect(middle, end, end_names)
+        )
+
+    def _read_at(self, t: float) -> VideoSample | None:
+        """
+        Reads the frame at a given time, returns None if it failed
+        """
+        self._cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000.0)
+
+        if not self._cap.grab():
+            return None
+
+        ret, frame = self._cap.retrieve()
+
+        if not ret or frame is None:
+            return None
+
+        return (
+            frame,
+            self._cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0,
+            int(self._cap.get(cv2.CAP_PROP_POS_FRAMES)),
+        )
@@ -8,6 +8,7 @@ License: Apache 2.0
 
 import numpy as np
 import csv
+import os
 from datetime import datetime
 from time import time
 from typing import List
@@ -20,12 +21,21 @@ class DataRecorder:
     """
 
     def __init__(self):
-        self._data = {}  # recorded data ("field1": [[t0, x0], [t1, x1], ...]}
+        self._data = {}  # recorded data ("field1": [[t0, x0], [t1, x1], ...]}, only when sampled
         self._is_recording = False  # whether data is currently being recorded
         self._start_time = None  # time at which the recording started
         self._last_times = []  # last times the recorder was called
+        self._latencies = []  # delay between the capture and the recording of each point (None if unknown)
 
         self._fps_avg_len = 10  # how many points used to average the fps output
+        self._output_dir = "/tmp"  # where the data is saved
+        self._file_name = None  # name of the next saved file (None for a dated name)
+
+        # Incremental writing of the CSV file
+        self._file_path = None  # file of the current recording, once created
+        self._saved_count = 0  # number of recording times already written
+        self._next_samples = {}  # next sample to write for each field
+        self._save_latency = False  # whether the file has a latency column
 
     def add_field(self, name: str):
         """
@@ -37,7 +47,7 @@ class DataRecorder:
             )
             return
 
-        self._data[name] = [[t, None] for t in self._last_times]
+        self._data[name] = []
 
     def rename_field(self, old_name: str, new_name: str):
         """
@@ -79,6 +89,20 @@ class DataRecorder:
         for name in names:
             self.add_field(name)
 
+    def set_output(self, output_dir: str, file_name: str | None = None):
+        """
+        Sets where the next recording is saved
+
+        Args:
+            - output_dir: Directory of the CSV file
+            - file_name:  Name of the CSV file, None to name it after the date
+        """
+        self._output_dir = output_dir
+        self._file_name = file_name
+
+    def get_output_dir(self) -> str:
+        return self._output_dir
+
     def toggle_recording(self, is_recording: bool) -> str:
         """
         Starts or stops the data recording
@@ -89,38 +113,121 @@ class DataRecorder:
         path = ""
 
         if is_recording:
-            self._data = {key: [] for key in self._data}
-            self._start_time = time()
-            self._last_times = []
+            self._reset_recording()
         elif self._is_recording:
-            path = self._save_data()
+            path = self.flush()
+            self._file_path = None
+            print(f"[Recorder] Saved data at {path}")
 
         self._is_recording = is_recording
 
         return path
 
-    def record(self, new_data: dict, t: float | None = None):
+    def resume_recording(self, file_path: str, file_size: int) -> bool:
+        """
+        Starts recording by appending to the CSV file of a previous recording
+
+        Args:
+            - file_path: CSV file written by a previous recording (see `flush`)
+            - file_size: Size of the file when its valid content was written
+                         (any content after is dropped)
+        Returns
+            Whether it succeeded (the columns of the file have to match the
+            fields)
+        """
+        try:
+            with open(file_path, "r+") as f:
+                f.truncate(file_size)
+                f.seek(0)
+                header = next(csv.reader(f), [])
+        except OSError as e:
+            print(f"[Recorder] ERROR: couldn't resume recording in {file_path}")
+            print(e)
+            return False
+
+        fields = ["t"] + list(self._data.keys())
+
+        if header not in [fields, fields + ["latency"]]:
+            print(f"[Recorder] ERROR: the columns of {file_path} don't match the fields")
+            return False
+
+        self._reset_recording()
+        self._file_path = file_path
+        self._save_latency = len(header) > len(fields)
+        self._is_recording = True
+
+        return True
+
+    def flush(self) -> str:
+        """
+        Writes the data recorded since the last call in the CSV file (created
+        at the first call), and returns its path
+
+        It can be called regularly during long recordings, so that the data is
+        kept if the program stops. The written data is then dropped from
+        memory.
+        """
+        if self._file_path is None:
+            if self._file_name is not None:
+                file_name = self._file_name
+            else:
+                date_str = datetime.now().strftime("%Y_%m_%d-%H_%M_%S")
+                file_name = f"data_{date_str}.csv"
+
+            self._file_path = os.path.join(self._output_dir, file_name)
+            self._save_latency = any(latency is not None for latency in self._latencies)
+            mode = "w"
+        else:
+            mode = "a"
+
+        with open(self._file_path, mode) as f:
+            csv_writer = csv.writer(
+                f, delimiter=",", quotechar='"', quoting=csv.QUOTE_ALL
+            )
+
+            if mode == "w":
+                csv_writer.writerow(
+                    ["t"]
+                    + list(self._data.keys())
+                    + (["latency"] if self._save_latency else [])
+                )
+
+            self._write_rows(csv_writer)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._drop_written_rows()
+
+        return self._file_path
+
+    def record(self, new_data: dict, t: float | None = None, latency: float | None = None):
         """
         Records new data for a given time, if currently in recording mode
 
-        The keys in `new_data` should correspond to data field names.
-        If some data fields are missing, they will be recorded as None.
+        The keys in `new_data` should correspond to data field names. Fields
+        can be sampled at different rates: the missing ones aren't recorded at
+        this time (the values of sampled fields can still be None, e.g. if OCR
+        failed).
 
-        If t is not given (or None), the current system time is taken
+        If t is not given (or None), the current system time is taken. The
+        latency is the delay between the capture of the data (at t) and its
+        recording, it is saved along with the data if given.
         """
         if t is None:
             t = time()
 
         self._last_times.append(t)
+        self._latencies.append(latency)
 
         if not self._is_recording:
+            # Only the last points are kept, for the averages
+            del self._last_times[: -self._fps_avg_len]
+            del self._latencies[: -self._fps_avg_len]
             return
 
         for key in self._data:
             if key in new_data:
                 self._data[key].append([t, new_data[key]])
-            else:
-                self._data[key].append([t, None])
 
     def get_is_recording(self) -> bool:
         return self._is_recording
@@ -143,28 +250,67 @@ class DataRecorder:
         dt = np.average(np.diff(self._last_times[-n:]))
         return 1.0 / dt
 
-    def _save_data(self, file_path: str = "") -> str:
+    def get_average_latency(self) -> float | None:
         """
-        Saves the data in a CSV file and returns the name of the file
+        Returns the average latency of the last data points (None if unknown)
         """
-        if file_path == "":
-            date_str = datetime.now().strftime("%Y_%m_%d-%H_%M_%S")
-            file_name = f"data_{date_str}.csv"
-            file_path = f"/tmp/{file_name}"
+        latencies = [
+            latency
+            for latency in self._latencies[-self._fps_avg_len :]
+            if latency is not None
+        ]
 
-        with open(file_path, "w") as f:
-            csv_writer = csv.writer(
-                f, delimiter=",", quotechar='"', quoting=csv.QUOTE_ALL
-            )
+        if len(latencies) == 0:
+            return None
+
+        return float(np.average(latencies))
+
+    def _reset_recording(self):
+        """
+        Drops the recorded data, before a new recording
+        """
+        self._data = {key: [] for key in self._data}
+        self._start_time = time()
+        self._last_times = []
+        self._latencies = []
+        self._file_path = None
+        self._saved_count = 0
+        self._next_samples = {key: 0 for key in self._data}
+
+    def _drop_written_rows(self):
+        """
+        Drops the data written in the CSV file, only keeping the last recording
+        times and latencies for the averages
+        """
+        self._data = {key: [] for key in self._data}
+        self._next_samples = {key: 0 for key in self._data}
+        self._last_times = self._last_times[-self._fps_avg_len :]
+        self._latencies = self._latencies[-self._fps_avg_len :]
+        self._saved_count = len(self._last_times)
+
+    def _write_rows(self, csv_writer):
+        """
+        Writes the rows of the recording times not written yet
+
+        There is a row for each recording time, the cells of the fields which
+        weren't sampled at that time are left empty.
+        """
+        for k in range(self._saved_count, len(self._last_times)):
+            row = [self._last_times[k]]
+
+            for key in self._data:
+                samples = self._data[key]
+                idx = self._next_samples.get(key, 0)
 
-            csv_writer.writerow(["t"] + list(self._data.keys()))
+                if idx < len(samples) and samples[idx][0] == self._last_times[k]:
+                    row.append(samples[idx][1])
+                    self._next_samples[key] = idx + 1
+                else:
+                    row.append(None)
 
-            for k in range(len(self._last_times)):
-                row = [self._last_times[k]] + [
-                    self._data[key][k][1] for key in self._data
-                ]
-                csv_writer.writerow(row)
+            if self._save_latency:
+                row.append(self._latencies[k])
 
-        print(f"[Recorder] Saved data at {file_path}")
+            csv_writer.writerow(row)
 
-        return file_path
+        self._saved_count = len(self._last_times)
@@ -0,0 +1,212 @@
+"""
+Detects runs of identical sampled frames in a video, to run the captures only
+once per run
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.capture import Captures
+from src.ocr import to_gray
+from src.video_sampler import VideoOutput, VideoSample, process_samples
+from enum import Enum
+from typing import Iterable, Iterator, Tuple
+import cv2
+import numpy as np
+
+
+class DuplicateFrames(Enum):
+    """
+    How the sampled frames identical to the previous one are handled
+    """
+    PROCESS = 1  # run the captures on every sampled frame
+    COPY = 2  # run them once per run of identical frames, and record the outputs at each frame
+    BOUNDARIES = 3  # same, but only record the outputs at the first and last frames of a run
+
+
+# Area of a capture in a frame: [x_min, y_min, x_max, y_max] (x along the rows)
+FrameArea = Tuple[int, int, int, int]
+
+
+def get_fingerprint(
+    frame: np.ndarray, areas: list[FrameArea], cell_size: int = 4, step: int = 4
+) -> bytes:
+    """
+    Returns a tiny fingerprint of the capture areas of a frame: each area is
+    converted to grey, averaged over cells of a few pixels, and quantised
+
+    Two frames with the same fingerprint are considered identical. Averaging
+    and quantising ignore the noise of video compression, while a changed
+    character (even a dot) still changes the mean of the cells it covers by far
+    more than a step.
+
+    Args:
+        - frame:     Full video frame
+        - areas:     Areas the fingerprint covers
+        - cell_size: Size of the cells the areas are averaged over (pixels)
+        - step:      Quantisation step of the grey levels
+    """
+    parts = []
+
+    for x_min, y_min, x_max, y_max in areas:
+        img = frame[max(x_min, 0) : x_max + 1, max(y_min, 0) : y_max + 1]
+
+        if img.shape[0] == 0 or img.shape[1] == 0:
+            continue
+
+        gray = to_gray(img)
+        size = (max(1, gray.shape[1] // cell_size), max(1, gray.shape[0] // cell_size))
+        cells = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        parts.append((cells // step).tobytes())
+
+    return b"".join(parts)
+
+
+class DuplicateFilter:
+    """
+    Runs the captures once per run of sampled frames whose capture areas are
+    identical, e.g. during the long still parts of screen recordings
+
+    A fingerprint of the union of the capture areas is computed on each sampled
+    frame (see `get_fingerprint`), which is much cheaper than OCR. On frames
+    with the same fingerprint as the previous one, the outputs of the captures
+    due at that time (see `Captures.get_due`) are copied from the previous
+    frames of the run. The captures are only run on them if they weren't read
+    yet during the run (e.g. slower captures not due on its first frame).
+    """
+
+    def __init__(
+        self,
+        captures: Captures,
+        policy: DuplicateFrames = DuplicateFrames.COPY,
+        cell_size: int = 4,
+        step: int = 4,
+    ):
+        """
+        Args:
+            - captures:  Captures to run (their enabled areas are fingerprinted)
+            - policy:    Where the outputs of a run are recorded
+            - cell_size: Size of the cells of the fingerprint (pixels)
+            - step:      Quantisation step of the fingerprint grey levels
+        """
+        self._captures = captures
+        self._policy = policy
+        self._cell_size = cell_size
+        self._step = step
+
+        # Statistics
+        self.frame_count = 0  # number of sampled frames
+        self.duplicate_count = 0  # number of frames the captures didn't run on
+        self.last_frame = 0  # frame number of the last sampled frame
+
+    def process(
+        self, samples: Iterable[VideoSample], batch_frames: int = 1, display: bool = True
+    ) -> Iterator[list[VideoOutput]]:
+        """
+        Runs the captures on the first frame of each run of identical frames,
+        and yields the outputs by batches (see `process_samples`)
+
+        Outputs are given back as soon as they are known: a batch of first
+        frames is processed early when a duplicate frame comes, so that long
+        runs don't hold anything back.
+
+        Args:
+            - samples:      Sampled frames, in time order (e.g. a `VideoSampler`)
+            - batch_frames: Number of frames read with a single OCR call
+            - display:      Whether to display the outputs (see `Captures.update`)
+        Returns:
+            Outputs of the first frame of each run, and of its duplicate frames
+            (with `BOUNDARIES`, only the last one, holding all the outputs read
+            during the run). Batches can be empty while a run goes on.
+        """
+        if self._policy == DuplicateFrames.PROCESS:
+            yield from process_samples(samples, self._captures, batch_frames, display)
+            return
+
+        areas = [area[1:] for area in self._captures.get_grab_areas()]
+        pending = []  # first frames of runs waiting to be processed
+        run_outputs = {}  # outputs read during the current run (key: capture name)
+        held = None  # last duplicate of the current run not given back yet (BOUNDARIES)
+        last_fingerprint = None
+
+        def __process_pending() -> list[VideoOutput]:
+            nonlocal run_outputs
+            outputs = [
+                output
+                for batch in process_samples(pending, self._captures, len(pending), display)
+                for output in batch
+            ]
+            pending.clear()
+            run_outputs = dict(outputs[-1][0])
+
+            return outputs
+
+        def __copy_outputs(frame: np.ndarray, t: float) -> dict:
+            due = self._captures.get_due(t)
+            missing = [name for name in due if name not in run_outputs]
+
+            if len(missing) > 0:
+                run_outputs.update(self._captures.update(frame, display, names=missing))
+            else:
+                self.duplicate_count += 1
+
+            return {name: run_outputs[name] for name in due if name in run_outputs}
+
+        for frame, t, frame_idx in samples:
+            fingerprint = get_fingerprint(frame, areas, self._cell_size, self._step)
+            is_duplicate = fingerprint == last_fingerprint
+            last_fingerprint = fingerprint
+            self.frame_count += 1
+            self.last_frame = frame_idx
+            outputs = []
+
+            if not is_duplicate:
+                if held is not None:
+                    outputs.append(held)  # end of the previous run
+                    held = None
+
+                pending.append((frame, t, frame_idx))
+
+                if len(pending) >= batch_frames:
+                    outputs += __process_pending()
+            else:
+                if len(pending) > 0:
+                    outputs += __process_pending()
+
+                output = __copy_outputs(frame, t)
+
+                if self._policy == DuplicateFrames.BOUNDARIES:
+                    held = (dict(run_outputs), t, frame_idx)
+                else:
+                    outputs.append((output, t, frame_idx))
+
+            if len(outputs) > 0 or is_duplicate:
+                yield outputs
+
+        outputs = [held] if held is not None else []
+
+        if len(pending) > 0:
+            outputs += __process_pending()
+
+        if len(outputs) > 0:
+            yield outputs
+
+    def get_summary(self) -> str:
+        """
+        Returns a human readable summary of the OCR work removed
+        """
+        return get_duplicate_summary(self.frame_count, self.duplicate_count)
+
+
+def get_duplicate_summary(frame_count: int, duplicate_count: int) -> str:
+    """
+    Returns a human readable summary of the OCR work removed by skipping
+    duplicate frames
+    """
+    rate = duplicate_count / frame_count if frame_count > 0 else 0.0
+
+    return (
+        f"{duplicate_count} of {frame_count} sampled frames were duplicates "
+        f"({rate:.0%} of the OCR runs removed)"
+    )
@@ -0,0 +1,162 @@
+"""
+Index of the frames of a video (timestamps and keyframes), cached on disk
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+import cv2
+import hashlib
+import numpy as np
+import os
+
+
+class FrameIndex:
+    """
+    Timestamp of each frame of a video, and the keyframes decoding can start from
+
+    The index is built by demuxing the video without decoding it, which only
+    takes a fraction of a second per hour of video. It gives exact frame
+    counts and timestamps, and the cost of a seek: the decoder has to start
+    from the last keyframe before the requested frame.
+    """
+
+    def __init__(self, timestamps: np.ndarray, keyframes: np.ndarray):
+        """
+        Args:
+            - timestamps: Timestamp of each frame, in presentation order (s)
+            - keyframes:  Sorted numbers of the keyframes (starting at 0)
+        """
+        self._timestamps = timestamps
+        self._keyframes = keyframes
+
+    @staticmethod
+    def build(video_path: str) -> "FrameIndex | None":
+        """
+        Builds the index of a video, returns None if the video can't be demuxed
+        (only possible with the FFmpeg backend of OpenCV)
+        """
+        if not hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME"):
+            return None
+
+        # With the raw format, grab only reads the packets without decoding them
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+
+        if not cap.isOpened():
+            return None
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        timestamps = []
+        is_keyframe = []
+
+        while cap.grab():
+            timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0)
+            is_keyframe.append(bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME)))
+
+        cap.release()
+
+        if len(timestamps) == 0:
+            return None
+
+        timestamps = np.array(timestamps, np.float64)
+        is_keyframe = np.array(is_keyframe, bool)
+
+        is_valid = np.all(np.isfinite(timestamps)) and (
+            len(timestamps) == 1 or np.any(timestamps != 0.0)
+        )
+
+        if not is_valid:
+            if fps <= 0:
+                return None
+
+            timestamps = np.arange(len(timestamps)) / fps
+
+        # Packets come in decoding order, frames are numbered in presentation order
+        order = np.argsort(timestamps, kind="stable")
+        timestamps = timestamps[order]
+        keyframes = np.flatnonzero(is_keyframe[order])
+
+        if len(keyframes) == 0 or keyframes[0] != 0:
+            keyframes = np.concatenate([[0], keyframes])
+
+        return FrameIndex(timestamps, keyframes)
+
+    @staticmethod
+    def load(video_path: str, cache_dir: str) -> "FrameIndex | None":
+        """
+        Returns the index of a video from the cache directory, building and
+        caching it if needed (None if it can't be built)
+
+        Cached indices are named after the path, size and modification time of
+        the video, so that they are rebuilt if the video changes.
+        """
+        try:
+            stat = os.stat(video_path)
+        except OSError:
+            return None
+
+        key = f"{os.path.abspath(video_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        name = os.path.splitext(os.path.basename(video_path))[0]
+        cache_path = os.path.join(
+            cache_dir, f"{name}.{hashlib.sha1(key.encode()).hexdigest()[:16]}.npz"
+        )
+
+        try:
+            with np.load(cache_path, allow_pickle=False) as data:
+                return FrameIndex(data["timestamps"], data["keyframes"])
+        except (OSError, KeyError, ValueError):
+            pass
+
+        index = FrameIndex.build(video_path)
+
+        if index is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                index.save(cache_path)
+            except OSError as e:
+                print(f"[FrameIndex] ERROR: couldn't cache the index at {cache_path}")
+                print(e)
+
+        return index
+
+    def save(self, path: str):
+        """
+        Saves the index in a NumPy archive
+        """
+        tmp_path = path + ".tmp.npz"  # replaced at once, never read partially
+        np.savez_compressed(tmp_path, timestamps=self._timestamps, keyframes=self._keyframes)
+        os.replace(tmp_path, path)
+
+    def get_frame_count(self) -> int:
+        return len(self._timestamps)
+
+    def get_duration(self) -> float:
+        """
+        Returns the timestamp of the last frame (s)
+        """
+        return float(self._timestamps[-1])
+
+    def get_time(self, frame: int) -> float:
+        """
+        Returns the timestamp of a frame (s)
+        """
+        return float(self._timestamps[min(max(frame, 0), len(self._timestamps) - 1)])
+
+    def get_frame(self, t: float) -> int:
+        """
+        Returns the first frame shown at or after a given time (the frame count
+        if past the end)
+        """
+        return int(np.searchsorted(self._timestamps, t - 1e-6))
+
+    def get_keyframe(self, frame: int) -> int:
+        """
+        Returns the last keyframe at or before a given frame, from which it can
+        be decoded
+        """
+        idx = np.searchsorted(self._keyframes, max(frame, 0), "right") - 1
+        return int(self._keyframes[idx])
+
+    def get_keyframe_count(self) -> int:
+        return len(self._keyframes)
@@ -0,0 +1,532 @@
+"""
+Segments characters (glyphs) in a thresholded image, and classifies them by
+matching them against labelled templates
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+import cv2
+import numpy as np
+import os
+import threading
+
+
+GLYPH_SIZE = (16, 24)  # (width, height) of the normalised glyphs
+
+
+def segment_glyphs(img: np.ndarray, min_pixels: int = 3) -> list[np.ndarray]:
+    """
+    Splits a thresholded image into normalised glyphs, from left to right
+
+    The glyphs are separated by the columns without any foreground pixel, so
+    that characters made of several parts (e.g. seven-segment digits) are kept
+    whole. The foreground is assumed to be the minority colour.
+
+    Args:
+        - img:        Thresholded image (single channel)
+        - min_pixels: Minimum number of foreground pixels in a glyph (noise filter)
+    Returns:
+        List of glyphs, as flattened float32 arrays (see `normalise_glyph`)
+    """
+    binary = np.asarray(img) > 127
+
+    if binary.ndim == 3:
+        binary = binary[:, :, 0]
+
+    if binary.mean() > 0.5:
+        binary = ~binary
+
+    # Only keep the rows containing text
+    rows = np.flatnonzero(binary.any(axis=1))
+
+    if len(rows) == 0:
+        return []
+
+    line = binary[rows[0] : rows[-1] + 1]
+
+    # Find the runs of columns containing text
+    columns = np.concatenate(([0], line.any(axis=0).astype(np.int8), [0]))
+    edges = np.diff(columns)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    glyphs = []
+
+    for start, end in zip(starts, ends):
+        crop = line[:, start:end]
+
+        if np.count_nonzero(crop) < min_pixels:
+            continue
+
+        glyphs.append(normalise_glyph(crop))
+
+    return glyphs
+
+
+def normalise_glyph(crop: np.ndarray) -> np.ndarray:
+    """
+    Resizes a glyph to `GLYPH_SIZE`, keeping its position in the text line
+
+    The crop spans the whole height of the text line, and is centered in a
+    canvas at least as wide as a standard character, so that narrow glyphs
+    (1, dot, dash) keep their shape.
+    """
+    h, w = crop.shape
+    canvas_w = max(w, int(round(h * GLYPH_SIZE[0] / GLYPH_SIZE[1])))
+    canvas = np.zeros((h, canvas_w), dtype=np.uint8)
+    offset = (canvas_w - w) // 2
+    canvas[:, offset : offset + w] = crop * np.uint8(255)
+
+    glyph = cv2.resize(canvas, GLYPH_SIZE, interpolation=cv2.INTER_AREA)
+
+    return glyph.astype(np.float32).ravel()
+
+
+class GlyphSet:
+    """
+    Set of labelled glyphs, used as templates to classify new glyphs
+
+    Glyphs are compared with normalised cross-correlation (all at once, with a
+    single matrix product), and take the label of the best matching template.
+    """
+
+    def __init__(self, max_samples_per_label: int = 20):
+        self._max_samples = max_samples_per_label  # samples kept for each label
+        self._labels: list[str] = []  # label of each template
+        self._glyphs: list[np.ndarray] = []  # raw normalised glyph of each template
+        self._templates = (  # normalised templates matrix and labels (swapped at once)
+            np.zeros((0, GLYPH_SIZE[0] * GLYPH_SIZE[1]), np.float32),
+            np.array([], dtype="<U1"),
+        )
+        self._version = 0  # incremented each time the templates change
+        self._lock = threading.Lock()
+
+    def add_sample(self, img: np.ndarray, text: str) -> bool:
+        """
+        Learns the glyphs of a thresholded image, given the text it contains
+
+        Returns whether it succeeded (the number of segmented glyphs has to
+        match the number of characters)
+        """
+        text = text.replace(" ", "")
+        glyphs = segment_glyphs(img)
+
+        if len(glyphs) != len(text) or len(text) == 0:
+            print(
+                f"[GlyphSet] Found {len(glyphs)} glyphs for {len(text)} characters, cancelling"
+            )
+            return False
+
+        with self._lock:
+            for char, glyph in zip(text, glyphs):
+                self._add_glyph(char, glyph)
+
+            self._update_matrix()
+
+        return True
+
+    def add_glyphs(self, labels: list[str], glyphs: list[np.ndarray]):
+        """
+        Adds already segmented and normalised glyphs
+        """
+        with self._lock:
+            for char, glyph in zip(labels, glyphs):
+                self._add_glyph(char, glyph)
+
+            self._update_matrix()
+
+    def classify(self, glyphs: list[np.ndarray], min_score: float = 0.5) -> str:
+        """
+        Returns the text made of the best matching label for each glyph
+
+        Glyphs whose best correlation score is below `min_score` are read as "?".
+        """
+        return self.classify_with_confidence(glyphs, min_score)[0]
+
+    def classify_with_confidence(
+        self, glyphs: list[np.ndarray], min_score: float = 0.5
+    ) -> tuple[str, float | None]:
+        """
+        Same as `classify`, but also returns the lowest correlation score of the
+        glyphs (scaled between 0 and 100, None if nothing was classified)
+        """
+        matrix, labels = self._templates
+
+        if len(glyphs) == 0 or len(labels) == 0:
+            return "", None
+
+        scores = self._normalise(np.stack(glyphs)) @ matrix.T
+        best = np.argmax(scores, axis=1)
+        best_scores = scores[np.arange(len(best)), best]
+        chars = np.where(best_scores >= min_score, labels[best], "?")
+        confidence = 100.0 * max(0.0, float(best_scores.min()))
+
+        return "".join(chars), confidence
+
+    def is_empty(self) -> bool:
+        return len(self._labels) == 0
+
+    def get_version(self) -> int:
+        """
+        Returns a number changing each time the templates change
+        """
+        return self._version
+
+    def get_samples(self) -> tuple[list[str], list[np.ndarray]]:
+        """
+        Returns the labels and normalised glyphs of all templates
+        """
+        with self._lock:
+            return list(self._labels), list(self._glyphs)
+
+    def clear(self):
+        """
+        Removes all templates
+        """
+        with self._lock:
+            self._labels = []
+            self._glyphs = []
+            self._update_matrix()
+
+    def save(self, path: str):
+        """
+        Saves the templates in a NumPy archive
+        """
+        with self._lock:
+            np.savez_compressed(
+                path,
+                labels=np.array(self._labels, dtype="<U1"),
+                glyphs=np.array(self._glyphs, dtype=np.float32).reshape(
+                    len(self._glyphs), -1
+                ),
+            )
+
+        print(f"[GlyphSet] Saved {len(self._labels)} glyphs at {path}")
+
+    def load(self, path: str) -> bool:
+        """
+        Replaces the templates by the ones saved at the given path
+
+        Returns whether it succeeded
+        """
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                labels = [str(label) for label in data["labels"]]
+                glyphs = [glyph for glyph in data["glyphs"]]
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[GlyphSet] ERROR: couldn't load glyphs from {path}")
+            print(e)
+            return False
+
+        if any(len(glyph) != GLYPH_SIZE[0] * GLYPH_SIZE[1] for glyph in glyphs):
+            print(f"[GlyphSet] ERROR: invalid glyph size in {path}")
+            return False
+
+        with self._lock:
+            self._labels = labels
+            self._glyphs = glyphs
+            self._update_matrix()
+
+        return True
+
+    def _add_glyph(self, char: str, glyph: np.ndarray):
+        """
+        Adds a template, dropping the oldest one of the same label if needed
+        """
+        indices = [k for k, label in enumerate(self._labels) if label == char]
+
+        if len(indices) >= self._max_samples:
+            del self._labels[indices[0]]
+            del self._glyphs[indices[0]]
+
+        self._labels.append(char)
+        self._glyphs.append(glyph)
+
+    def _update_matrix(self):
+        """
+        Rebuilds the matrix of normalised templates used for classification
+        """
+        if len(self._glyphs) > 0:
+            matrix = self._normalise(np.stack(self._glyphs))
+        else:
+            matrix = np.zeros((0, GLYPH_SIZE[0] * GLYPH_SIZE[1]), np.float32)
+
+        self._templates = (matrix, np.array(self._labels, dtype="<U1"))
+        self._version += 1
+
+    @staticmethod
+    def _normalise(glyphs: np.ndarray) -> np.ndarray:
+        """
+        Centers and normalises each row, so that dot products are correlations
+        """
+        glyphs = glyphs - glyphs.mean(axis=1, keepdims=True)
+        norms = np.linalg.norm(glyphs, axis=1, keepdims=True)
+
+        return glyphs / np.maximum(norms, 1e-6)
+
+
+class GlyphClassifier:
+    """
+    Classifies glyphs with an OpenCV k-nearest neighbours model, trained on
+    labelled glyphs
+
+    The samples can come from user corrections, or from the confident outputs
+    of a slower OCR engine. The model is retrained lazily when samples change.
+    """
+
+    def __init__(
+        self,
+        k: int = 3,
+        max_samples_per_label: int = 200,
+        min_samples_per_label: int = 3,
+        required_labels: str = "0123456789",
+    ):
+        self._k = k  # number of neighbours
+        self._max_samples = max_samples_per_label  # samples kept for each label
+        self._min_samples = min_samples_per_label  # samples needed to be ready
+        self._required_labels = required_labels  # labels needed to be ready
+        self._labels: list[str] = []  # label of each sample
+        self._glyphs: list[np.ndarray] = []  # normalised glyph of each sample
+        self._counts: dict[str, int] = {}  # number of samples of each label
+        self._model = None  # trained model (None if not trained yet)
+        self._model_samples = 0  # number of samples of the model
+        self._is_dirty = False  # whether samples changed since the last training
+        self._version = 0  # incremented each time the samples change
+        self._lock = threading.Lock()
+
+    def add_sample(self, img: np.ndarray, text: str) -> bool:
+        """
+        Segments a thresholded image and learns its glyphs, given its text
+
+        Returns whether it succeeded (the number of segmented glyphs has to
+        match the number of characters)
+        """
+        return self.add_glyphs(text, segment_glyphs(img))
+
+    def add_glyphs(self, text: str, glyphs: list[np.ndarray]) -> bool:
+        """
+        Learns already segmented glyphs, given their text
+
+        Returns whether it succeeded (the number of glyphs has to match the
+        number of characters)
+        """
+        text = text.replace(" ", "")
+
+        if len(glyphs) != len(text) or len(text) == 0:
+            return False
+
+        with self._lock:
+            for char, glyph in zip(text, glyphs):
+                indices = [k for k, label in enumerate(self._labels) if label == char]
+
+                if len(indices) >= self._max_samples:
+                    del self._labels[indices[0]]
+                    del self._glyphs[indices[0]]
+                    self._counts[char] -= 1
+
+                self._labels.append(char)
+                self._glyphs.append(glyph)
+                self._counts[char] = self._counts.get(char, 0) + 1
+
+            self._is_dirty = True
+            self._version += 1
+
+        return True
+
+    def is_ready(self) -> bool:
+        """
+        Whether enough samples were collected for all required labels
+        """
+        with self._lock:
+            return all(
+                self._counts.get(label, 0) >= self._min_samples
+                for label in self._required_labels
+            )
+
+    def classify(self, glyphs: list[np.ndarray]) -> str:
+        """
+        Returns the text made of the predicted label of each glyph
+        """
+        return self.classify_with_confidence(glyphs)[0]
+
+    def classify_with_confidence(
+        self, glyphs: list[np.ndarray]
+    ) -> tuple[str, float | None]:
+        """
+        Same as `classify`, but also returns a confidence between 0 and 100
+
+        It is the lowest ratio of neighbours agreeing with the predicted label
+        among the glyphs.
+        """
+        model, sample_count = self._get_model()
+
+        if len(glyphs) == 0 or model is None:
+            return "", None
+
+        samples = np.stack(glyphs).astype(np.float32) / 255.0
+        _, results, neighbours, _ = model.findNearest(samples, min(self._k, sample_count))
+        agreement = np.mean(neighbours == results, axis=1)
+        confidence = 100.0 * float(agreement.min())
+
+        return "".join(chr(int(code)) for code in results.ravel()), confidence
+
+    def get_version(self) -> int:
+        """
+        Returns a number changing each time the samples or the model change
+        """
+        return self._version
+
+    def is_empty(self) -> bool:
+        return len(self._labels) == 0
+
+    def clear(self):
+        """
+        Removes all samples
+        """
+        with self._lock:
+            self._labels = []
+            self._glyphs = []
+            self._counts = {}
+            self._model = None
+            self._is_dirty = False
+            self._version += 1
+
+    def save(self, path: str):
+        """
+        Saves the samples in a NumPy archive (the model is retrained when loaded)
+        """
+        with self._lock:
+            np.savez_compressed(
+                path,
+                labels=np.array(self._labels, dtype="<U1"),
+                glyphs=np.array(self._glyphs, dtype=np.float32).reshape(
+                    len(self._glyphs), -1
+                ),
+            )
+
+        print(f"[GlyphClassifier] Saved {len(self._labels)} samples at {path}")
+
+    def load(self, path: str) -> bool:
+        """
+        Replaces the samples by the ones saved at the given path
+
+        Returns whether it succeeded
+        """
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                labels = [str(label) for label in data["labels"]]
+                glyphs = [glyph for glyph in data["glyphs"]]
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[GlyphClassifier] ERROR: couldn't load samples from {path}")
+            print(e)
+            return False
+
+        if any(len(glyph) != GLYPH_SIZE[0] * GLYPH_SIZE[1] for glyph in glyphs):
+            print(f"[GlyphClassifier] ERROR: invalid glyph size in {path}")
+            return False
+
+        with self._lock:
+            self._labels = labels
+            self._glyphs = glyphs
+            self._counts = {}
+
+            for label in labels:
+                self._counts[label] = self._counts.get(label, 0) + 1
+
+            self._is_dirty = True
+            self._version += 1
+
+        return True
+
+    def _get_model(self):
+        """
+        Returns the trained model and its number of samples, retraining it
+        first if samples changed
+        """
+        with self._lock:
+            if self._is_dirty:
+                self._train()
+
+            return self._model, self._model_samples
+
+    def _train(self):
+        """
+        Trains the model on all samples (the lock has to be held)
+        """
+        self._is_dirty = False
+
+        if len(self._labels) == 0:
+            self._model = None
+            return
+
+        samples = np.stack(self._glyphs).astype(np.float32) / 255.0
+        responses = np.array([ord(label) for label in self._labels], dtype=np.float32)
+
+        model = cv2.ml.KNearest_create()
+        model.setDefaultK(self._k)
+        model.train(samples, cv2.ml.ROW_SAMPLE, responses.reshape(-1, 1))
+
+        self._model = model
+        self._model_samples = len(self._labels)
+
+
+_glyph_set = GlyphSet()
+_glyph_classifier = GlyphClassifier()
+
+
+def get_glyph_set() -> GlyphSet:
+    """
+    Returns the glyph set shared by the whole process
+    """
+    return _glyph_set
+
+
+def get_glyph_classifier() -> GlyphClassifier:
+    """
+    Returns the glyph classifier shared by the whole process
+    """
+    return _glyph_classifier
+
+
+def save_shared_glyphs(directory: str) -> tuple[str | None, str | None]:
+    """
+    Saves the glyph set and classifier of this process for worker processes
+    (see `load_shared_glyphs`), and returns their paths (None if empty)
+
+    The file names contain the versions of the glyphs, so that workers can
+    tell from the paths whether they changed.
+    """
+    glyph_set_path = None
+    glyph_classifier_path = None
+
+    if not _glyph_set.is_empty():
+        glyph_set_path = os.path.join(directory, f"glyphs_{_glyph_set.get_version()}.npz")
+        _glyph_set.save(glyph_set_path)
+
+    if not _glyph_classifier.is_empty():
+        glyph_classifier_path = os.path.join(
+            directory, f"glyph_classifier_{_glyph_classifier.get_version()}.npz"
+        )
+        _glyph_classifier.save(glyph_classifier_path)
+
+    return glyph_set_path, glyph_classifier_path
+
+
+def load_shared_glyphs(paths: tuple[str | None, str | None]):
+    """
+    Replaces the glyph set and classifier of this process by the ones saved
+    with `save_shared_glyphs` (cleared if their path is None)
+    """
+    glyph_set_path, glyph_classifier_path = paths
+
+    if glyph_set_path is not None:
+        _glyph_set.load(glyph_set_path)
+    else:
+        _glyph_set.clear()
+
+    if glyph_classifier_path is not None:
+        _glyph_classifier.load(glyph_classifier_path)
+    else:
+        _glyph_classifier.clear()
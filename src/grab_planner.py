@@ -0,0 +1,168 @@
+"""
+Plans which regions of the screen to grab to cover the capture areas
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+import numpy as np
+from enum import Enum
+from typing import Tuple
+
+
+# Area of a monitor: [monitor index, x_min, y_min, x_max, y_max], in pixels relative
+# to the top left corner of the monitor (x along the rows, y along the columns,
+# bounds included). Monitors are indexed as by `mss` (1 is the main monitor).
+GrabArea = Tuple[int, int, int, int, int]
+
+
+class GrabMode(Enum):
+    """
+    How the regions to grab are planned from the capture areas
+    """
+    CLUSTERS = 1  # group close areas, so that few small regions are grabbed
+    UNION = 2  # a single region per monitor, containing all its areas
+
+
+def get_area_size(area: GrabArea) -> int:
+    """
+    Returns the number of pixels of an area
+    """
+    _, x_min, y_min, x_max, y_max = area
+    return max(0, x_max - x_min + 1) * max(0, y_max - y_min + 1)
+
+
+def merge_areas(area_1: GrabArea, area_2: GrabArea) -> GrabArea:
+    """
+    Returns the bounding box of two areas of the same monitor
+    """
+    return (
+        area_1[0],
+        min(area_1[1], area_2[1]),
+        min(area_1[2], area_2[2]),
+        max(area_1[3], area_2[3]),
+        max(area_1[4], area_2[4]),
+    )
+
+
+def plan_grab_regions(
+    areas: list[GrabArea], mode: GrabMode = GrabMode.CLUSTERS, grab_cost: int = 50000
+) -> list[GrabArea]:
+    """
+    Computes a small set of regions to grab, covering all the given areas
+
+    Args:
+        - areas:     Areas to cover
+        - mode:      How to group the areas
+        - grab_cost: Cost of an additional grab, in number of pixels. With
+                     clusters, two regions are merged if it adds less pixels.
+    Returns:
+        Regions to grab, each area is fully contained in one of them
+    """
+    regions = [area for area in areas if get_area_size(area) > 0]
+
+    if mode == GrabMode.UNION:
+        unions = {}
+
+        for region in regions:
+            monitor = region[0]
+            unions[monitor] = (
+                merge_areas(unions[monitor], region) if monitor in unions else region
+            )
+
+        return list(unions.values())
+
+    # Greedily merge the two regions adding the least pixels, until it isn't worth it
+    while True:
+        best_pair = None
+        best_cost = grab_cost
+
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                if regions[i][0] != regions[j][0]:
+                    continue
+
+                cost = (
+                    get_area_size(merge_areas(regions[i], regions[j]))
+                    - get_area_size(regions[i])
+                    - get_area_size(regions[j])
+                )
+
+                if cost <= best_cost:
+                    best_pair = (i, j)
+                    best_cost = cost
+
+        if best_pair is None:
+            return regions
+
+        i, j = best_pair
+        regions[i] = merge_areas(regions[i], regions[j])
+        del regions[j]
+
+
+class RegionFrame:
+    """
+    Frame made of regions grabbed from the screen, which can be sliced with
+    monitor coordinates like a full screen image
+    """
+
+    def __init__(self):
+        self._regions: list[Tuple[GrabArea, np.ndarray]] = []  # grabbed area and its image
+
+    def add_region(self, area: GrabArea, img: np.ndarray):
+        """
+        Adds a grabbed region, given its area and image
+        """
+        self._regions.append((area, img))
+
+    def get_regions(self) -> list[Tuple[GrabArea, np.ndarray]]:
+        return self._regions
+
+    def locate(self, area: GrabArea) -> Tuple[int, Tuple[int, int, int, int]] | None:
+        """
+        Finds the region best covering an area
+
+        Returns the index of the region and the area in the region image
+        [x_min, y_min, x_max, y_max] (clipped to the region), or None if no
+        region overlaps the area
+        """
+        monitor, x_min, y_min, x_max, y_max = area
+        best = None
+        best_size = 0
+
+        for k, ((region_monitor, rx_min, ry_min, rx_max, ry_max), _) in enumerate(
+            self._regions
+        ):
+            if region_monitor != monitor:
+                continue
+
+            clipped = (
+                max(x_min, rx_min) - rx_min,
+                max(y_min, ry_min) - ry_min,
+                min(x_max, rx_max) - rx_min,
+                min(y_max, ry_max) - ry_min,
+            )
+            size = get_area_size((monitor,) + clipped)
+
+            if size > best_size:
+                best = (k, clipped)
+                best_size = size
+
+        return best
+
+    def slice(self, area: GrabArea) -> np.ndarray:
+        """
+        Returns the image of an area (empty if it wasn't grabbed)
+        """
+        location = self.locate(area)
+
+        if location is None:
+            return np.zeros((0, 0, 3), np.uint8)
+
+        k, (x_min, y_min, x_max, y_max) = location
+        return self._regions[k][1][x_min : x_max + 1, y_min : y_max + 1]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(img.nbytes for _, img in self._regions)
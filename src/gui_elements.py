@@ -145,6 +145,30 @@ class TkImage2:
         return self._canvas
 
 
+class CapturePreview:
+    """
+    Displays the outputs of a capture: its processed image and output text
+    """
+
+    def __init__(self, master: ctk.CTkBaseClass):
+        self._output_img = TkImage2(master)  # displayed output image
+        self._output_txt = ctk.CTkLabel(master, text="-")
+
+    def update(self, text: str, img: np.ndarray | None):
+        """
+        Updates the displayed image and text
+        """
+        self._output_img.update(img)
+        self._output_txt.configure(text=text)
+
+    def display(self, column_idx: int):
+        """
+        Adds the output image and text to the root widget
+        """
+        self._output_img.get_tk_canvas().grid(row=0, column=column_idx, sticky="nsew")
+        self._output_txt.grid(row=1, column=column_idx, sticky="nsew")
+
+
 class RectangleSelectionWindow(ctk.CTkToplevel):
     """
     Used to select a screen area with the mouse
@@ -6,13 +6,19 @@ Year:    2024
 License: Apache 2.0
 """
 
+from src.glyphs import get_glyph_set, get_glyph_classifier, segment_glyphs
 from cv2.typing import MatLike
 import cv2
-from PIL import Image
 import numpy as np
 from copy import deepcopy
 from typing import Tuple
 from enum import Enum
+from functools import lru_cache
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import hashlib
+import sys
 
 import os
 
@@ -20,6 +26,138 @@ import os
 class OcrMethod(Enum):
     TESSERACT = 1
     EASY_OCR = 2
+    TEMPLATE = 3
+    CLASSIFIER = 4
+    CASCADE = 5
+    TESSERACT_MONTAGE = 6
+    TESSERACT_FULL_FRAME = 7
+
+
+OcrResult = Tuple[str, float | None]  # raw output and confidence (0-100, None if unknown)
+
+# Name of each OCR method, as displayed in the GUI and saved in the settings
+OCR_METHOD_NAMES = {
+    "Tesseract": OcrMethod.TESSERACT,
+    "Tesseract (montage)": OcrMethod.TESSERACT_MONTAGE,
+    "Tesseract (full frame)": OcrMethod.TESSERACT_FULL_FRAME,
+    "EasyOcr": OcrMethod.EASY_OCR,
+    "Template": OcrMethod.TEMPLATE,
+    "Classifier": OcrMethod.CLASSIFIER,
+    "Cascade": OcrMethod.CASCADE,
+}
+
+
+def with_alpha(img: np.ndarray) -> np.ndarray:
+    """
+    Returns a BGRA view of a BGR view of BGRA memory (e.g. a sliced screenshot,
+    see `ScreenGrabber`), without copying it. Other images are returned as is.
+
+    OpenCV and Tesseract can't use the BGR view without a copy (its pixels are
+    4 bytes apart), but can use the BGRA one directly.
+    """
+    if img.ndim == 3 and img.shape[2] == 3 and img.strides[1:] == (4, 1):
+        return np.lib.stride_tricks.as_strided(
+            img, img.shape[0:2] + (4,), img.strides, writeable=False
+        )
+
+    return img
+
+
+def to_gray(img: np.ndarray, dst: np.ndarray | None = None) -> np.ndarray:
+    """
+    Converts a BGR, BGRA or grey image to grey, reading views of screenshots
+    directly (see `with_alpha`)
+
+    Args:
+        - img: Image to convert
+        - dst: Optional buffer where to write the result
+    """
+    if img.ndim == 2:
+        if dst is None:
+            return img
+
+        np.copyto(dst, img)
+        return dst
+
+    img = with_alpha(img)
+    code = cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+
+    return cv2.cvtColor(img, code, dst=dst)
+
+
+class OcrCache:
+    """
+    Bounded LRU cache of OCR results, indexed by a hash of the pre-processed
+    image (see `BaseOcrEngine.cache_key`)
+
+    The least recently used outputs are evicted when the estimated memory used
+    by the cache exceeds a given size.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024):
+        self._max_bytes = max_bytes  # maximum estimated size of the cache
+        self._entries: OrderedDict[bytes, OcrResult] = OrderedDict()  # from LRU to MRU
+        self._bytes = 0  # estimated size of the stored entries
+        self._lock = threading.Lock()
+        self.hits = 0  # number of successful lookups
+        self.misses = 0  # number of failed lookups
+
+    def get(self, key: bytes) -> OcrResult | None:
+        """
+        Returns the cached result for the given key (None if not cached)
+        """
+        with self._lock:
+            output = self._entries.get(key)
+
+            if output is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+            return output
+
+    def put(self, key: bytes, output: OcrResult):
+        """
+        Stores a result, evicting the least recently used ones if needed
+        """
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entry_size(key, self._entries.pop(key))
+
+            self._entries[key] = output
+            self._bytes += self._entry_size(key, output)
+
+            while self._bytes > self._max_bytes and len(self._entries) > 0:
+                old_key, old_output = self._entries.popitem(last=False)
+                self._bytes -= self._entry_size(old_key, old_output)
+
+    def clear(self):
+        """
+        Removes all the entries (the counters are kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        """
+        Returns the hit/miss counters and the size of the cache
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    @staticmethod
+    def _entry_size(key: bytes, output: OcrResult) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(output) + sys.getsizeof(output[0])
 
 
 class BaseOcrEngine:
@@ -34,9 +172,14 @@ class BaseOcrEngine:
         unsharp_kernel_size: int = 5  # Kernel size for the unsharp filter
         unsharp_sigma: float = 1.0  # Gaussian filter std for the unsharp filter
         unsharp_amount: float = 1.0  # Unsharpening ratio
+        fast_mode: bool = False  # Grayscale uint8 pipeline writing into scratch buffers
 
     def __init__(self):
         self._config = self.PreProcessConfig()
+        self._buffers: dict[str, np.ndarray] = {}  # scratch buffers for the fast mode
+        self._cache = OcrCache()  # OCR outputs of already seen pre-processed images
+        self._cache_salt = b""  # identifies the engine and its config in cache keys
+        self._update_cache_salt()
 
     def set_pre_process_config(self, config: PreProcessConfig):
         """
@@ -53,6 +196,8 @@ class BaseOcrEngine:
             config.upscale_ratio = self._config.upscale_ratio
 
         self._config = deepcopy(config)
+        self._update_cache_salt()
+        self._cache.clear()
 
     def get_pre_process_config(self) -> PreProcessConfig:
         """
@@ -70,11 +215,128 @@ class BaseOcrEngine:
             - The output given by OCR
             - The preprocessed image used for OCR
         """
-        img = self._preprocess_img(raw_img)
-        raw_output = self._ocr(img)
+        raw_output, _, img = self.process_with_confidence(raw_img)
 
         return raw_output, img
 
+    def process_with_confidence(
+        self, raw_img: np.ndarray
+    ) -> Tuple[str, float | None, np.ndarray]:
+        """
+        Same as `process`, but also returns the confidence of the OCR output
+        (between 0 and 100, None if the engine can't provide it)
+        """
+        img = self.preprocess(raw_img)
+        raw_output, confidence = self._cached_ocr(img)
+
+        return raw_output, confidence, img
+
+    def preprocess(self, raw_img: np.ndarray) -> MatLike:
+        """
+        Prepares a raw image for OCR, according to the pre-processing config
+        """
+        if self._config.fast_mode:
+            return self._preprocess_img_fast(raw_img)
+        else:
+            return self._preprocess_img(raw_img)
+
+    def supports_batch(self) -> bool:
+        """
+        Whether `ocr_batch` processes several images in a single OCR call
+        """
+        return False
+
+    def ocr_batch(self, imgs: list[MatLike]) -> list[OcrResult]:
+        """
+        Runs OCR on several pre-processed images (for example coming from
+        different captures), and returns the raw outputs and their confidence
+        in the same order
+
+        Engines able to batch the inference should override it (and
+        `supports_batch`). By default, the images are read one by one.
+        """
+        return [self.ocr_with_confidence(img) for img in imgs]
+
+    def ocr_with_confidence(self, img: MatLike) -> OcrResult:
+        """
+        Reads a pre-processed image, and returns the raw output along with its
+        confidence (between 0 and 100, None if the engine can't provide it)
+
+        Engines able to estimate their confidence should override it.
+        """
+        return self._ocr(img), None
+
+    def supports_full_frame(self) -> bool:
+        """
+        Whether `ocr_full_frame` reads the raw areas without pre-processing them
+        (so that the full frame can be given at once to the OCR engine)
+        """
+        return False
+
+    def ocr_full_frame(
+        self, screen_img: np.ndarray, areas: list[Tuple[int, int, int, int]]
+    ) -> list[OcrResult]:
+        """
+        Runs OCR on several areas of a full frame
+
+        Args:
+            - screen_img: Full screen image
+            - areas:      [x_min, y_min, x_max, y_max] of each area (x along rows)
+        Returns:
+            The raw outputs and their confidence, in the same order
+
+        By default, each area is sliced, pre-processed and read separately.
+        """
+        return [
+            self.ocr_with_confidence(
+                self.preprocess(screen_img[x_min : x_max + 1, y_min : y_max + 1])
+            )
+            for x_min, y_min, x_max, y_max in areas
+        ]
+
+    def get_cache(self) -> OcrCache:
+        """
+        Returns the cache of OCR outputs of this engine
+        """
+        return self._cache
+
+    def cache_key(self, img: MatLike) -> bytes:
+        """
+        Returns the key of a pre-processed image in the OCR cache: a hash of its
+        pixels, the engine type and the pre-processing config
+        """
+        img = np.ascontiguousarray(img)
+        h = hashlib.blake2b(self._cache_salt, digest_size=16)
+        h.update(str(img.shape).encode())
+        h.update(img.data)
+
+        return h.digest()
+
+    def _cached_ocr(self, img: MatLike) -> OcrResult:
+        """
+        Same as `ocr_with_confidence`, but returns the cached result if the image
+        was already read
+        """
+        key = self.cache_key(img)
+        output = self._cache.get(key)
+
+        if output is None:
+            output = self.ocr_with_confidence(img)
+            self._cache.put(key, output)
+
+        return output
+
+    def _update_cache_salt(self):
+        """
+        Updates the part of the cache keys depending on the engine and its config
+        """
+        config = [
+            (key, getattr(self._config, key))
+            for key in dir(self._config)
+            if key[0:2] != "__"
+        ]
+        self._cache_salt = f"{type(self).__name__}{config}".encode()
+
     def _preprocess_img(self, raw_img: np.ndarray) -> MatLike:
         """
         Prepares a raw image for OCR.
@@ -85,7 +347,7 @@ class BaseOcrEngine:
             - Sharpens the image (unsharp mask)
             - Thresholds the image (otsu)
         """
-        img = raw_img
+        img = np.ascontiguousarray(raw_img)  # the only copy of a screenshot view
 
         if self._config.invert_img:
             img = cv2.bitwise_not(img)
@@ -121,6 +383,73 @@ class BaseOcrEngine:
 
         return sharpened
 
+    def _preprocess_img_fast(self, raw_img: np.ndarray) -> MatLike:
+        """
+        Same as `_preprocess_img`, but converts the image to grayscale first and
+        stays in uint8, writing every step into preallocated scratch buffers.
+
+        The buffers are owned by the engine and only reallocated when the size
+        of the capture area or the upscale ratio change. The returned image is
+        one of these buffers: it is overwritten at the next call. The raw image
+        isn't copied, even if it is a view of a screenshot.
+
+        Resizing and blurring are linear, so converting to grayscale first only
+        changes the result through intermediate rounding and the clamping of the
+        sharpened image (done per channel in the default mode). On readable
+        captures (at least 96 grey levels between text and background), less
+        than 0.1% of the pixels differ between both modes on average after
+        thresholding, and less than 0.5% on any capture, mostly on the edges of
+        the characters (see `tests/test_ocr_fast_mode.py`). Captures with less
+        contrast can differ much more.
+        """
+        shape = np.shape(raw_img)
+        new_shape = (
+            int(shape[1] * self._config.upscale_ratio),
+            int(shape[0] * self._config.upscale_ratio),
+        )
+
+        gray = self._get_buffer("gray", shape[0:2])
+        upscaled = self._get_buffer("upscaled", (new_shape[1], new_shape[0]))
+        blurred = self._get_buffer("blurred", upscaled.shape)
+        output = self._get_buffer("output", upscaled.shape)
+
+        to_gray(raw_img, dst=gray)
+
+        if self._config.invert_img:
+            cv2.bitwise_not(gray, dst=gray)
+
+        cv2.resize(gray, new_shape, dst=upscaled, interpolation=cv2.INTER_LINEAR)
+
+        # Unsharp mask: saturated (1 + amount) * img - amount * blurred
+        amount = float(self._config.unsharp_amount)
+        cv2.GaussianBlur(
+            upscaled,
+            (self._config.unsharp_kernel_size,) * 2,
+            self._config.unsharp_sigma,
+            dst=blurred,
+        )
+        cv2.addWeighted(upscaled, 1.0 + amount, blurred, -amount, 0.0, dst=blurred)
+
+        cv2.threshold(
+            blurred, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU, dst=output
+        )
+
+        return output
+
+    def _get_buffer(self, name: str, shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        Returns the uint8 scratch buffer of the given name, reallocating it only
+        if its shape changed
+        """
+        shape = tuple(int(x) for x in shape)
+        buffer = self._buffers.get(name)
+
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            self._buffers[name] = buffer
+
+        return buffer
+
     def _ocr(self, img: MatLike) -> str:
         """
         Reads the portion of image, and returns the raw output
@@ -130,56 +459,683 @@ class BaseOcrEngine:
         return "???"
 
 
+class TesseractApiPool:
+    """
+    Process-wide pool of Tesseract API handles, shared by all Tesseract engines
+
+    The handles are created lazily, up to a maximum number. An OCR call checks a
+    handle out for the duration of the call, waiting if all of them are in use.
+
+    Long-lived worker threads can be pinned to the handle they used last: they
+    get it back whenever it is free, so that each of them keeps using the same
+    handle while the number of handles stays bounded.
+    """
+
+    def __init__(self, max_size: int = 1):
+        self._max_size = max(1, max_size)  # maximum number of handles
+        self._size = 0  # number of handles currently created
+        self._free_apis = []  # handles that are not checked out
+        self._condition = threading.Condition()
+        self._local = threading.local()  # handle last used by the current thread if pinned
+
+    def set_max_size(self, max_size: int):
+        """
+        Sets the maximum number of handles. Extra handles are freed when released.
+        """
+        with self._condition:
+            self._max_size = max(1, max_size)
+
+            while self._size > self._max_size and len(self._free_apis) > 0:
+                self._free_apis.pop().End()
+                self._size -= 1
+
+            self._condition.notify_all()
+
+    def get_max_size(self) -> int:
+        return self._max_size
+
+    def pin_current_thread(self):
+        """
+        Makes the `acquire` calls of the current thread prefer the handle it
+        used last, if it is free
+        """
+        self._local.is_pinned = True
+        self._local.api = None
+
+    def unpin_current_thread(self):
+        """
+        Forgets the handle preferred by the current thread (which stays in the
+        pool)
+        """
+        self._local.is_pinned = False
+        self._local.api = None
+
+    @contextmanager
+    def acquire(self):
+        """
+        Checks a handle out of the pool, to be used in a `with` statement
+        """
+        is_pinned = getattr(self._local, "is_pinned", False)
+        api = self._checkout(self._local.api if is_pinned else None)
+
+        try:
+            yield api
+        finally:
+            self._release(api)
+
+            if is_pinned:
+                self._local.api = api
+
+    def _checkout(self, preferred=None):
+        """
+        Returns a free handle (`preferred` if it is free), creating one if the
+        pool isn't full yet
+        """
+        with self._condition:
+            while len(self._free_apis) == 0 and self._size >= self._max_size:
+                self._condition.wait()
+
+            for k, api in enumerate(self._free_apis):
+                if api is preferred:
+                    return self._free_apis.pop(k)
+
+            if len(self._free_apis) > 0:
+                return self._free_apis.pop()
+
+            self._size += 1
+
+        try:
+            return self._create_api()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, api):
+        """
+        Gives a handle back to the pool (or frees it if the pool was shrunk)
+        """
+        with self._condition:
+            if self._size > self._max_size:
+                api.End()
+                self._size -= 1
+            else:
+                self._free_apis.append(api)
+
+            self._condition.notify()
+
+    @staticmethod
+    def _create_api():
+        """
+        Initialises a new Tesseract API handle
+        """
+        import tesserocr
+
+        api = tesserocr.PyTessBaseAPI(
+            path=get_tessdata_path(), psm=tesserocr.PSM.SINGLE_LINE
+        )
+        api.SetVariable("tessedit_char_whitelist", "0123456789.+-")
+
+        return api
+
+
+@lru_cache(maxsize=None)
+def get_tessdata_path() -> str:
+    """
+    Returns the path of the Tesseract data folder (only looked up once)
+    """
+    return (
+        os.popen("find /usr/share/tesseract-ocr -type d -name 'tessdata'")
+        .read()
+        .strip()
+    )
+
+
+_tesseract_api_pool = TesseractApiPool()
+
+
+def get_tesseract_api_pool() -> TesseractApiPool:
+    """
+    Returns the Tesseract API pool shared by the whole process
+    """
+    return _tesseract_api_pool
+
+
 class TesseractOcrEngine(BaseOcrEngine):
     """
     Uses Tesseract to extract digits from an image
+
+    The engine only holds the pre-processing configuration, the Tesseract API
+    handles are checked out of the shared pool for each OCR call.
     """
 
     def __init__(self):
         BaseOcrEngine.__init__(self)
 
+    def _ocr(self, img: MatLike) -> str:
+        """
+        Reads the portion of image, and returns the raw output
+        """
+        return self.ocr_with_confidence(img)[0]
+
+    def ocr_with_confidence(self, img: MatLike) -> OcrResult:
+        """
+        Reads the portion of image, and returns the raw output along with the
+        mean confidence given by Tesseract (between 0 and 100)
+        """
+        with get_tesseract_api_pool().acquire() as api:
+            self._set_image(api, img)
+            output = api.GetUTF8Text()
+            confidence = api.MeanTextConf()
+
+        return output.strip(), float(confidence)
+
+    @staticmethod
+    def _set_image(api, img: np.ndarray):
+        """
+        Gives an uint8 image (single channel, or with colour channels) to
+        Tesseract, straight from its buffer
+
+        This avoids any colour conversion and PIL image (which Tesseract would
+        receive encoded). The only copy is the one to the `bytes` object
+        required by tesserocr (views of screenshots are given with their alpha
+        channel, which Tesseract ignores).
+        """
+        img = with_alpha(img).astype(np.uint8, copy=False)
+        h, w = img.shape[0:2]
+        bytes_per_pixel = 1 if img.ndim == 2 else img.shape[2]
+        api.SetImageBytes(img.tobytes(), w, h, bytes_per_pixel, w * bytes_per_pixel)
+
+
+class TesseractMontageOcrEngine(TesseractOcrEngine):
+    """
+    Same as `TesseractOcrEngine`, but reads batches of images (e.g. from several
+    captures) with a single Tesseract call
+
+    The images are stacked in a padded montage, read in block layout mode, and
+    the recognised lines are mapped back to the images through their bounding
+    boxes. It removes the fixed overhead of each Tesseract call, which
+    dominates for short numeric fields.
+    """
+
+    def supports_batch(self) -> bool:
+        return True
+
+    def ocr_batch(self, imgs: list[MatLike]) -> list[OcrResult]:
+        """
+        Reads several pre-processed images with a single Tesseract call
+        """
+        if len(imgs) <= 1:
+            return [self.ocr_with_confidence(img) for img in imgs]
+
         import tesserocr
 
-        self._api = tesserocr.PyTessBaseAPI(
-            path=os.popen("find /usr/share/tesseract-ocr -type d -name 'tessdata'")
-            .read()
-            .strip(),
-            psm=tesserocr.PSM.SINGLE_LINE
+        montage, slots = self._build_montage(imgs)
+        texts: list[list[Tuple[int, str]]] = [[] for _ in imgs]  # (x, text) of each line
+        confidences: list[float | None] = [None] * len(imgs)
+        level = tesserocr.RIL.TEXTLINE
+
+        with get_tesseract_api_pool().acquire() as api:
+            try:
+                api.SetPageSegMode(tesserocr.PSM.SINGLE_BLOCK)
+                self._set_image(api, montage)
+                api.Recognize()
+                iterator = api.GetIterator()
+
+                for line in tesserocr.iterate_level(iterator, level):
+                    text = line.GetUTF8Text(level)
+                    box = line.BoundingBox(level)
+
+                    if text is None or box is None:
+                        continue
+
+                    # Assign the line to the closest image in the montage
+                    y_center = (box[1] + box[3]) / 2
+                    k = int(np.argmin([abs(y_center - (y0 + y1) / 2) for y0, y1 in slots]))
+                    texts[k].append((box[0], text.strip()))
+
+                    confidence = float(line.Confidence(level))
+                    if confidences[k] is None or confidence < confidences[k]:
+                        confidences[k] = confidence
+            finally:
+                api.SetPageSegMode(tesserocr.PSM.SINGLE_LINE)
+
+        return [
+            ("".join(text for _, text in sorted(texts[k])), confidences[k])
+            for k in range(len(imgs))
+        ]
+
+    @staticmethod
+    def _build_montage(imgs: list[MatLike]) -> Tuple[np.ndarray, list[Tuple[int, int]]]:
+        """
+        Stacks the images vertically, with black text on a white background,
+        all resized to the same height and separated by white padding
+
+        Returns the montage and the vertical span of each image in it
+        """
+        height = max(np.shape(img)[0] for img in imgs)
+        pad = max(10, height // 2)
+        resized = []
+
+        for img in imgs:
+            img = img if np.ndim(img) == 2 else img[:, :, 0]
+
+            if np.mean(img) < 127:
+                img = cv2.bitwise_not(img)
+
+            h, w = np.shape(img)
+            new_w = max(1, int(round(w * height / h)))
+            resized.append(
+                cv2.resize(img, (new_w, height), interpolation=cv2.INTER_NEAREST)
+            )
+
+        width = max(np.shape(img)[1] for img in resized) + 2 * pad
+        montage = np.full(
+            (len(resized) * (height + pad) + pad, width), 255, dtype=np.uint8
         )
-        self._api.SetVariable("tessedit_char_whitelist", "0123456789.+-")
+        slots = []
+        y = pad
 
-    def _ocr(self, img: MatLike) -> str:
+        for img in resized:
+            montage[y : y + height, pad : pad + np.shape(img)[1]] = img
+            slots.append((y, y + height))
+            y += height + pad
+
+        return montage, slots
+
+
+class TesseractFullFrameOcrEngine(TesseractOcrEngine):
+    """
+    Reads all captures of a frame by giving the full frame once to Tesseract,
+    and selecting each capture area with a rectangle
+
+    The pre-processing is skipped (Tesseract thresholds the raw areas itself),
+    so it is only suited for large and clean text, but it avoids any copy and
+    conversion of the areas.
+    """
+
+    def supports_full_frame(self) -> bool:
+        return True
+
+    def ocr_full_frame(
+        self, screen_img: np.ndarray, areas: list[Tuple[int, int, int, int]]
+    ) -> list[OcrResult]:
         """
-        Reads the portion of image, and returns the raw output
+        Runs OCR on several areas of a full frame, with a single SetImage call
         """
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(img_rgb)
-        self._api.SetImage(pil_img)
-        output = self._api.GetUTF8Text()
+        if len(areas) == 0:
+            return []
+
+        outputs = []
+        h, w = np.shape(screen_img)[0:2]
+
+        with get_tesseract_api_pool().acquire() as api:
+            self._set_image(api, screen_img)
+
+            for x_min, y_min, x_max, y_max in areas:
+                top, left = max(0, x_min), max(0, y_min)
+                bottom, right = min(h - 1, x_max), min(w - 1, y_max)
+
+                if bottom < top or right < left:
+                    outputs.append(("", None))
+                    continue
+
+                api.SetRectangle(left, top, right - left + 1, bottom - top + 1)
+                output = api.GetUTF8Text()
+                outputs.append((output.strip(), float(api.MeanTextConf())))
+
+        return outputs
+
+
+_easyocr_lock = threading.Lock()  # guards the shared EasyOCR reader
+
 
-        return output.strip()
+@lru_cache(maxsize=None)
+def _load_easyocr_reader():
+    import easyocr
+
+    return easyocr.Reader(["en"])
+
+
+def get_easyocr_reader():
+    """
+    Returns the EasyOCR reader shared by the whole process (loaded only once)
+    """
+    with _easyocr_lock:
+        return _load_easyocr_reader()
 
 
 class EasyOcrEngine(BaseOcrEngine):
     """
     Uses EasyOcr to extract digits from an image
+
+    All the engines share the same reader, so the model weights are only loaded
+    once.
     """
 
     def __init__(self):
         BaseOcrEngine.__init__(self)
 
-        import easyocr
-
-        self._reader = easyocr.Reader(["en"])
+        self._reader = get_easyocr_reader()
 
     def _ocr(self, img: MatLike) -> str:
         """
         Reads the portion of image, and returns the raw output
         """
+        return self.ocr_with_confidence(img)[0]
+
+    def ocr_with_confidence(self, img: MatLike) -> OcrResult:
+        """
+        Reads the portion of image, and returns the raw output along with the
+        confidence given by EasyOCR (scaled between 0 and 100)
+        """
         img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        output = self._reader.readtext(img_rgb, detail=0)
+
+        with _easyocr_lock:
+            output = self._reader.readtext(img_rgb, detail=1)
 
         if output == []:
-            return ""
+            return "", None
+
+        _, text, confidence = output[0]
+
+        return text.strip().replace(" ", ""), 100.0 * float(confidence)
+
+    def supports_batch(self) -> bool:
+        return True
+
+    def ocr_batch(self, imgs: list[MatLike]) -> list[OcrResult]:
+        """
+        Reads several pre-processed images with a single call to the EasyOCR
+        recognizer
+
+        The images are stacked vertically in a montage, and each of them is
+        given as a text box, so that the text detection is skipped and the
+        shared reader is only locked once. On GPU, all the boxes go through the
+        recognition model as one batch. On CPU, EasyOCR still recognises the
+        boxes one by one, so only the detection is saved (see
+        `benchmarks/easyocr_batch.py` for the actual gain).
+        """
+        if len(imgs) == 0:
+            return []
+
+        width = max(np.shape(img)[1] for img in imgs)
+        height = sum(np.shape(img)[0] for img in imgs)
+        montage = np.zeros((height, width), dtype=np.uint8)
+        boxes = []  # [x_min, x_max, y_min, y_max] for each image
+        y = 0
+
+        for img in imgs:
+            h, w = np.shape(img)[0:2]
+            montage[y : y + h, 0:w] = img if np.ndim(img) == 2 else img[:, :, 0]
+            boxes.append([0, w, y, y + h])
+            y += h
+
+        with _easyocr_lock:
+            results = self._reader.recognize(
+                montage,
+                horizontal_list=boxes,
+                free_list=[],
+                batch_size=len(boxes),
+                detail=1,
+            )
+
+        # Results are given with their box, map them back to their image
+        outputs: list[OcrResult] = [("", None)] * len(imgs)
+        box_starts = [box[2] for box in boxes]
+
+        for box, text, confidence in results:
+            y_min = box[0][1]
+
+            if y_min in box_starts:
+                outputs[box_starts.index(y_min)] = (
+                    text.strip().replace(" ", ""),
+                    100.0 * float(confidence),
+                )
+
+        return outputs
+
+
+class TemplateOcrEngine(BaseOcrEngine):
+    """
+    Reads fixed fonts by matching glyphs against labelled templates
+
+    The glyphs are segmented from the thresholded image, and classified with the
+    shared glyph set (see `src/glyphs.py`), which has to be learnt first from
+    labelled samples.
+    """
+
+    def __init__(self):
+        BaseOcrEngine.__init__(self)
+
+        self._glyph_set = get_glyph_set()
+
+    def cache_key(self, img: MatLike) -> bytes:
+        """
+        Same as `BaseOcrEngine.cache_key`, but also depends on the learnt glyphs
+        """
+        return BaseOcrEngine.cache_key(self, img) + self._glyph_set.get_version().to_bytes(
+            8, "little"
+        )
+
+    def _ocr(self, img: MatLike) -> str:
+        """
+        Reads the portion of image, and returns the raw output
+        """
+        return self.ocr_with_confidence(img)[0]
+
+    def ocr_with_confidence(self, img: MatLike) -> OcrResult:
+        """
+        Reads the portion of image, and returns the raw output along with the
+        lowest glyph matching score (scaled between 0 and 100)
+        """
+        return self._glyph_set.classify_with_confidence(segment_glyphs(img))
+
+
+class ClassifierOcrEngine(BaseOcrEngine):
+    """
+    Reads glyphs with a trained classifier (see `GlyphClassifier`), which
+    bootstraps itself from Tesseract
+
+    Until the shared classifier has enough samples, the image is read with
+    Tesseract, and its glyphs are used as training samples when Tesseract is
+    confident enough. The classifier then takes over.
+    """
+
+    MIN_TEACHER_CONFIDENCE = 90.0  # Tesseract confidence needed to keep a sample
+
+    def __init__(self):
+        BaseOcrEngine.__init__(self)
+
+        self._classifier = get_glyph_classifier()
+        self._teacher = TesseractOcrEngine()
+
+    def cache_key(self, img: MatLike) -> bytes:
+        """
+        Same as `BaseOcrEngine.cache_key`, but also depends on the classifier
+        """
+        return BaseOcrEngine.cache_key(self, img) + self._classifier.get_version().to_bytes(
+            8, "little"
+        )
+
+    def _ocr(self, img: MatLike) -> str:
+        """
+        Reads the portion of image, and returns the raw output
+        """
+        return self.ocr_with_confidence(img)[0]
+
+    def ocr_with_confidence(self, img: MatLike) -> OcrResult:
+        """
+        Reads the portion of image, and returns the raw output along with its
+        confidence (from the classifier, or from Tesseract while bootstrapping)
+        """
+        glyphs = segment_glyphs(img)
+
+        if self._classifier.is_ready():
+            return self._classifier.classify_with_confidence(glyphs)
+
+        output, confidence = self._teacher.ocr_with_confidence(img)
+
+        if confidence is not None and confidence >= self.MIN_TEACHER_CONFIDENCE:
+            self._classifier.add_glyphs(output, glyphs)
+
+        return output, confidence
+
+
+class CascadeOcrEngine(BaseOcrEngine):
+    """
+    Reads the image with a cheap configuration first, and only escalates to the
+    expensive one when unsure
+
+    The cheap stage uses the fast pre-processing mode without upscaling and a
+    small unsharp kernel. The expensive stage uses the configured
+    pre-processing. The expensive stage runs when the cheap output isn't a
+    number, or when its confidence is below a threshold.
+    """
+
+    MIN_CONFIDENCE = 80.0  # confidence under which the expensive stage runs
+
+    def __init__(
+        self,
+        cheap_engine: BaseOcrEngine | None = None,
+        expensive_engine: BaseOcrEngine | None = None,
+    ):
+        """
+        Args:
+            - cheap_engine:     Engine used for the cheap stage (Tesseract by default)
+            - expensive_engine: Engine used for the expensive stage (Tesseract by default)
+        """
+        BaseOcrEngine.__init__(self)
+
+        self._cheap_engine = cheap_engine or TesseractOcrEngine()
+        self._expensive_engine = expensive_engine or TesseractOcrEngine()
+        self._cheap_count = 0  # number of results given by the cheap stage
+        self._escalation_count = 0  # number of times the expensive stage ran
+        self._update_cheap_config()
+
+    def set_pre_process_config(self, config: BaseOcrEngine.PreProcessConfig):
+        """
+        Sets the configuration of the expensive stage (the cheap one is derived)
+        """
+        BaseOcrEngine.set_pre_process_config(self, config)
+        self._update_cheap_config()
+
+    def process_with_confidence(
+        self, raw_img: np.ndarray
+    ) -> Tuple[str, float | None, np.ndarray]:
+        """
+        Runs the cheap stage, then the expensive one if needed
+        """
+        output, confidence, img = self._cheap_engine.process_with_confidence(raw_img)
+
+        if self._is_acceptable(output, confidence):
+            self._cheap_count += 1
+            return output, confidence, img
+
+        self._escalation_count += 1
+
+        return BaseOcrEngine.process_with_confidence(self, raw_img)
+
+    def ocr_with_confidence(self, img: MatLike) -> OcrResult:
+        """
+        Reads an image pre-processed for the expensive stage
+        """
+        return self._expensive_engine.ocr_with_confidence(img)
+
+    def _ocr(self, img: MatLike) -> str:
+        """
+        Reads an image pre-processed for the expensive stage
+        """
+        return self.ocr_with_confidence(img)[0]
+
+    def get_escalation_rate(self) -> float:
+        """
+        Returns the ratio of images for which the expensive stage was needed
+        """
+        count = self._cheap_count + self._escalation_count
+        return self._escalation_count / count if count > 0 else 0.0
+
+    def _is_acceptable(self, output: str, confidence: float | None) -> bool:
+        """
+        Whether an output of the cheap stage can be kept
+        """
+        try:
+            float(output)
+        except ValueError:
+            return False
+
+        return confidence is not None and confidence >= self.MIN_CONFIDENCE
+
+    def _update_cheap_config(self):
+        """
+        Derives the cheap pre-processing configuration from the current one
+        """
+        config = deepcopy(self._config)
+        config.upscale_ratio = 1.0
+        config.unsharp_kernel_size = 3
+        config.fast_mode = True
+        self._cheap_engine.set_pre_process_config(config)
+
+
+def create_ocr_engine(method: OcrMethod) -> BaseOcrEngine:
+    """
+    Returns a new engine for the given OCR method
+    """
+    if method == OcrMethod.EASY_OCR:
+        return EasyOcrEngine()
+    elif method == OcrMethod.TEMPLATE:
+        return TemplateOcrEngine()
+    elif method == OcrMethod.CLASSIFIER:
+        return ClassifierOcrEngine()
+    elif method == OcrMethod.CASCADE:
+        return CascadeOcrEngine()
+    elif method == OcrMethod.TESSERACT_MONTAGE:
+        return TesseractMontageOcrEngine()
+    elif method == OcrMethod.TESSERACT_FULL_FRAME:
+        return TesseractFullFrameOcrEngine()
+    else:
+        return TesseractOcrEngine()
+
+
+def pre_process_config_to_dict(config: BaseOcrEngine.PreProcessConfig) -> dict:
+    """
+    Returns the pre-processing configuration as a dictionary
+    """
+    return {key: getattr(config, key) for key in dir(config) if key[0:2] != "__"}
+
+
+def pre_process_config_from_dict(config_dict: dict) -> BaseOcrEngine.PreProcessConfig:
+    """
+    Builds a pre-processing configuration from a dictionary
+    """
+    config = BaseOcrEngine.PreProcessConfig()
+
+    for key in config_dict:
+        setattr(config, key, config_dict[key])
+
+    return config
+
+
+def parse_number(
+    output_str: str | None, min_value: float | None, max_value: float | None
+) -> float | None:
+    """
+    Turns an OCR output into a float. Returns None if it failed, or if the value
+    is out of the given bounds (not used if None).
+    """
+    if output_str is None:
+        return None
+
+    try:
+        value = float(output_str)
+    except ValueError:
+        return None
+
+    if min_value is not None and value < min_value:
+        return None
+
+    if max_value is not None and value > max_value:
+        return None
 
-        return output[0].strip().replace(" ", "")
+    return value
@@ -0,0 +1,287 @@
+"""
+Pool of processes running OCR on frames shared through shared memory
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.glyphs import get_glyph_set, get_glyph_classifier
+from src.glyphs import load_shared_glyphs, save_shared_glyphs
+from src.ocr import OcrMethod, create_ocr_engine, parse_number
+from src.ocr import pre_process_config_from_dict
+from multiprocessing import shared_memory
+import multiprocessing as mp
+import numpy as np
+import os
+import queue
+import shutil
+import tempfile
+from typing import Tuple
+import zlib
+
+
+# Description of a capture sent to the workers:
+#   [name, (x_min, y_min, x_max, y_max), ocr method value, min value, max value,
+#    pre-processing config dictionary, whether to send back the processed image]
+CaptureSpec = Tuple[str, Tuple[int, int, int, int], int, float | None, float | None, dict, bool]
+
+# Result sent back by the workers:
+#   [name, post-processed value, raw output, confidence, processed image (or None)]
+CaptureResult = Tuple[str, float | None, str | None, float | None, np.ndarray | None]
+
+
+class FrameRingBuffer:
+    """
+    Ring of frame slots in shared memory, so that frames are written once and
+    read by other processes without pickling
+    """
+
+    def __init__(self, slot_count: int = 2):
+        self._slot_count = slot_count  # number of frames stored at once
+        self._slot_size = 0  # size of a slot in bytes
+        self._shm = None  # shared memory block holding all slots
+        self._next_slot = 0  # slot in which the next frame is written
+
+    def write(self, frame: np.ndarray) -> Tuple[str, int, tuple, str]:
+        """
+        Copies a frame in the next slot (reallocating the ring if it's too small)
+
+        Returns the information needed to read it: [shared memory name, offset,
+        shape, dtype]
+        """
+        if self._shm is None or frame.nbytes > self._slot_size:
+            self.close()
+            self._slot_size = frame.nbytes
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=max(1, self._slot_size * self._slot_count)
+            )
+
+        offset = self._next_slot * self._slot_size
+        self._next_slot = (self._next_slot + 1) % self._slot_count
+        view = np.ndarray(frame.shape, frame.dtype, buffer=self._shm.buf, offset=offset)
+        np.copyto(view, frame)
+        del view
+
+        return self._shm.name, offset, frame.shape, frame.dtype.str
+
+    def close(self):
+        """
+        Frees the shared memory
+        """
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def get_worker_index(name: str, num_workers: int) -> int:
+    """
+    Returns the index of the worker a capture is given to
+
+    It only depends on the name of the capture (with a hash that isn't salted
+    per process), so that the capture stays on the same worker whichever other
+    captures are run with it.
+    """
+    return zlib.crc32(name.encode()) % num_workers
+
+
+class OcrProcessPool:
+    """
+    Runs OCR on captures in worker processes, each keeping warm engines
+
+    The frame is written once in shared memory, from which the workers slice
+    the capture areas. Captures are always given to the same worker (see
+    `get_worker_index`), so that its engines (and their caches) can be reused. Only the small results (and
+    processed images for previews) are sent back.
+
+    The glyphs of this process (see `get_glyph_set`, `get_glyph_classifier`)
+    are saved to temporary files whenever they change, and reloaded by the
+    workers.
+    """
+
+    def __init__(self, num_workers: int = 1):
+        self._num_workers = max(1, num_workers)  # number of workers processes
+        self._context = mp.get_context("spawn")  # no fork of the GUI process
+        self._workers = []  # [process, task queue] of each worker
+        self._results = None  # queue where workers put their results
+        self._ring = FrameRingBuffer()
+        self._glyphs_dir = None  # temporary directory of the glyphs shared with the workers
+        self._glyph_versions = None  # versions of the glyph set and classifier shared
+        self._glyph_paths = (None, None)  # paths of the glyph set and classifier shared
+
+    def set_num_workers(self, num_workers: int):
+        """
+        Sets the number of worker processes (restarted at the next frame)
+        """
+        num_workers = max(1, num_workers)
+
+        if num_workers != self._num_workers:
+            self._num_workers = num_workers
+            self._stop_workers()
+
+    def process(self, frame: np.ndarray, specs: list[CaptureSpec]) -> list[CaptureResult]:
+        """
+        Runs OCR on the given captures of a frame, and returns their results
+        """
+        if len(specs) == 0:
+            return []
+
+        if len(self._workers) == 0:
+            self._start_workers()
+
+        self._share_glyphs()
+        frame_info = self._ring.write(frame)
+        expected = 0
+
+        worker_specs = [[] for _ in self._workers]
+
+        for spec in specs:
+            worker_specs[get_worker_index(spec[0], len(self._workers))].append(spec)
+
+        for (_, task_queue), task_specs in zip(self._workers, worker_specs):
+            if len(task_specs) > 0:
+                task_queue.put((frame_info, task_specs, self._glyph_paths))
+                expected += 1
+
+        results = []
+
+        while expected > 0:
+            try:
+                results += self._results.get(timeout=1.0)
+                expected -= 1
+            except queue.Empty:
+                if any(not process.is_alive() for process, _ in self._workers):
+                    print("[OcrProcessPool] ERROR: a worker died, restarting workers")
+                    self._stop_workers()
+                    return [(spec[0], None, None, None, None) for spec in specs]
+
+        return results
+
+    def shutdown(self):
+        """
+        Stops the workers and frees the shared memory
+        """
+        self._stop_workers()
+        self._ring.close()
+
+        if self._glyphs_dir is not None:
+            shutil.rmtree(self._glyphs_dir, ignore_errors=True)
+            self._glyphs_dir = None
+            self._glyph_versions = None
+            self._glyph_paths = (None, None)
+
+    def _share_glyphs(self):
+        """
+        Saves the glyphs of this process for the workers if they changed since
+        they were last saved
+        """
+        versions = (get_glyph_set().get_version(), get_glyph_classifier().get_version())
+
+        if versions == self._glyph_versions:
+            return
+
+        if self._glyphs_dir is None:
+            self._glyphs_dir = tempfile.mkdtemp(prefix="democratos_")
+
+        # The workers are done with the previous files, since all their
+        # results were received
+        old_paths = self._glyph_paths
+        self._glyph_paths = save_shared_glyphs(self._glyphs_dir)
+        self._glyph_versions = versions
+
+        for path in old_paths:
+            if path is not None and path not in self._glyph_paths:
+                os.remove(path)
+
+    def _start_workers(self):
+        self._results = self._context.Queue()
+
+        for _ in range(self._num_workers):
+            task_queue = self._context.Queue()
+            process = self._context.Process(
+                target=_worker_main, args=(task_queue, self._results), daemon=True
+            )
+            process.start()
+            self._workers.append([process, task_queue])
+
+    def _stop_workers(self):
+        for process, task_queue in self._workers:
+            if process.is_alive():
+                task_queue.put(None)
+
+        for process, _ in self._workers:
+            process.join(timeout=1.0)
+
+            if process.is_alive():
+                process.terminate()
+
+        self._workers = []
+
+
+def _worker_main(task_queue, result_queue):
+    """
+    Main loop of a worker process: reads capture areas from shared memory and
+    runs OCR on them
+    """
+    shm = None  # currently attached shared memory
+    engines = {}  # [ocr method value, config dictionary, engine] for each capture
+    glyph_paths = None  # paths of the glyphs loaded in this process
+
+    while True:
+        task = task_queue.get()
+
+        if task is None:
+            break
+
+        (shm_name, offset, shape, dtype), specs, task_glyph_paths = task
+
+        if task_glyph_paths != glyph_paths:
+            load_shared_glyphs(task_glyph_paths)
+            glyph_paths = task_glyph_paths
+
+        if shm is None or shm.name != shm_name:
+            if shm is not None:
+                shm.close()
+
+            # Spawned workers share the resource tracker of the parent process,
+            # which stays the only one unlinking the memory
+            shm = shared_memory.SharedMemory(name=shm_name)
+
+        frame = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf, offset=offset)
+        results = []
+
+        for name, area, method, min_value, max_value, config, send_img in specs:
+            if name not in engines or engines[name][0] != method:
+                engines[name] = [method, None, create_ocr_engine(OcrMethod(method))]
+
+            if engines[name][1] != config:
+                engines[name][1] = config
+                engines[name][2].set_pre_process_config(
+                    pre_process_config_from_dict(config)
+                )
+
+            x_min, y_min, x_max, y_max = area
+            img = frame[x_min : x_max + 1, y_min : y_max + 1]
+
+            if img.shape[0] == 0 or img.shape[1] == 0:
+                results.append((name, None, None, None, None))
+                continue
+
+            try:
+                engine = engines[name][2]
+                output, confidence, processed_img = engine.process_with_confidence(img)
+            except Exception as e:
+                print(f"[OcrProcessPool] ERROR: OCR failed for '{name}': {e}")
+                results.append((name, None, None, None, None))
+                continue
+
+            value = parse_number(output, min_value, max_value)
+            processed_img = np.array(processed_img) if send_img else None
+            results.append((name, value, output, confidence, processed_img))
+
+        frame = img = None  # release the views on the shared memory
+        result_queue.put(results)
+
+    if shm is not None:
+        shm.close()
@@ -0,0 +1,163 @@
+"""
+Long-lived pool of threads running OCR tasks
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.ocr import get_tesseract_api_pool
+from concurrent.futures import Future
+from time import perf_counter
+from typing import Callable
+import queue
+import threading
+
+
+class OcrWorkerPool:
+    """
+    Pool of worker threads living as long as the pool, fed by a task queue
+
+    Each worker is pinned to the Tesseract API handle it used last (see
+    `TesseractApiPool.pin_current_thread`), without holding more handles than
+    the size of the shared pool. The number of workers can be
+    changed while running, and the pool keeps statistics about its queue and
+    the workers utilisation.
+    """
+
+    def __init__(self, num_workers: int = 1):
+        self._tasks = queue.Queue()  # [future, function, args], or None to stop a worker
+        self._workers: list[threading.Thread] = []  # running workers
+        self._target_count = 0  # number of workers requested
+        self._lock = threading.Lock()
+        self._worker_idx = 0  # used to name the workers
+
+        # Statistics
+        self._busy_time = 0.0  # time spent by all workers running tasks
+        self._task_count = 0  # number of tasks run
+        self._max_queue_depth = 0  # highest number of pending tasks
+        self._worker_time = 0.0  # time integral of the number of workers
+        self._last_stats_t = perf_counter()
+
+        self.set_num_workers(num_workers)
+
+    def set_num_workers(self, num_workers: int):
+        """
+        Starts or stops workers to reach the given number of workers (at least 1)
+
+        Stopped workers finish their current task first.
+        """
+        self._resize(max(1, num_workers))
+
+    def get_num_workers(self) -> int:
+        return self._target_count
+
+    def submit(self, function: Callable, *args) -> Future:
+        """
+        Schedules a function to be run by a worker, and returns its future
+        """
+        future = Future()
+        self._tasks.put([future, function, args])
+        self._max_queue_depth = max(self._max_queue_depth, self._tasks.qsize())
+
+        return future
+
+    def shutdown(self):
+        """
+        Stops all the workers once they are done with the pending tasks
+        """
+        self._resize(0)
+
+    def _resize(self, num_workers: int):
+        """
+        Starts or stops workers to reach the given number of workers
+        """
+        with self._lock:
+            self._update_worker_time()
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            difference = num_workers - self._target_count
+            self._target_count = num_workers
+
+            for _ in range(difference):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"ocr_worker_{self._worker_idx}",
+                    daemon=True,
+                )
+                self._worker_idx += 1
+                self._workers.append(worker)
+                worker.start()
+
+        for _ in range(-difference):
+            self._tasks.put(None)
+
+    def get_stats(self, reset: bool = False) -> dict:
+        """
+        Returns statistics about the pool since the last reset:
+            - workers:         current number of workers
+            - queue_depth:     number of pending tasks
+            - max_queue_depth: highest number of pending tasks
+            - tasks:           number of tasks run
+            - utilisation:     ratio of the workers time spent running tasks
+        """
+        with self._lock:
+            self._update_worker_time()
+            stats = {
+                "workers": self._target_count,
+                "queue_depth": self._tasks.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "tasks": self._task_count,
+                "utilisation": (
+                    min(1.0, self._busy_time / self._worker_time)
+                    if self._worker_time > 0
+                    else 0.0
+                ),
+            }
+
+            if reset:
+                self._busy_time = 0.0
+                self._task_count = 0
+                self._max_queue_depth = self._tasks.qsize()
+                self._worker_time = 0.0
+
+        return stats
+
+    def _update_worker_time(self):
+        """
+        Integrates the number of workers over time (the lock has to be held)
+        """
+        t = perf_counter()
+        self._worker_time += (t - self._last_stats_t) * self._target_count
+        self._last_stats_t = t
+
+    def _worker_loop(self):
+        """
+        Runs tasks from the queue until asked to stop
+        """
+        tesseract_pool = get_tesseract_api_pool()
+        tesseract_pool.pin_current_thread()
+
+        try:
+            while True:
+                task = self._tasks.get()
+
+                if task is None:
+                    break
+
+                future, function, args = task
+
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                t0 = perf_counter()
+
+                try:
+                    future.set_result(function(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+
+                with self._lock:
+                    self._busy_time += perf_counter() - t0
+                    self._task_count += 1
+        finally:
+            tesseract_pool.unpin_current_thread()
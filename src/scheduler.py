@@ -0,0 +1,144 @@
+"""
+Decides which captures to process at each tick, according to their sampling
+rates and priorities
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from typing import Tuple
+import math
+
+
+# Capture to schedule: [name, sampling rate (None to sample at every tick), priority]
+ScheduledCapture = Tuple[str, float | None, int]
+
+
+class CaptureScheduler:
+    """
+    Deadline scheduler of the captures
+
+    Each capture is due once per period (the inverse of its sampling rate).
+    Deadlines are kept on a fixed grid, so that the tick jitter doesn't lower
+    the effective rate, and captures are given different phases so that those
+    with the same rate don't all fall on the same tick.
+
+    If given a time budget per tick, the scheduler only runs as many due
+    captures as it estimates fitting in it, in decreasing priority. The other
+    ones stay due, and get late: low priority captures are degraded first.
+    """
+
+    def __init__(self):
+        self._grid_starts = {}  # first deadline of each capture, with its phase
+        self._deadline_idx = {}  # index of the next deadline of each capture on its grid
+        self._periods = {}  # sampling period of each capture (0 for every tick)
+        self._origin = None  # time from which the grids start (None for the first tick)
+        self._cost = None  # estimated time to process a capture (s)
+        self._last_t = None  # time of the last call to `get_due`
+
+    def reset(self, origin: float | None = None):
+        """
+        Forgets the deadlines of the captures, which are scheduled again from
+        the next call to `get_due` (e.g. when the time base changes from the
+        clock to the timestamps of a video)
+
+        Args:
+            - origin: Time from which the grids of deadlines start, None to start
+                      them at the next call. Parts of a video processed
+                      separately get the same deadlines if given the same origin.
+        """
+        self._grid_starts = {}
+        self._deadline_idx = {}
+        self._periods = {}
+        self._origin = origin
+        self._last_t = None
+
+    def get_due(
+        self, captures: list[ScheduledCapture], t: float, budget: float | None = None
+    ) -> list[str]:
+        """
+        Returns the names of the captures to process at time t
+
+        Args:
+            - captures: Captures to schedule
+            - t:        Current time (s)
+            - budget:   Time that can be spent processing the captures (s), no
+                        limit if None
+        """
+        if self._last_t is not None and t < self._last_t:
+            self.reset(self._origin)  # the time went back, the deadlines are meaningless
+
+        self._last_t = t
+        new_captures = []
+
+        for name, sample_rate, _ in captures:
+            period = 1.0 / sample_rate if sample_rate else 0.0
+
+            if self._periods.get(name) != period:
+                self._periods[name] = period
+                new_captures.append(name)
+
+        origin = t if self._origin is None else self._origin
+
+        for k, name in enumerate(new_captures):
+            period = self._periods[name]
+            self._grid_starts[name] = origin + period * k / len(new_captures)
+            self._deadline_idx[name] = 0
+
+            if period > 0 and t > self._grid_starts[name]:
+                # First deadline at or after t (up to rounding errors)
+                elapsed = (t - self._grid_starts[name]) / period
+                self._deadline_idx[name] = math.ceil(elapsed - 1e-9)
+
+        names = set(name for name, _, _ in captures)
+
+        for name in list(self._periods):
+            if name not in names:
+                del self._periods[name]
+                del self._grid_starts[name]
+                del self._deadline_idx[name]
+
+        due = [
+            (-priority, self._get_deadline(name), name)
+            for name, _, priority in captures
+            if t >= self._get_deadline(name)
+        ]
+        due.sort()
+
+        if budget is not None and self._cost is not None and self._cost > 0:
+            due = due[0 : max(1, int(budget / self._cost))]
+
+        for _, _, name in due:
+            self._deadline_idx[name] += 1
+            period = self._periods[name]
+
+            if period > 0 and self._get_deadline(name) <= t:
+                # Late by more than a period: next deadline after t
+                elapsed = (t - self._grid_starts[name]) / period
+                self._deadline_idx[name] = math.floor(elapsed + 1e-9) + 1
+
+        return [name for _, _, name in due]
+
+    def _get_deadline(self, name: str) -> float:
+        """
+        Returns the next deadline of a capture
+        """
+        return self._grid_starts[name] + self._deadline_idx[name] * self._periods[name]
+
+    def report(self, count: int, duration: float):
+        """
+        Updates the cost estimate, given the time it took to process a number of
+        captures
+        """
+        if count == 0:
+            return
+
+        cost = duration / count
+        self._cost = cost if self._cost is None else 0.8 * self._cost + 0.2 * cost
+
+    def get_cost(self) -> float | None:
+        """
+        Returns the estimated time to process a capture (None if unknown)
+        """
+        return self._cost
@@ -0,0 +1,126 @@
+"""
+Grabs images of the screen, possibly only the regions covering given areas
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.grab_planner import GrabArea, GrabMode, RegionFrame, plan_grab_regions
+import mss
+import numpy as np
+
+
+class ScreenGrabber:
+    """
+    Grabs the screen, either full monitors or regions covering given areas
+
+    The underlying screenshot handle is created at the first grab, so that it
+    belongs to the thread using the grabber.
+    """
+
+    def __init__(self):
+        self._sct = None  # screenshot handle, created by the grabbing thread
+        self.mode = GrabMode.CLUSTERS  # how the regions to grab are planned
+
+    def grab(self, monitor: int = 1) -> np.ndarray | None:
+        """
+        Returns an image of a full monitor (BGR), or None if it failed
+        """
+        monitors = self._get_monitors()
+
+        if monitor < 1 or monitor >= len(monitors):
+            print(f"[ScreenGrabber] ERROR: monitor {monitor} doesn't exist")
+            return None
+
+        mon = monitors[monitor]
+        return self._grab_rect(
+            mon["left"],
+            mon["top"],
+            mon["left"] + mon["width"],
+            mon["top"] + mon["height"],
+        )
+
+    def grab_areas(self, areas: list[GrabArea]) -> RegionFrame | None:
+        """
+        Grabs only the screen regions covering the given areas (see
+        `plan_grab_regions`)
+
+        Returns None if no area can be grabbed or if grabbing failed
+        """
+        monitors = self._get_monitors()
+        clipped_areas = []
+
+        for monitor, x_min, y_min, x_max, y_max in areas:
+            if monitor < 1 or monitor >= len(monitors):
+                continue
+
+            mon = monitors[monitor]
+            clipped_areas.append(
+                (
+                    monitor,
+                    max(0, x_min),
+                    max(0, y_min),
+                    min(mon["height"] - 1, x_max),
+                    min(mon["width"] - 1, y_max),
+                )
+            )
+
+        regions = plan_grab_regions(clipped_areas, self.mode)
+
+        if len(regions) == 0:
+            return None
+
+        frame = RegionFrame()
+
+        for region in regions:
+            monitor, x_min, y_min, x_max, y_max = region
+            mon = monitors[monitor]
+            img = self._grab_rect(
+                mon["left"] + y_min,
+                mon["top"] + x_min,
+                mon["left"] + y_max + 1,
+                mon["top"] + x_max + 1,
+            )
+
+            if img is None:
+                return None
+
+            frame.add_region(region, img)
+
+        return frame
+
+    def close(self):
+        """
+        Releases the screenshot handle (it will be created again if needed)
+        """
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+
+    def _get_monitors(self) -> list[dict]:
+        """
+        Returns the monitors description, as given by `mss` (the first one is
+        the bounding box of all monitors)
+        """
+        if self._sct is None:
+            self._sct = mss.mss()
+
+        return self._sct.monitors
+
+    def _grab_rect(self, left: int, top: int, right: int, bottom: int) -> np.ndarray | None:
+        """
+        Grabs a rectangle of the virtual screen, returns None if it failed
+
+        The image is a BGR view of the raw BGRA buffer of the screenshot (no copy)
+        """
+        try:
+            screen_img = self._sct.grab((left, top, right, bottom))
+        except mss.exception.ScreenShotError:
+            return None
+
+        bgra = np.frombuffer(screen_img.raw, np.uint8).reshape(
+            screen_img.height, screen_img.width, 4
+        )
+
+        return bgra[:, :, :3]
@@ -0,0 +1,354 @@
+"""
+Pool of processes running the captures on time segments of a video
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.capture import Captures
+from src.duplicate_frames import DuplicateFilter, DuplicateFrames, get_duplicate_summary
+from src.frame_index import FrameIndex
+from src.glyphs import load_shared_glyphs, save_shared_glyphs
+from src.video_sampler import VideoOutput, VideoSampler, VideoSampling
+from src.video_sampler import prefetch_samples, reset_schedule
+import cv2
+import math
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import tempfile
+from typing import Iterator, Tuple
+
+
+# Time segment of a video: [start time (s), end time (s), None for the end of the video]
+VideoSegment = Tuple[float, float | None]
+
+
+def split_video(
+    duration: float, period: float, segment_count: int, start_t: float = 0.0
+) -> list[VideoSegment]:
+    """
+    Splits a video in segments of about the same duration
+
+    The segments start on the sampling grid (starting at `start_t`), so that
+    the frames sampled in the segments are the same as when sampling the whole
+    video.
+
+    Args:
+        - duration:      Duration of the video (s)
+        - period:        Time between two samples (s)
+        - segment_count: Maximum number of segments
+        - start_t:       Time from which the video is split (s)
+    """
+    sample_count = max(1, math.ceil((duration - start_t) / period))
+    samples_per_segment = math.ceil(sample_count / max(1, segment_count))
+    segments = []
+
+    for start in range(0, sample_count, samples_per_segment):
+        end = start + samples_per_segment
+        segments.append(
+            (
+                start_t + start * period,
+                start_t + end * period if end < sample_count else None,
+            )
+        )
+
+    return segments
+
+
+class VideoProcessPool:
+    """
+    Runs the captures on segments of a video in parallel, each worker process
+    having its own decoder and OCR engines
+
+    The video is split in more segments than workers, so that all workers stay
+    busy until the end even if some segments are slower to process. Workers
+    send their outputs back by batches, which are given back in time order: the
+    outputs of a segment are only given once all the previous segments are done.
+    """
+
+    def __init__(self, num_workers: int | None = None, segments_per_worker: int = 4):
+        """
+        Args:
+            - num_workers:         Number of worker processes, one per CPU core
+                                   if None
+            - segments_per_worker: Number of segments the video is split in,
+                                   for each worker
+        """
+        self._num_workers = max(1, num_workers or os.cpu_count() or 1)
+        self._segments_per_worker = segments_per_worker
+        self._context = mp.get_context("spawn")  # no fork of the GUI process
+
+        # Statistics of the last processing
+        self._decoding = [0, 0, 0]  # numbers of decoded frames, grabbed frames and seeks
+        self._duplicates = [0, 0]  # numbers of sampled frames and of duplicate frames
+        self._skip_rates = {}  # skipped OCR runs of each capture, averaged over segments
+
+    def process(
+        self,
+        video_path: str,
+        captures: Captures,
+        period: float,
+        sampling: VideoSampling = VideoSampling.SEEK,
+        batch_frames: int = 1,
+        start_t: float = 0.0,
+        end_t: float | None = None,
+        index_cache_dir: str | None = None,
+        duplicate_frames: DuplicateFrames = DuplicateFrames.PROCESS,
+        origin: float | None = None,
+    ) -> Iterator[Tuple[list[VideoOutput], int]]:
+        """
+        Processes a video, and yields the outputs of the captures in time order
+
+        Args:
+            - video_path:   Path of the video file
+            - captures:     Captures to run (their configuration is copied to
+                            the workers)
+            - period:       Time between two samples (s)
+            - sampling:     How to skip the frames between two samples
+            - batch_frames: Number of frames read with a single OCR call
+            - start_t:         Time from which the video is processed (s)
+            - end_t:           Time before which processing stops (s), None
+                               for the end of the video
+            - index_cache_dir: Where the index of the video is cached (see
+                               `FrameIndex`), None not to use it
+            - duplicate_frames: How frames identical to the previous one are
+                                handled (see `DuplicateFilter`, runs of
+                                identical frames are split between segments)
+            - origin:          Time from which the deadlines of the captures
+                               start (see `Captures.reset_schedule`), start_t
+                               if None
+        Returns:
+            Batches of outputs, along with the number of frames processed by
+            all workers so far
+        """
+        cap = cv2.VideoCapture(video_path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+
+        frame_index = None
+
+        if index_cache_dir is not None:
+            frame_index = FrameIndex.load(video_path, index_cache_dir)
+
+        if frame_index is not None:
+            frame_count = frame_index.get_frame_count()
+            duration = frame_index.get_duration() + (1.0 / fps if fps > 0 else 0.0)
+        else:
+            duration = frame_count / fps if fps > 0 else 0.0
+
+        if end_t is not None:
+            duration = min(duration, end_t)
+
+        if duration > start_t:
+            segments = split_video(
+                duration, period, self._num_workers * self._segments_per_worker, start_t
+            )
+            segments[-1] = (segments[-1][0], end_t)
+        else:
+            segments = [(start_t, end_t)]
+
+        # Frames of each segment, to report the progress
+        segment_frames = [
+            (
+                self._get_frame(segment_start, fps, frame_index),
+                (
+                    self._get_frame(segment_end, fps, frame_index)
+                    if segment_end is not None
+                    else max(frame_count, 0)
+                ),
+            )
+            for segment_start, segment_end in segments
+        ]
+
+        glyphs_dir = tempfile.mkdtemp(prefix="democratos_")
+        setup = (
+            video_path,
+            index_cache_dir,
+            captures.get_config(),
+            captures.get_ocr_method(),
+            period,
+            sampling,
+            batch_frames,
+            duplicate_frames,
+            save_shared_glyphs(glyphs_dir),
+            start_t if origin is None else origin,
+        )
+
+        task_queue = self._context.Queue()
+        result_queue = self._context.Queue()
+        workers = []
+
+        for k, segment in enumerate(segments):
+            task_queue.put((k, segment))
+
+        for _ in range(min(self._num_workers, len(segments))):
+            task_queue.put(None)
+            process = self._context.Process(
+                target=_worker_main, args=(task_queue, result_queue, setup), daemon=True
+            )
+            process.start()
+            workers.append(process)
+
+        pending = [[] for _ in segments]  # outputs not given back yet, for each segment
+        progress = [0 for _ in segments]  # processed frames of each segment
+        is_done = [False for _ in segments]
+        next_segment = 0  # first segment whose outputs weren't all given back
+        self._decoding = [0, 0, 0]
+        self._duplicates = [0, 0]
+        skip_rates = []
+
+        try:
+            while next_segment < len(segments):
+                try:
+                    message = result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    if all(not process.is_alive() for process in workers):
+                        raise RuntimeError("the video workers stopped early")
+
+                    continue
+
+                kind, k, payload = message
+                start_frame, end_frame = segment_frames[k]
+
+                if kind == "outputs":
+                    pending[k] += payload
+
+                    if len(payload) > 0:
+                        progress[k] = min(payload[-1][2] - start_frame, end_frame - start_frame)
+                else:
+                    is_done[k] = True
+                    progress[k] = end_frame - start_frame
+
+                    if kind == "error":
+                        raise RuntimeError(f"segment {k} of the video failed: {payload}")
+                    else:
+                        decoding, duplicates, segment_skip_rates = payload
+                        self._decoding = [a + b for a, b in zip(self._decoding, decoding)]
+                        self._duplicates = [a + b for a, b in zip(self._duplicates, duplicates)]
+                        skip_rates.append(segment_skip_rates)
+
+                outputs = []
+
+                while next_segment < len(segments):
+                    outputs += pending[next_segment]
+                    pending[next_segment] = []
+
+                    if not is_done[next_segment]:
+                        break
+
+                    next_segment += 1
+
+                yield outputs, segment_frames[0][0] + sum(progress)
+        finally:
+            for process in workers:
+                process.terminate()
+                process.join()
+
+            shutil.rmtree(glyphs_dir, ignore_errors=True)
+
+        self._skip_rates = {
+            name: sum(rates.get(name, 0.0) for rates in skip_rates) / len(skip_rates)
+            for name in (skip_rates[0] if len(skip_rates) > 0 else {})
+        }
+
+    @staticmethod
+    def _get_frame(t: float, fps: float, frame_index: FrameIndex | None) -> int:
+        """
+        Returns the first frame at or after a given time
+        """
+        if frame_index is not None:
+            return frame_index.get_frame(t)
+        else:
+            return round(t * fps)
+
+    def get_summary(self) -> str:
+        """
+        Returns a human readable summary of the decoding work of the last
+        processing
+        """
+        return (
+            f"{self._decoding[0]} decoded frames, {self._decoding[1]} grabbed frames, "
+            f"{self._decoding[2]} seeks, in {self._num_workers} processes"
+        )
+
+    def get_duplicate_summary(self) -> str:
+        """
+        Returns a human readable summary of the OCR work removed by skipping
+        duplicate frames during the last processing
+        """
+        return get_duplicate_summary(*self._duplicates)
+
+    def get_skip_rates(self) -> dict:
+        """
+        Returns the rate of skipped OCR runs of each capture during the last
+        processing
+        """
+        return self._skip_rates
+
+
+def _worker_main(task_queue, result_queue, setup):
+    """
+    Main loop of a worker process: processes video segments until it receives
+    None
+    """
+    (
+        video_path,
+        index_cache_dir,
+        config,
+        ocr_method,
+        period,
+        sampling,
+        batch_frames,
+        duplicate_frames,
+        glyph_paths,
+        origin,
+    ) = setup
+    load_shared_glyphs(glyph_paths)
+
+    frame_index = None
+
+    if index_cache_dir is not None:
+        frame_index = FrameIndex.load(video_path, index_cache_dir)
+
+    captures = Captures()
+    captures.load_config(config)
+    captures.set_ocr_method(ocr_method)
+    captures.set_max_threads(1)
+
+    if not captures.supports_batch():
+        batch_frames = 1
+
+    while True:
+        task = task_queue.get()
+
+        if task is None:
+            break
+
+        k, (start_t, end_t) = task
+        reset_schedule(captures, video_path, period, sampling, start_t, origin, frame_index)
+        cap = cv2.VideoCapture(video_path)
+        sampler = VideoSampler(cap, period, sampling, start_t, end_t, frame_index)
+        samples = prefetch_samples(sampler, 2 * batch_frames)
+        duplicate_filter = DuplicateFilter(captures, duplicate_frames)
+        batches = duplicate_filter.process(samples, batch_frames, False)
+        captures.reset_skip_rates()
+
+        try:
+            for outputs in batches:
+                result_queue.put(("outputs", k, outputs))
+
+            decoding = (sampler.retrieve_count, sampler.grab_count, sampler.seek_count)
+            duplicates = (duplicate_filter.frame_count, duplicate_filter.duplicate_count)
+            result_queue.put(("done", k, (decoding, duplicates, captures.get_skip_rates())))
+        except Exception as e:
+            result_queue.put(("error", k, str(e)))
+        finally:
+            batches.close()
+            samples.close()
+            cap.release()
+
+    captures.shutdown()
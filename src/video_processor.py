@@ -9,8 +9,18 @@ License: Apache 2.0
 from src.data_recorder import DataRecorder
 from cv2.typing import MatLike
 from src.capture import Captures
+from src.frame_index import FrameIndex
+from src.change_search import ChangeSearch
+from src.duplicate_frames import DuplicateFilter, DuplicateFrames
+from src.video_sampler import VideoOutput, VideoSampler, VideoSampling
+from src.video_sampler import prefetch_samples, reset_schedule
+from src.video_processes import VideoProcessPool
 import cv2
-from typing import Callable
+import json
+import math
+import os
+from time import time
+from typing import Callable, Iterator, Tuple
 
 
 class VideoProcessor:
@@ -24,15 +34,43 @@ class VideoProcessor:
         self._preview_frame = None  # preview frame of the video
         self._fps = 1.0  # how many frames per second need to be processed in the video
         self._stop_processing = False  # whether a request to stop processing was received
+        self._batch_frames = 8  # number of frames read at once, if the OCR engine supports it
+        self._sampling = VideoSampling.SEEK  # how the frames between two samples are skipped
+        self._num_processes = 1  # number of processes the video is split between (None for one per core)
+        self._checkpoint_period = 30.0  # time between two checkpoints (s), None to disable them
+        self._time_range = (0.0, None)  # part of the video to process (s), None for the end
+        self._change_resolution = None  # resolution of the change search (s), None to sample uniformly
+        self._duplicate_frames = DuplicateFrames.PROCESS  # how sampled frames identical to the previous one are handled
+        self._frame_index = None  # index of the video (timestamps and keyframes), if available
+        self._index_cache_dir = os.path.join(  # where the video indices are cached, None to disable them
+            os.path.expanduser("~"), ".cache", "democratos", "frame_index"
+        )
 
     def set_video_path(self, video_path: str):
         """
         Sets the path of the video file to process
+
+        The video is indexed (or its index loaded from the cache), so that the
+        preview frame can be taken at a keyframe, which is decoded without any
+        other frame.
         """
+        self._video_path = None
+        self._frame_index = None
+
+        if self._index_cache_dir is not None:
+            self._frame_index = FrameIndex.load(video_path, self._index_cache_dir)
+
         # Gets the preview frame of the video (in the middle of the video)
         cap = cv2.VideoCapture(video_path)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count // 2)
+
+        if self._frame_index is not None:
+            frame_count = self._frame_index.get_frame_count()
+            keyframe = self._frame_index.get_keyframe(frame_count // 2)
+            cap.set(cv2.CAP_PROP_POS_MSEC, self._frame_index.get_time(keyframe) * 1000.0)
+        else:
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count // 2)
+
         ret, self._preview_frame = cap.read()
 
         if not ret:
@@ -43,12 +81,102 @@ class VideoProcessor:
         self._video_path = video_path
         cap.release()
 
+    def get_video_path(self) -> str | None:
+        """
+        Returns the path of the video to process (None if no valid video is set)
+        """
+        return self._video_path
+
     def set_fps(self, fps: float):
         """
-        Sets how many frames per seconds need to be processed in the video
+        Sets how many frames per seconds need to be processed in the video, for
+        the captures without their own sampling rate
         """
         self._fps = fps
 
+    def set_batch_frames(self, batch_frames: int):
+        """
+        Sets how many sampled frames are read with a single OCR call for each
+        capture (only used if the OCR engine supports batches)
+        """
+        self._batch_frames = max(1, batch_frames)
+
+    def set_sampling(self, sampling: VideoSampling):
+        """
+        Sets how the frames between two samples are skipped (see `VideoSampling`)
+        """
+        self._sampling = sampling
+
+    def set_num_processes(self, num_processes: int | None):
+        """
+        Sets the number of processes processing segments of the video in
+        parallel (None for one per CPU core, 1 to process the video in this
+        process)
+        """
+        self._num_processes = num_processes
+
+    def set_time_range(self, start_t: float = 0.0, end_t: float | None = None):
+        """
+        Sets the part of the video to process
+
+        Args:
+            - start_t: Time of the first sample (s)
+            - end_t:   Time before which processing stops (s), None for the end
+                       of the video
+        """
+        self._time_range = (max(0.0, start_t), end_t)
+
+    def set_change_resolution(self, resolution: float | None):
+        """
+        Enables the adaptive sampling: the video is sampled at the FPS setting,
+        and the changes of outputs between two samples are located by bisection
+        within the given resolution (s), see `ChangeSearch`
+
+        None disables it, the video being sampled uniformly. The adaptive
+        sampling always runs in this process.
+        """
+        self._change_resolution = resolution
+
+    def set_duplicate_frames(self, policy: DuplicateFrames):
+        """
+        Sets how sampled frames whose capture areas are identical to the
+        previous sampled frame are handled (see `DuplicateFilter`), when the
+        video is sampled uniformly
+        """
+        self._duplicate_frames = policy
+
+    def set_index_cache_dir(self, cache_dir: str | None):
+        """
+        Sets the directory where video indices are cached (None to disable the
+        indices), used for the next video
+        """
+        self._index_cache_dir = cache_dir
+
+    def get_frame_index(self) -> FrameIndex | None:
+        """
+        Returns the index of the current video, None if not available
+        """
+        return self._frame_index
+
+    def set_checkpoint_period(self, period: float | None):
+        """
+        Sets how often the results are saved along with the processing state,
+        so that the processing can be resumed if it stopped (None to disable)
+        """
+        self._checkpoint_period = period
+
+    def get_checkpoint_path(self) -> str | None:
+        """
+        Returns the path of the checkpoint of the current video (in the output
+        directory of the recorder), None if no valid video is set
+        """
+        if self._video_path is None:
+            return None
+
+        stem = os.path.splitext(os.path.basename(self._video_path))[0]
+
+        return os.path.join(self._data_recorder.get_output_dir(), f"{stem}.checkpoint.json")
+
     def get_preview_frame(self) -> None | MatLike:
         """
         Returns a preview frame of the currently loaded video (None if not available)
@@ -61,18 +189,30 @@ class VideoProcessor:
         """
         self._captures = captures
 
-    def process_video(self, frame_cb: Callable) -> str:
+    def process_video(
+        self, frame_cb: Callable, display: bool = True, resume: bool = False
+    ) -> str:
         """
         Processes the video file
 
+        Frames are decoded in a background thread while OCR runs on the
+        previous ones, and the outputs are recorded in time order. The results
+        are regularly saved along with a checkpoint, which is removed once the
+        whole video is processed.
+
         Args:
             - frame_cb: Will be called at each processed frame
+            - display:  Whether to display the outputs of the captures (has to
+                        be False if not called from the GUI thread)
+            - resume:   Whether to resume from the checkpoint of a previous
+                        processing (with the same settings) if there is one,
+                        appending to its CSV file
         Returns:
             Path of the saved CSV file
 
         frame_cb(output, progress):
             - output: dictionary of detected values for each capture
-            - progress: [current_frame, total_frame_count]
+            - progress: [processed_frame_count, total_frame_count]
         """
         if self._video_path is None:
             print("[VideoProcessor] No valid video selected")
@@ -80,40 +220,256 @@ class VideoProcessor:
 
         assert self._captures is not None
 
+        if self._frame_index is not None:
+            frame_count = self._frame_index.get_frame_count()
+        else:
+            cap = cv2.VideoCapture(self._video_path)
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+
+        period = 1.0 / self._captures.get_max_sample_rate(self._fps)
+        settings = self._get_checkpoint_settings(period)
+        start_t = self._time_range[0]
+        self._captures.reset_schedule(self._time_range[0])  # deadlines of live runs or other videos
+
+        if resume:
+            checkpoint = self._load_checkpoint(settings)
+
+            if checkpoint is None:
+                return ""
+            elif "t" in checkpoint:
+                sample_idx = math.floor((checkpoint["t"] - start_t) / period) + 1
+                start_t += max(0, sample_idx) * period
+                print(f"[VideoProcessor] Resuming from {start_t:.3f} s")
+        else:
+            self._data_recorder.toggle_recording(True)
+
+        if self._change_resolution is not None:
+            batches = self._process_changes(period, display, start_t)
+        elif self._num_processes == 1:
+            batches = self._process_here(period, display, start_t)
+        else:
+            batches = self._process_in_processes(period, start_t)
+
+        last_sample = None  # timestamp and frame number of the last recorded output
+        checkpoint_t = time()  # time of the last checkpoint
+        is_complete = False  # whether the whole video was processed
+
+        try:
+            for outputs, progress in batches:
+                for output, t, _ in outputs:
+                    self._data_recorder.record(output, t)
+                    frame_cb(output, [progress, frame_count])
+
+                if len(outputs) > 0:
+                    last_sample = outputs[-1][1:]
+
+                if self._stop_processing:
+                    break
+
+                if (
+                    self._checkpoint_period is not None
+                    and last_sample is not None
+                    and time() - checkpoint_t >= self._checkpoint_period
+                ):
+                    self._save_checkpoint(settings, *last_sample)
+                    checkpoint_t = time()
+
+            is_complete = not self._stop_processing
+        finally:
+            batches.close()
+            self._stop_processing = False
+
+            if is_complete:
+                self._remove_checkpoint()
+            elif self._checkpoint_period is not None and last_sample is not None:
+                self._save_checkpoint(settings, *last_sample)
+
+        return self._data_recorder.toggle_recording(False)
+
+    def _get_checkpoint_settings(self, period: float) -> dict:
+        """
+        Returns the settings a checkpoint can only be resumed with
+        """
+        captures = self._captures.get_config()
+
+        for config in captures.values():
+            config.pop("show_preview", None)  # only changes the display
+
+        settings = {
+            "video_path": os.path.abspath(self._video_path),
+            "captures": captures,
+            "ocr_method": self._captures.get_ocr_method().name,
+            "period": period,
+            "time_range": self._time_range,
+            "change_resolution": self._change_resolution,
+            "duplicate_frames": self._duplicate_frames.name,
+        }
+
+        return json.loads(json.dumps(settings))  # same types as when loaded
+
+    def _save_checkpoint(self, settings: dict, t: float, frame_idx: int):
+        """
+        Saves the results recorded so far, and the state needed to resume the
+        processing after the last recorded frame
+        """
+        csv_path = os.path.abspath(self._data_recorder.flush())
+        checkpoint = {
+            "settings": settings,
+            "csv_path": csv_path,
+            "csv_size": os.path.getsize(csv_path),
+            "t": t,
+            "frame": frame_idx,
+        }
+
+        # Replaced at once, so that a crash can't leave a partial checkpoint
+        path = self.get_checkpoint_path()
+        tmp_path = path + ".tmp"
+
+        with open(tmp_path, "w") as file:
+            json.dump(checkpoint, file)
+
+        os.replace(tmp_path, path)
+
+    def _load_checkpoint(self, settings: dict) -> dict | None:
+        """
+        Loads the checkpoint of the video and resumes its recording
+
+        Returns the checkpoint (empty if there is none, to start from the
+        beginning), or None if it can't be resumed
+        """
+        path = self.get_checkpoint_path()
+
+        if not os.path.exists(path):
+            print("[VideoProcessor] No checkpoint found, processing from the start")
+            self._data_recorder.toggle_recording(True)
+            return {}
+
+        try:
+            with open(path) as file:
+                checkpoint = json.load(file)
+        except (OSError, json.decoder.JSONDecodeError) as e:
+            print(f"[VideoProcessor] ERROR: couldn't read the checkpoint {path}")
+            print(e)
+            return None
+
+        if checkpoint["settings"] != settings:
+            print("[VideoProcessor] ERROR: the checkpoint was made with other settings")
+            return None
+
+        if not self._data_recorder.resume_recording(
+            checkpoint["csv_path"], checkpoint["csv_size"]
+        ):
+            return None
+
+        return checkpoint
+
+    def _remove_checkpoint(self):
+        path = self.get_checkpoint_path()
+
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _process_here(
+        self, period: float, display: bool, start_t: float
+    ) -> Iterator[Tuple[list[VideoOutput], int]]:
+        """
+        Processes the video in this process, and yields batches of outputs
+        along with the current frame
+        """
+        reset_schedule(
+            self._captures,
+            self._video_path,
+            period,
+            self._sampling,
+            start_t,
+            self._time_range[0],
+            self._frame_index,
+        )
         cap = cv2.VideoCapture(self._video_path)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        frame_idx = 0
-        dt = 1.0 / cap.get(cv2.CAP_PROP_FPS)
-        record_offset_t = 1.0 / self._fps
-        t = 0.0
-        last_t = 0.0
-
-        self._data_recorder.toggle_recording(True)
-
-        while cap.isOpened() and not self._stop_processing:
-            ret, frame = cap.read()
-            t += dt
-            frame_idx += 1
-
-            if not ret:
-                break
-
-            if t - last_t < record_offset_t or frame is None:
-                continue
-
-            last_t = t
-            output = self._captures.update(frame)
-            print(
-                f"[{frame_idx}/{frame_count}][{int(frame_idx / frame_count * 100)} %] {output}"
-            )
-            self._data_recorder.record(output, t)
-            frame_cb(output, [frame_idx, frame_count])
+        sampler = VideoSampler(
+            cap, period, self._sampling, start_t, self._time_range[1], self._frame_index
+        )
+        batch_frames = self._batch_frames if self._captures.supports_batch() else 1
+        samples = prefetch_samples(sampler, 2 * batch_frames)
+        duplicate_filter = DuplicateFilter(self._captures, self._duplicate_frames)
+        batches = duplicate_filter.process(samples, batch_frames, display)
+        self._captures.reset_skip_rates()
 
-        path = self._data_recorder.toggle_recording(False)
-        self._stop_processing = False
-        cap.release()
+        try:
+            for outputs in batches:
+                yield outputs, outputs[-1][2] if len(outputs) > 0 else duplicate_filter.last_frame
+        finally:
+            batches.close()
+            samples.close()  # stops the decoder before releasing the video
+            print(f"[VideoProcessor] Decoding: {sampler.get_summary()}")
+            print(f"[VideoProcessor] Skipped OCR runs: {self._captures.get_skip_rates()}")
+
+            if self._duplicate_frames != DuplicateFrames.PROCESS:
+                print(f"[VideoProcessor] Duplicate frames: {duplicate_filter.get_summary()}")
+
+            cap.release()
+
+    def _process_changes(
+        self, period: float, display: bool, start_t: float
+    ) -> Iterator[Tuple[list[VideoOutput], int]]:
+        """
+        Samples the video coarsely and bisects the changes, and yields batches
+        of outputs in time order along with the current frame
+        """
+        cap = cv2.VideoCapture(self._video_path)
+        sampler = VideoSampler(
+            cap, period, self._sampling, start_t, self._time_range[1], self._frame_index
+        )
+        samples = prefetch_samples(sampler)
+        search = ChangeSearch(
+            self._video_path,
+            self._captures,
+            self._change_resolution,
+            self._frame_index,
+            display,
+        )
+        outputs = search.process(samples)
+
+        try:
+            for batch in outputs:
+                yield batch, batch[-1][2]
+        finally:
+            outputs.close()
+            samples.close()
+            print(f"[VideoProcessor] Decoding: {sampler.get_summary()}")
+            print(f"[VideoProcessor] Change search: {search.get_summary()}")
+            cap.release()
+
+    def _process_in_processes(
+        self, period: float, start_t: float
+    ) -> Iterator[Tuple[list[VideoOutput], int]]:
+        """
+        Processes segments of the video in parallel processes, and yields
+        batches of outputs in time order along with the number of processed
+        frames
+        """
+        pool = VideoProcessPool(self._num_processes)
+
+        try:
+            yield from pool.process(
+                self._video_path,
+                self._captures,
+                period,
+                self._sampling,
+                self._batch_frames,
+                start_t,
+                self._time_range[1],
+                self._index_cache_dir,
+                self._duplicate_frames,
+                self._time_range[0],
+            )
+        finally:
+            print(f"[VideoProcessor] Decoding: {pool.get_summary()}")
+            print(f"[VideoProcessor] Skipped OCR runs: {pool.get_skip_rates()}")
 
-        return path
+            if self._duplicate_frames != DuplicateFrames.PROCESS:
+                print(f"[VideoProcessor] Duplicate frames: {pool.get_duplicate_summary()}")
 
     def stop_processing(self):
         """
@@ -0,0 +1,401 @@
+"""
+Reads the frames of a video at a given sampling period, decoding as few frames
+as possible, and runs the captures on them
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.capture import Captures
+from src.frame_index import FrameIndex
+from cv2.typing import MatLike
+from enum import Enum
+from time import perf_counter
+from typing import Iterable, Iterator, Tuple
+import cv2
+import queue
+import threading
+
+
+class VideoSampling(Enum):
+    """
+    How the frames between two samples are skipped
+    """
+    READ = 1  # decode every frame (slowest, works with any backend)
+    GRAB = 2  # demux the skipped frames without converting them
+    SEEK = 3  # like GRAB, but seek over the gaps where it is cheaper
+
+
+# Sampled frame: [image, timestamp (s), frame number (starting at 1)]
+VideoSample = Tuple[MatLike, float, int]
+
+# Outputs of the captures on a sampled frame: [outputs, timestamp (s), frame number]
+VideoOutput = Tuple[dict, float, int]
+
+
+class VideoSampler:
+    """
+    Iterates over the frames of a video closest to a regular time grid
+
+    Only the sampled frames are fully decoded (`retrieve`), the other ones are
+    skipped with `grab`, which avoids the colour conversion and the copy. When
+    seeking is enabled, the sampler measures the cost of a grab and of a seek,
+    and seeks over the gaps where it is cheaper than grabbing every frame (e.g.
+    low sampling rate on a high frame rate video). With an index of the video,
+    it only seeks when there is a keyframe to skip to, since decoding has to
+    start from the keyframe before the target anyway, and when decoding from
+    that keyframe is cheaper than grabbing the whole gap.
+
+    Timestamps are the ones of the container, so that they stay right with
+    variable frame rates and after seeks.
+    """
+
+    def __init__(
+        self,
+        cap: cv2.VideoCapture,
+        period: float,
+        sampling: VideoSampling = VideoSampling.SEEK,
+        start_t: float = 0.0,
+        end_t: float | None = None,
+        frame_index: FrameIndex | None = None,
+    ):
+        """
+        Args:
+            - cap:         Opened video, at its first frame
+            - period:      Time between two samples (s)
+            - sampling:    How to skip the frames between two samples
+            - start_t:     Time of the first sample (s)
+            - end_t:       Time before which sampling stops (s), until the end
+                           of the video if None
+            - frame_index: Index of the video, to seek only when a keyframe
+                           can be skipped to (see `FrameIndex`)
+        """
+        self._cap = cap
+        self._period = period
+        self._sampling = sampling
+        self._start_t = start_t
+        self._end_t = end_t
+        self._frame_index = frame_index
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self._dt = 1.0 / fps if fps > 0 else 0.0  # nominal time between two frames (s)
+        self._min_seek_gap = 0.5  # gap from which a seek is tried if its cost is unknown (s)
+        self._frame = None  # last frame read, when decoding every frame
+
+        # Cost estimates (s)
+        self._grab_cost = None  # of skipping a frame
+        self._seek_cost = None  # of seeking to a frame (with an index, without decoding from its keyframe)
+
+        # Statistics
+        self.grab_count = 0  # number of grabbed frames (including the sampled ones)
+        self.retrieve_count = 0  # number of fully decoded frames
+        self.seek_count = 0  # number of seeks
+
+    def __iter__(self) -> Iterator[VideoSample]:
+        next_t = self._start_t  # time of the next sample
+        last_t = -1.0  # timestamp of the last grabbed frame
+
+        while True:
+            if (last_t < 0.0 and next_t > 0.0) or self._should_seek(last_t, next_t):
+                ret = self._seek(next_t, last_t)
+            else:
+                ret = self._grab()
+
+            if not ret:
+                break
+
+            t = self._get_timestamp()
+            last_t = t
+
+            if self._end_t is not None and t >= self._end_t:
+                break
+
+            if t + 1e-6 < next_t:
+                continue
+
+            if self._frame is not None:
+                ret, frame = True, self._frame
+            else:
+                ret, frame = self._cap.retrieve()
+                self.retrieve_count += 1
+
+            if not ret or frame is None:
+                continue
+
+            # Keep the samples on the grid, skipping the ones already passed
+            next_t += self._period
+
+            if next_t <= t:
+                next_t = t + self._period - (t - next_t) % self._period
+
+            yield frame, t, int(self._cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+    def get_summary(self) -> str:
+        """
+        Returns a human readable summary of the decoding work
+        """
+        return (
+            f"{self.retrieve_count} decoded frames, {self.grab_count} grabbed frames, "
+            f"{self.seek_count} seeks"
+        )
+
+    def _grab(self) -> bool:
+        """
+        Skips to the next frame, returns whether it succeeded
+        """
+        t0 = perf_counter()
+
+        if self._sampling == VideoSampling.READ:
+            ret, self._frame = self._cap.read()
+            self.retrieve_count += 1 if ret else 0
+        else:
+            ret = self._cap.grab()
+
+        if ret:
+            self.grab_count += 1
+            cost = perf_counter() - t0
+            self._grab_cost = (
+                cost if self._grab_cost is None else 0.9 * self._grab_cost + 0.1 * cost
+            )
+
+        return ret
+
+    def _should_seek(self, last_t: float, next_t: float) -> bool:
+        """
+        Returns whether seeking to the next sample is cheaper than grabbing the
+        frames in between
+        """
+        if self._sampling != VideoSampling.SEEK or last_t < 0.0:
+            return False
+
+        if self._frame_index is not None:
+            next_frame = self._frame_index.get_frame(last_t) + 1  # next frame to grab
+            target = self._frame_index.get_frame(next_t)
+            keyframe = self._frame_index.get_keyframe(target)
+
+            if keyframe <= next_frame:
+                return False  # the seek would decode the same frames
+            elif self._seek_cost is None or self._grab_cost is None:
+                gap = self._frame_index.get_time(target) - self._frame_index.get_time(next_frame)
+                return gap >= self._min_seek_gap
+            else:
+                # After the seek, the frames from the keyframe to the target are decoded
+                seek_cost = self._seek_cost + (target - keyframe) * self._grab_cost
+                return (target - next_frame) * self._grab_cost > seek_cost
+
+        if self._dt == 0.0:
+            return False
+
+        gap = next_t - last_t - self._dt  # time of the frames to skip
+
+        if gap <= self._dt:
+            return False
+        elif self._seek_cost is None or self._grab_cost is None:
+            return gap >= self._min_seek_gap
+        else:
+            return gap / self._dt * self._grab_cost > self._seek_cost
+
+    def _seek(self, t: float, last_t: float) -> bool:
+        """
+        Seeks to the frame at a given time and grabs it, returns whether a
+        frame was grabbed
+
+        If the backend can't seek forward, seeking is disabled and the video is
+        grabbed frame by frame from where it landed (the frames before the next
+        sample are then skipped as usual).
+        """
+        t0 = perf_counter()
+        self._frame = None
+        decoded_cost = 0.0  # estimated cost of the frames decoded from the keyframe (s)
+
+        if self._frame_index is not None:
+            target = self._frame_index.get_frame(t)
+            t = self._frame_index.get_time(target)  # exact frame time
+
+            if self._grab_cost is not None:
+                decoded_cost = (target - self._frame_index.get_keyframe(target)) * self._grab_cost
+
+        if not self._cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000.0):
+            self._disable_seek()
+            return self._grab()
+
+        if not self._cap.grab():
+            return False
+
+        self.grab_count += 1
+        self.seek_count += 1
+
+        if self._get_timestamp() <= last_t:
+            self._disable_seek()
+            return True
+
+        cost = max(0.0, perf_counter() - t0 - decoded_cost)
+        self._seek_cost = (
+            cost if self._seek_cost is None else 0.8 * self._seek_cost + 0.2 * cost
+        )
+
+        return True
+
+    def _disable_seek(self):
+        if self._sampling == VideoSampling.SEEK:
+            print("[VideoSampler] Seeking isn't supported for this video, grabbing frames instead")
+            self._sampling = VideoSampling.GRAB
+
+    def _get_timestamp(self) -> float:
+        """
+        Returns the timestamp of the last grabbed frame (s)
+
+        Falls back to the nominal frame rate if the backend doesn't provide
+        timestamps
+        """
+        t = self._cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        frame_idx = self._cap.get(cv2.CAP_PROP_POS_FRAMES)
+
+        if t <= 0.0 and frame_idx > 1:
+            t = (frame_idx - 1) * self._dt
+
+        return t
+
+
+def prefetch_samples(
+    samples: Iterable[VideoSample], queue_size: int = 8
+) -> Iterator[VideoSample]:
+    """
+    Decodes sampled frames in a background thread, ahead of their processing
+
+    The decoder and the consumer of the frames are joined by a bounded queue,
+    so that decoding overlaps with OCR while only a few frames are kept in
+    memory. Closing the iterator stops the decoder, and decoding errors are
+    raised to the consumer.
+
+    Args:
+        - samples:    Sampled frames (e.g. a `VideoSampler`)
+        - queue_size: Maximum number of decoded frames waiting to be consumed
+    """
+    frames = queue.Queue(max(1, queue_size))  # decoded frames, None at the end
+    stop = threading.Event()  # set when the consumer stops early
+    errors = []  # exception raised while decoding, if any
+
+    def __put(item) -> bool:
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def __decode():
+        try:
+            for sample in samples:
+                if not __put(sample):
+                    return
+        except Exception as e:
+            errors.append(e)
+
+        __put(None)
+
+    thread = threading.Thread(target=__decode, name="video_decoder", daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            sample = frames.get()
+
+            if sample is None:
+                break
+
+            yield sample
+
+        if len(errors) > 0:
+            raise errors[0]
+    finally:
+        stop.set()
+        thread.join()
+
+
+def reset_schedule(
+    captures: Captures,
+    video_path: str,
+    period: float,
+    sampling: VideoSampling,
+    start_t: float,
+    origin: float,
+    frame_index: FrameIndex | None = None,
+):
+    """
+    Resets the schedule of the captures (see `Captures.reset_schedule`) before
+    sampling a video from start_t, as if it had been sampled from the origin
+
+    The timestamp of the sample before start_t (if any) is given to the
+    scheduler, so that the captures due at the first sample are the same as
+    when sampling from the origin (e.g. for segments of a video processed
+    separately, or when resuming).
+
+    Args:
+        - captures:    Captures to schedule
+        - video_path:  Path of the video file
+        - period:      Time between two samples (s)
+        - sampling:    How to skip the frames between two samples
+        - start_t:     Time of the first sample (s), on the sampling grid
+        - origin:      Time of the first sample of the whole video (s)
+        - frame_index: Index of the video, if available
+    """
+    captures.reset_schedule(origin)
+
+    if start_t - period < origin - 1e-6:
+        return
+
+    cap = cv2.VideoCapture(video_path)
+
+    for _, t, _ in VideoSampler(cap, period, sampling, start_t - period, start_t, frame_index):
+        captures.get_due(t)
+        break
+
+    cap.release()
+
+
+def process_samples(
+    samples: Iterable[VideoSample],
+    captures: Captures,
+    batch_frames: int = 1,
+    display: bool = True,
+) -> Iterator[list[VideoOutput]]:
+    """
+    Runs the captures on sampled frames, and yields their outputs by batches
+
+    Args:
+        - samples:      Sampled frames, in time order (e.g. a `VideoSampler`)
+        - captures:     Captures to run
+        - batch_frames: Number of frames read with a single OCR call for each
+                        capture (only used if the OCR engine supports batches)
+        - display:      Whether to display the outputs (see `Captures.update`)
+    """
+    if not captures.supports_batch():
+        batch_frames = 1
+
+    pending = []  # sampled frames waiting to be processed
+
+    def __process_pending() -> list[VideoOutput]:
+        if len(pending) == 1:
+            outputs = [captures.update(pending[0][0], display, pending[0][1])]
+        else:
+            outputs = captures.update_many(
+                [frame for frame, _, _ in pending], [t for _, t, _ in pending], display
+            )
+
+        results = [(output, t, idx) for (_, t, idx), output in zip(pending, outputs)]
+        pending.clear()
+
+        return results
+
+    for sample in samples:
+        pending.append(sample)
+
+        if len(pending) >= batch_frames:
+            yield __process_pending()
+
+    if len(pending) > 0:
+        yield __process_pending()
@@ -0,0 +1,93 @@
+"""
+Tests of the settings loaded by the command line interface
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from cli import load_settings
+from src.capture import Captures
+from src.data_recorder import DataRecorder
+from src.video_processor import VideoProcessor
+import cv2
+import json
+import numpy as np
+import pytest
+
+
+def get_capture_config(is_enabled: bool) -> dict:
+    """
+    Returns the configuration of a capture on the top left corner of a frame
+    """
+    return {
+        "area": [0, 0, 15, 31],
+        "min_value": None,
+        "max_value": None,
+        "is_enabled": is_enabled,
+        "show_preview": False,
+        "ocr": {},
+    }
+
+
+@pytest.fixture
+def settings_path(tmp_path) -> str:
+    """
+    Writes settings with an enabled and a disabled capture, and returns their path
+    """
+    path = tmp_path / "settings.json"
+    config = {
+        "captures": {"enabled": get_capture_config(True), "disabled": get_capture_config(False)},
+        "fps": "2",
+        "ocr_method": "Template",
+        "max_threads": "1",
+    }
+    path.write_text(json.dumps(config))
+
+    return str(path)
+
+
+def test_disabled_capture_round_trip(settings_path):
+    captures, _ = load_settings(settings_path)
+    reloaded = Captures()
+
+    try:
+        assert captures["enabled"].is_enabled
+        assert not captures["disabled"].is_enabled
+
+        reloaded.load_config(captures.get_config())
+        assert reloaded.get_config() == captures.get_config()
+        assert not reloaded["disabled"].is_enabled
+    finally:
+        captures.shutdown()
+        reloaded.shutdown()
+
+
+@pytest.mark.parametrize("num_processes", [1, 2])
+def test_disabled_capture_not_processed(settings_path, tmp_path, num_processes):
+    video_path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), 10.0, (64, 48))
+
+    for _ in range(30):
+        writer.write(np.zeros((48, 64, 3), np.uint8))
+
+    writer.release()
+
+    captures, _ = load_settings(settings_path)
+    data_recorder = DataRecorder()
+    data_recorder.reset_fields(captures.get_names())
+    data_recorder.set_output(str(tmp_path), "video.csv")
+    video_processor = VideoProcessor(data_recorder)
+    video_processor.set_captures(captures)
+    video_processor.set_fps(2.0)
+    video_processor.set_num_processes(num_processes)
+    video_processor.set_checkpoint_period(None)
+    video_processor.set_video_path(video_path)
+    names = set()  # names of the captures with outputs
+
+    try:
+        video_processor.process_video(lambda output, _: names.update(output), display=False)
+    finally:
+        captures.shutdown()
+
+    assert names == {"enabled"}
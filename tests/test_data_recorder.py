@@ -0,0 +1,54 @@
+"""
+Tests of the incremental recording of the data in CSV files
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.data_recorder import DataRecorder
+import pytest
+
+
+def record(data_recorder: DataRecorder, flush_period: int | None) -> str:
+    """
+    Records fields sampled at different rates, flushing the recorder every
+    `flush_period` points (only at the end if None), and returns the CSV file
+    """
+    data_recorder.reset_fields(["a", "b"])
+    data_recorder.toggle_recording(True)
+
+    for k in range(100):
+        new_data = {"a": str(k)} if k % 3 != 0 else {"a": str(k), "b": None}
+        data_recorder.record(new_data, 0.1 * k, 0.01)
+
+        if flush_period is not None and k % flush_period == 0:
+            data_recorder.flush()
+            assert len(data_recorder._data["a"]) == 0
+            assert len(data_recorder._last_times) <= data_recorder._fps_avg_len
+
+    return data_recorder.toggle_recording(False)
+
+
+@pytest.mark.parametrize("flush_period", [1, 7, 50])
+def test_flushed_rows_are_dropped(tmp_path, flush_period):
+    data_recorder = DataRecorder()
+    data_recorder.set_output(str(tmp_path), "once.csv")
+    expected = open(record(data_recorder, None)).read()
+
+    data_recorder = DataRecorder()
+    data_recorder.set_output(str(tmp_path), "flushed.csv")
+    assert open(record(data_recorder, flush_period)).read() == expected
+    assert data_recorder.get_average_fps() == pytest.approx(10.0)
+    assert data_recorder.get_average_latency() == pytest.approx(0.01)
+
+
+def test_points_dropped_when_not_recording():
+    data_recorder = DataRecorder()
+    data_recorder.reset_fields(["a"])
+
+    for k in range(100):
+        data_recorder.record({"a": str(k)}, 0.1 * k)
+
+    assert len(data_recorder._last_times) <= data_recorder._fps_avg_len
+    assert data_recorder.get_average_fps() == pytest.approx(10.0)
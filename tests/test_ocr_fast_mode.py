@@ -0,0 +1,92 @@
+"""
+Compares the fast and default pre-processing modes of the OCR engines
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.ocr import BaseOcrEngine
+import cv2
+import numpy as np
+import pytest
+
+
+FONTS = [
+    cv2.FONT_HERSHEY_SIMPLEX,
+    cv2.FONT_HERSHEY_DUPLEX,
+    cv2.FONT_HERSHEY_PLAIN,
+    cv2.FONT_HERSHEY_COMPLEX,
+]
+
+
+def get_luminance(color: np.ndarray) -> float:
+    """
+    Returns the grey level of a BGR color
+    """
+    return 0.114 * color[0] + 0.587 * color[1] + 0.299 * color[2]
+
+
+def get_rois(count: int = 60, min_contrast: float = 96.0, noise: int = 3) -> list[np.ndarray]:
+    """
+    Returns readable capture areas: numbers of random colors and fonts on
+    random backgrounds, with some noise
+
+    Args:
+        - count:        Number of areas
+        - min_contrast: Minimal difference of grey level between text and background
+        - noise:        Amplitude of the uniform noise added to the background
+    """
+    rng = np.random.default_rng(1)
+    rois = []
+
+    while len(rois) < count:
+        bg = rng.integers(0, 256, 3)
+        fg = rng.integers(0, 256, 3)
+
+        if abs(get_luminance(bg) - get_luminance(fg)) < min_contrast:
+            continue
+
+        img = np.empty((40, 160, 3), np.int64)
+        img[:] = bg
+        img = np.clip(img + rng.integers(-noise, noise + 1, img.shape), 0, 255).astype(np.uint8)
+        font = FONTS[len(rois) % len(FONTS)]
+        scale = 1.8 if font == cv2.FONT_HERSHEY_PLAIN else 0.9
+        text = f"{rng.uniform(-999, 999):.2f}"
+        color = tuple(int(c) for c in fg)
+        cv2.putText(img, text, (5, 30), font, scale, color, 2, cv2.LINE_AA)
+        rois.append(img)
+
+    return rois
+
+
+def create_engine(upscale_ratio: float, kernel_size: int, amount: float, fast_mode: bool):
+    """
+    Returns an engine pre-processing images with the given config
+    """
+    config = BaseOcrEngine.PreProcessConfig()
+    config.upscale_ratio = upscale_ratio
+    config.unsharp_kernel_size = kernel_size
+    config.unsharp_amount = amount
+    config.fast_mode = fast_mode
+    engine = BaseOcrEngine()
+    engine.set_pre_process_config(config)
+
+    return engine
+
+
+@pytest.mark.parametrize("upscale_ratio", [1.0, 1.5, 2.0, 3.0])
+@pytest.mark.parametrize("kernel_size, amount", [(5, 1.0), (3, 1.0), (5, 2.0), (3, 0.5)])
+def test_fast_mode_difference(upscale_ratio, kernel_size, amount):
+    default_engine = create_engine(upscale_ratio, kernel_size, amount, False)
+    fast_engine = create_engine(upscale_ratio, kernel_size, amount, True)
+    differences = []
+
+    for roi in get_rois():
+        expected = default_engine.preprocess(roi)
+        output = fast_engine.preprocess(roi)
+        assert output.shape == expected.shape
+        differences.append(np.mean(output != expected))
+
+    assert np.mean(differences) < 0.001
+    assert np.max(differences) < 0.005
@@ -0,0 +1,59 @@
+"""
+Tests of the pool of OCR processes
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.ocr_processes import OcrProcessPool
+import itertools
+import numpy as np
+import queue
+
+
+class FakeTaskQueue:
+    """
+    Task queue of a fake worker, recording the captures it is given and
+    answering right away
+    """
+
+    def __init__(self, results: queue.Queue):
+        self.names = set()  # names of the captures given to the worker
+        self._results = results
+
+    def put(self, task):
+        _, specs, _ = task
+        self.names.update(spec[0] for spec in specs)
+        self._results.put([(spec[0], None, None, None, None) for spec in specs])
+
+
+def test_worker_assignment_is_stable_across_subsets(monkeypatch):
+    pool = OcrProcessPool(num_workers=3)
+    pool._results = queue.Queue()
+    task_queues = [FakeTaskQueue(pool._results) for _ in range(3)]
+    pool._workers = [[None, task_queue] for task_queue in task_queues]
+    monkeypatch.setattr(pool, "_share_glyphs", lambda: None)
+
+    frame = np.zeros((10, 10, 3), np.uint8)
+    names = [f"capture_{k}" for k in range(6)]
+    specs = {name: (name, (0, 0, 4, 4), 0, None, None, {}, False) for name in names}
+    workers = {}  # index of the worker each capture was given to
+
+    try:
+        for count in range(1, len(names) + 1):
+            for subset in itertools.combinations(names, count):
+                for task_queue in task_queues:
+                    task_queue.names.clear()
+
+                results = pool.process(frame, [specs[name] for name in subset])
+                assert sorted(result[0] for result in results) == list(subset)
+
+                for k, task_queue in enumerate(task_queues):
+                    for name in task_queue.names:
+                        assert workers.setdefault(name, k) == k
+    finally:
+        pool._workers = []
+        pool.shutdown()
+
+    assert len(set(workers.values())) > 1  # captures are spread over the workers
@@ -0,0 +1,108 @@
+"""
+Tests of the scheduling of the captures
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.capture import Captures
+from src.data_recorder import DataRecorder
+from src.ocr import OcrMethod
+from src.scheduler import CaptureScheduler
+from src.video_processor import VideoProcessor
+from time import time
+import cv2
+import numpy as np
+import pytest
+
+
+CAPTURES = [("a", 2.0, 0), ("b", 0.5, 0)]  # [name, sampling rate, priority]
+
+
+def test_time_going_back_resets_deadlines():
+    scheduler = CaptureScheduler()
+    t0 = time()
+
+    for k in range(10):
+        scheduler.get_due(CAPTURES, t0 + 0.1 * k)
+
+    # Deadlines start again from the new time, with the same phases
+    assert scheduler.get_due(CAPTURES, 0.0) == ["a"]
+    assert scheduler.get_due(CAPTURES, 1.0) == ["a", "b"]
+
+
+def test_reset_makes_captures_due():
+    scheduler = CaptureScheduler()
+    scheduler.get_due(CAPTURES, 0.0)
+    assert scheduler.get_due(CAPTURES, 0.1) == []
+
+    scheduler.reset()
+    assert scheduler.get_due(CAPTURES, 0.1) == ["a"]
+
+
+def get_config(sample_rate: float) -> dict:
+    """
+    Returns the configuration of a capture on the top left corner of a frame
+    """
+    return {
+        "area": [0, 0, 15, 31],
+        "min_value": None,
+        "max_value": None,
+        "show_preview": False,
+        "sample_rate": sample_rate,
+        "ocr": {},
+    }
+
+
+@pytest.fixture
+def video_path(tmp_path) -> str:
+    """
+    Writes a 10 s video at 10 FPS, and returns its path
+    """
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10.0, (64, 48))
+
+    for k in range(100):
+        frame = np.zeros((48, 64, 3), np.uint8)
+        cv2.putText(frame, str(k), (2, 14), cv2.FONT_HERSHEY_PLAIN, 1.0, (255, 255, 255))
+        writer.write(frame)
+
+    writer.release()
+
+    return path
+
+
+def test_live_then_video(video_path, tmp_path):
+    captures = Captures()
+    captures.set_ocr_method(OcrMethod.TEMPLATE)
+    captures.load_config({name: get_config(rate) for name, rate, _ in CAPTURES})
+
+    # Live processing, stamped with the clock
+    frame = np.zeros((48, 64, 3), np.uint8)
+    t0 = time()
+
+    for k in range(5):
+        captures.update(frame, display=False, t=t0 + 0.1 * k)
+
+    # Then a video, stamped with its timestamps
+    data_recorder = DataRecorder()
+    data_recorder.reset_fields(captures.get_names())
+    data_recorder.set_output(str(tmp_path), "video.csv")
+    video_processor = VideoProcessor(data_recorder)
+    video_processor.set_captures(captures)
+    video_processor.set_fps(2.0)
+    video_processor.set_checkpoint_period(None)
+    video_processor.set_video_path(video_path)
+    counts = {name: 0 for name, _, _ in CAPTURES}
+
+    def __frame_cb(output: dict, _):
+        for name in output:
+            counts[name] += 1
+
+    try:
+        assert video_processor.process_video(__frame_cb, display=False) != ""
+    finally:
+        captures.shutdown()
+
+    assert counts == {"a": 20, "b": 5}
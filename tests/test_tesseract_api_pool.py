@@ -0,0 +1,119 @@
+"""
+Tests of the pool of Tesseract API handles
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.ocr import TesseractApiPool
+import pytest
+import threading
+
+
+class FakeApi:
+    """
+    Stands for a Tesseract API handle
+    """
+
+    def __init__(self):
+        self.is_ended = False
+
+    def End(self):
+        self.is_ended = True
+
+
+@pytest.fixture
+def created_apis(monkeypatch) -> list[FakeApi]:
+    """
+    Replaces the Tesseract API handles by fake ones, and returns the handles
+    created
+    """
+    created = []
+
+    def __create_api():
+        created.append(FakeApi())
+        return created[-1]
+
+    monkeypatch.setattr(TesseractApiPool, "_create_api", staticmethod(__create_api))
+
+    return created
+
+
+def run_threads(count: int, target):
+    """
+    Runs a function in several threads (given their index), and waits for them
+    """
+    threads = [threading.Thread(target=target, args=(k,)) for k in range(count)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+
+def test_pinned_threads_stay_in_budget(created_apis):
+    pool = TesseractApiPool(max_size=2)
+    lock = threading.Lock()
+    in_use = set()  # handles checked out at the moment
+    max_in_use = [0]
+    call_count = [0]
+
+    def __worker(_):
+        pool.pin_current_thread()
+
+        for _ in range(50):
+            with pool.acquire() as api:
+                with lock:
+                    in_use.add(id(api))
+                    max_in_use[0] = max(max_in_use[0], len(in_use))
+                    call_count[0] += 1
+
+                with lock:
+                    in_use.discard(id(api))
+
+        pool.unpin_current_thread()
+
+    run_threads(4, __worker)
+
+    assert call_count[0] == 200
+    assert max_in_use[0] <= 2
+    assert len(created_apis) <= 2
+    assert not any(api.is_ended for api in created_apis)
+
+
+def test_pinned_threads_keep_their_handle(created_apis):
+    pool = TesseractApiPool(max_size=2)
+    barrier = threading.Barrier(2)
+    used = [set(), set()]  # handles used by each thread
+
+    def __worker(idx: int):
+        pool.pin_current_thread()
+
+        with pool.acquire() as api:
+            used[idx].add(id(api))
+            barrier.wait()  # both handles are checked out at once
+
+        for _ in range(50):
+            with pool.acquire() as api:
+                used[idx].add(id(api))
+
+        pool.unpin_current_thread()
+
+    run_threads(2, __worker)
+
+    assert len(used[0]) == 1 and len(used[1]) == 1
+    assert used[0] != used[1]
+    assert len(created_apis) == 2
+
+
+def test_shrinking_frees_handles(created_apis):
+    pool = TesseractApiPool(max_size=2)
+    pool.pin_current_thread()
+
+    with pool.acquire(), pool.acquire():
+        pool.set_max_size(1)
+
+    assert sum(api.is_ended for api in created_apis) == 1
+    pool.unpin_current_thread()
@@ -0,0 +1,127 @@
+"""
+Tests of the processing of video segments in worker processes
+
+Author:  CorentinChauvin
+Year:    2024
+License: Apache 2.0
+"""
+
+from src.capture import Captures
+from src.data_recorder import DataRecorder
+from src.duplicate_frames import DuplicateFrames
+from src.ocr import OcrMethod
+from src.video_processes import _worker_main, split_video
+from src.video_processor import VideoProcessor
+from src.video_sampler import VideoSampling
+import cv2
+import numpy as np
+import pytest
+import queue
+
+
+SAMPLE_RATES = {"every_sample": None, "slow": 0.7, "fast": 5.0, "same": 3.0}
+FPS = 3.0
+
+
+@pytest.fixture
+def video_path(tmp_path) -> str:
+    """
+    Writes a 10 s video at 10 FPS, and returns its path
+    """
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10.0, (64, 48))
+
+    for k in range(100):
+        frame = np.zeros((48, 64, 3), np.uint8)
+        cv2.putText(frame, str(k), (2, 14), cv2.FONT_HERSHEY_PLAIN, 1.0, (255, 255, 255))
+        writer.write(frame)
+
+    writer.release()
+
+    return path
+
+
+@pytest.fixture
+def captures():
+    captures = Captures()
+    captures.set_ocr_method(OcrMethod.TEMPLATE)
+    captures.load_config(
+        {
+            name: {
+                "area": [0, 0, 15, 31],
+                "min_value": None,
+                "max_value": None,
+                "show_preview": False,
+                "sample_rate": sample_rate,
+                "ocr": {},
+            }
+            for name, sample_rate in SAMPLE_RATES.items()
+        }
+    )
+
+    yield captures
+
+    captures.shutdown()
+
+
+def get_sequential_outputs(captures: Captures, video_path: str, tmp_path) -> list:
+    """
+    Processes the whole video in this process, and returns the timestamps of
+    the outputs along with the captures they hold
+    """
+    data_recorder = DataRecorder()
+    data_recorder.reset_fields(captures.get_names())
+    data_recorder.set_output(str(tmp_path), "video.csv")
+    video_processor = VideoProcessor(data_recorder)
+    video_processor.set_captures(captures)
+    video_processor.set_fps(FPS)
+    video_processor.set_checkpoint_period(None)
+    video_processor.set_video_path(video_path)
+    outputs = []
+    video_processor.process_video(
+        lambda output, _: outputs.append(sorted(output)), display=False
+    )
+
+    return outputs
+
+
+@pytest.mark.parametrize("order", [[0, 1, 2, 3], [2, 0, 3, 1], [3, 2, 1, 0]])
+def test_segments_out_of_order(captures, video_path, tmp_path, order):
+    expected = get_sequential_outputs(captures, video_path, tmp_path)
+    period = 1.0 / captures.get_max_sample_rate(FPS)
+    segments = split_video(10.0, period, 4)
+    segments[-1] = (segments[-1][0], None)
+
+    # A single worker processes all the segments
+    task_queue = queue.Queue()
+    result_queue = queue.Queue()
+
+    for k in order:
+        task_queue.put((k, segments[k]))
+
+    task_queue.put(None)
+    setup = (
+        video_path,
+        None,
+        captures.get_config(),
+        OcrMethod.TEMPLATE,
+        period,
+        VideoSampling.SEEK,
+        1,
+        DuplicateFrames.PROCESS,
+        (None, None),
+        0.0,
+    )
+    _worker_main(task_queue, result_queue, setup)
+
+    segment_outputs = [[] for _ in segments]
+
+    while not result_queue.empty():
+        kind, k, payload = result_queue.get()
+        assert kind != "error", payload
+
+        if kind == "outputs":
+            segment_outputs[k] += [sorted(output) for output, _, _ in payload]
+
+    outputs = [output for outputs in segment_outputs for output in outputs]
+    assert outputs == expected